@@ -22,5 +22,7 @@
 # For additional information visit http://murphylab.web.cmu.edu or
 # send email to murphy@cmu.edu
 
-from computefeatures import computefeatures, featurenames
+from computefeatures import computefeatures, icomputefeatures, featurenames
+from featurecache import FeatureCache
+from featurewriter import FeatureWriter, read_features
 import featinfo
@@ -28,11 +28,12 @@ import numpy
 from scipy import ndimage
 from string import upper
 import re
-from ..image import Image
-from ..preprocess import preprocessimage, precomputestats
+from collections import defaultdict
+from ..image import Image, prefetch as prefetch_images
+from ..preprocess import preprocessimage, precomputestats, preprocess_channels
 
 from edgefeatures import edgefeatures
-from texture import haralickfeatures
+from texture import haralickfeatures, block_sum_pyramid, haralick_crops
 from imgskelfeats import imgskelfeatures
 from noffeatures import noffeatures
 from imgfeatures import imgfeatures, imgfeaturesdna
@@ -42,8 +43,9 @@ from tas import tas, pftas
 from .overlap import overlapfeatures
 from mahotas.lbp import lbp
 from .surf import surf_ref
+from .featureplan import FeaturePlan, Intermediates
 
-__all__ = ['computefeatures','featurenames']
+__all__ = ['computefeatures','icomputefeatures','featurenames']
 
 def _featsfor(featset):
     ufeatset=upper(featset)
@@ -106,30 +108,76 @@ def computefeatures(img, featsets, progress=None, preprocessing=None, **kwargs):
                 If False and img.channeldata[procprotein|procdna] are empty, they are filled in
                 using img.channeldata[protein|dna] respectively.
         * *options*: currently passed through to pyslic.preprocessimage
+        * *n_jobs*: if img is a list, the number of processes to use
+                (default: 1, i.e., no parallelism). Use -1 for one process per CPU.
+        * *executor*: if img is a list, an object with an ``imap`` method
+                (e.g., a multiprocessing.Pool) to use instead of creating a pool.
+        * *prefetch*: if img is a list, the number of images to load in the
+                background while features are computed (default: 0)
+        * *cache*: a FeatureCache. Feature groups found in the cache are not
+                recomputed and newly computed ones are stored in it.
+        * *threads*: if img has several regions, the number of threads
+                to process them with (default: 1)
+        * *haralick.regions*: if img has several regions and this is True,
+                the Haralick features (har, har1,...) of all the regions are
+                computed together in one pass (see texture.haralick_crops)
+                instead of once per region. The results are the same up to
+                rounding (default: False)
+        * *output*: if img is a list, a FeatureWriter. Feature vectors are
+                written to it as they are computed (instead of being kept in
+                memory) and output is returned. Images whose id is already
+                in output are skipped, so that an interrupted computation
+                can be resumed by calling computefeatures again (all
+                images must have an id). If output has no feature names,
+                they are set to featurenames(featsets) (if all of the groups
+                have names).
+
+    @see icomputefeatures
     '''
     if type(featsets) == str:
         featsets = _featsfor(featsets)
     if type(img) == list:
-        features=[]
-        for i,im in enumerate(img):
-            f = computefeatures(im,featsets,progress=None,**kwargs)
-            features.append(f)
-            im.unload()
+        output = kwargs.pop('output', None)
+        if output is not None:
+            if [im for im in img if im.id is None]:
+                raise ValueError('pyslic.features.computefeatures: images written to output must have an id (otherwise, they cannot be resumed)')
+            if output.featurenames is None:
+                try:
+                    output.featurenames = featurenames(featsets)
+                except ValueError:
+                    # Some of the groups (e.g., pftas) have no names
+                    pass
+            imgs = [im for im in img if not output.done(im.id)]
+        else:
+            imgs = img
+            features=[]
+        for i,f in enumerate(icomputefeatures(imgs, featsets, preprocessing=preprocessing, **kwargs)):
+            if output is not None:
+                output.append(f, imgs[i].id, imgs[i].label)
+            else:
+                features.append(f)
             if progress is not None and (i % progress) == 0:
                 print 'Processed %s images...' % i
+        if output is not None:
+            output.flush()
+            return output
         return numpy.array(features)
     regions = img.regions
     if regions is not None and regions.max() > 1 and 'region' not in kwargs:
-        precomputestats(img)
-        return numpy.array([
-                    computefeatures(img, featsets, progress=progress, region=r, **kwargs)
-                    for r in xrange(1,regions.max()+1)])
+        return _computefeatures_regions(img, featsets, **kwargs)
     scale = img.scale
     if scale is None:
         scale = _Default_Scale
-    is_surf = ( len(featsets) == 1 and featsets[0] in ('surf', 'surf-ref','surfp'))
+    is_surf = _is_surf(featsets)
     if preprocessing is None:
         preprocessing = not is_surf
+    cache = kwargs.get('cache')
+    cachekey = None
+    cached = {}
+    if cache is not None and not is_surf and (preprocessing or 'procprotein' not in img.channeldata):
+        cachekey,cached = _cache_lookup(cache, img, featsets, preprocessing, kwargs)
+        if len(cached) == len(set(featsets)):
+            return _concatenate_cached(featsets, cached)
     if preprocessing:
         preprocessimage(img, kwargs.get('region'), options=kwargs.get('options',{}))
     else:
@@ -138,12 +186,68 @@ def computefeatures(img, featsets, progress=None, preprocessing=None, **kwargs):
             img.channeldata['resprotein'] = 0*img.get('protein')
         if ('dna' in img.channeldata) and ('procdna' not in img.channeldata):
             img.channeldata['procdna'] = img.get('dna')
+    channels = {
+        'protein' : img.get('protein'),
+        'procprotein' : img.get('procprotein'),
+        'resprotein' : img.get('resprotein'),
+        'dna' : img.channeldata.get('dna'),
+        'procdna' : img.channeldata.get('procdna'),
+    }
+    return _computefeatures_channels(featsets, channels, scale, kwargs, cached, cache, cachekey)
+
+_lbppat = re.compile(r'lbp\(([0-9]+), ?([0-9]+)\)')
+# Feature groups which featurenames knows of, but which have no names
+_unnamedpat = re.compile(r'(har[0-9]+|raw-har|obj-field|obj-field-dna|overlap|surf|surf-ref|surfp)$')
+
+def _is_surf(featsets):
+    return ( len(featsets) == 1 and featsets[0] in ('surf', 'surf-ref','surfp'))
+
+def _cache_lookup(cache, img, featsets, preprocessing, kwargs):
+    '''
+    cachekey,cached = _cache_lookup(cache, img, featsets, preprocessing, kwargs)
+
+    cached is a dictionary with the feature groups found in the cache
+    '''
+    params = kwargs.copy()
+    del params['cache']
+    params.pop('threads', None)
+    params.pop('haralick.regions', None)
+    params['preprocessing'] = preprocessing
+    cachekey = cache.imagekey(img, params)
+    cached = {}
+    if cachekey is not None:
+        for F in featsets:
+            values = cache.get(cachekey, F)
+            if values is not None:
+                cached[F] = values
+    return cachekey, cached
+
+def _concatenate_cached(featsets, cached):
     features = numpy.array([])
-    protein = img.get('protein')
-    procprotein = img.get('procprotein')
-    resprotein = img.get('resprotein')
-    dna = img.channeldata.get('dna')
-    procdna = img.channeldata.get('procdna')
+    for F in featsets:
+        features = numpy.r_[features,cached[F]]
+    return features
+
+def _computefeatures_channels(featsets, channels, scale, kwargs, cached={}, cache=None, cachekey=None, deferred=None):
+    '''
+    features = _computefeatures_channels(featsets, channels, scale, kwargs, cached={}, cache=None, cachekey=None, deferred=None)
+
+    Computes the features on already preprocessed data. channels is a
+    dictionary with 'protein', 'procprotein', 'resprotein', 'dna' and
+    'procdna' (the last two may be None).
+
+    If deferred is a dictionary, the Haralick features are not computed:
+    deferred[F] is set to (offset, img), where img is the image to compute
+    haralickfeatures(img).mean(0) on and offset is where they go in features
+    (which has zeros there). They are not stored in the cache either.
+    '''
+    is_surf = _is_surf(featsets)
+    features = numpy.array([])
+    protein = channels['protein']
+    procprotein = channels['procprotein']
+    resprotein = channels['resprotein']
+    dna = channels['dna']
+    procdna = channels['procdna']
     if procprotein.size < _Min_image_size:
         if is_surf:
             return np.array([])
@@ -152,10 +256,13 @@ def computefeatures(img, featsets, progress=None, preprocessing=None, **kwargs):
         if featsets == _featsfor('field-dna+'):
             return np.array([np.nan for i in xrange(173)])
         raise ValueError
-    lbppat = re.compile(r'lbp\(([0-9]+), ?([0-9]+)\)')
-    for F in featsets:
-        if F in ['edg','edge']:
-            feats = edgefeatures(procprotein)
+    plan = FeaturePlan(featsets)
+    shared = Intermediates(procprotein)
+    for i,F in enumerate(featsets):
+        if F in cached:
+            feats = cached[F]
+        elif F in ['edg','edge']:
+            feats = edgefeatures(procprotein, shared.get('sobel'))
         elif F == 'raw-har':
             feats = haralickfeatures(procprotein).mean(0)
         elif F[:3] == 'har':
@@ -167,10 +274,10 @@ def computefeatures(img, featsets, progress=None, preprocessing=None, **kwargs):
             if len(F) > 3:
                 rate = int(F[3])
                 if rate != 1:
-                    C = np.ones((rate,rate))
-                    img = np.array(img,np.uint16)
-                    img = ndimage.convolve(img,C)
-                    img = img[::rate,::rate]
+                    levels = shared.get('har-pyramid')
+                    if rate not in levels:
+                        levels[rate] = block_sum_pyramid(procprotein, (rate,))[rate]
+                    img = levels[rate]
             if not img.size:
                 feats = np.zeros(13)
             else:
@@ -181,24 +288,28 @@ def computefeatures(img, featsets, progress=None, preprocessing=None, **kwargs):
                     ptp = max - min
                     if ptp:
                         img = np.array((img-min).astype(float) * bins/ptp, np.uint8)
-                feats = haralickfeatures(img)
-                feats = feats.mean(0)
+                if deferred is not None:
+                    deferred[F] = (len(features), img)
+                    feats = np.zeros(13)
+                else:
+                    feats = haralickfeatures(img)
+                    feats = feats.mean(0)
         elif F in ['hul', 'hull']:
-            feats = hullfeatures(procprotein)
+            feats = hullfeatures(procprotein, shared.get('hull'))
         elif F == 'hullsize':
-            feats = hullsizefeatures(procprotein)
+            feats = hullsizefeatures(procprotein, shared.get('hull'))
         elif F == 'hullsizedna':
             feats = hullsizefeatures(procdna)
         elif F == 'img':
-            feats = imgfeaturesdna(procprotein, procdna)
+            feats = imgfeaturesdna(procprotein, procdna, labeled=shared.get('labeled'))
         elif F in ('obj-field', 'obj-field-dna'):
-            feats = imgfeaturesdna(procprotein, procdna, isfield=True)
+            feats = imgfeaturesdna(procprotein, procdna, isfield=True, labeled=shared.get('labeled'))
         elif F == 'mor':
             feats = morphologicalfeatures(procprotein)
         elif F == 'nof':
             feats = noffeatures(procprotein,resprotein)
         elif F in ['skl', 'skel']:
-            feats = imgskelfeatures(procprotein)
+            feats = imgskelfeatures(procprotein, shared.get('labeled'), shared.get('objects'), shared.get('skeleton'))
         elif F == 'zer':
             feats = zernike(procprotein,12,34.5,scale)
         elif F == 'tas':
@@ -207,8 +318,8 @@ def computefeatures(img, featsets, progress=None, preprocessing=None, **kwargs):
             feats = pftas(procprotein)
         elif F == 'overlap':
             feats = overlapfeatures(protein, dna, procprotein, procdna)
-        elif lbppat.match(F):
-            radius,points = lbppat.match(F).groups()
+        elif _lbppat.match(F):
+            radius,points = _lbppat.match(F).groups()
             feats = lbp(protein, int(radius), int(points))
         elif F in ('surf', 'surf-ref','surfp'):
             if F == 'surfp':
@@ -221,17 +332,152 @@ def computefeatures(img, featsets, progress=None, preprocessing=None, **kwargs):
             return surf_ref(protein, dna)
         else:
             raise Exception('Unknown feature set: %s' % F)
+        if cachekey is not None and F not in cached and (deferred is None or F not in deferred):
+            cache.put(cachekey, F, numpy.atleast_1d(feats))
         features = numpy.r_[features,feats]
+        shared.release(plan.done(i))
     return features
 
+def _computefeatures_regions(img, featsets, threads=None, **kwargs):
+    '''
+    features = _computefeatures_regions(img, featsets, threads=None, **kwargs)
+
+    Computes the features of each region of img, so that features[r-1] are
+    the features of region r.
+
+    The whole image is background subtracted once and each region is then
+    preprocessed on its bounding box. If threads > 1, regions are processed
+    in parallel. If kwargs['haralick.regions'], the Haralick features of all
+    regions are computed at the end, with a single call to haralick_crops.
+    '''
+    precomputestats(img)
+    nregions = img.regions.max()
+    if _is_surf(featsets):
+        return numpy.array([
+                    computefeatures(img, featsets, region=r, **kwargs)
+                    for r in xrange(1,nregions+1)])
+    scale = img.scale
+    if scale is None:
+        scale = _Default_Scale
+    cache = kwargs.get('cache')
+    options = kwargs.get('options',{})
+    protein = img.get('protein')
+    dna = img.channeldata.get('dna')
+    batch_haralick = kwargs.get('haralick.regions', False)
+    def region_features(r):
+        rkwargs = kwargs.copy()
+        rkwargs['region'] = r
+        cachekey = None
+        cached = {}
+        deferred = ({} if batch_haralick else None)
+        if cache is not None:
+            cachekey,cached = _cache_lookup(cache, img, featsets, True, rkwargs)
+            if len(cached) == len(set(featsets)):
+                return _concatenate_cached(featsets, cached), cachekey, {}
+        channels = preprocess_channels(img, r, options=options)
+        channels['protein'] = protein
+        channels['dna'] = dna
+        channels.setdefault('procdna', None)
+        features = _computefeatures_channels(featsets, channels, scale, rkwargs, cached, cache, cachekey, deferred)
+        return features, cachekey, deferred
+
+    pool = None
+    if threads is not None and threads > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(threads)
+        results = pool.imap(region_features, xrange(1,nregions+1))
+    else:
+        results = (region_features(r) for r in xrange(1,nregions+1))
+    haralick = defaultdict(list)
+    try:
+        features = None
+        for i,(f,cachekey,deferred) in enumerate(results):
+            if features is None:
+                features = numpy.empty((nregions,len(f)))
+            features[i] = f
+            if deferred:
+                for F,(offset,har) in deferred.iteritems():
+                    haralick[F].append((i,offset,har,cachekey))
+    finally:
+        if pool is not None:
+            pool.terminate()
+    for F,regions in haralick.iteritems():
+        feats = haralick_crops([har for _,_,har,_ in regions], return_mean=True)
+        for (i,offset,_,cachekey),f in zip(regions, feats):
+            features[i,offset:offset+len(f)] = f
+            if cachekey is not None:
+                cache.put(cachekey, F, f)
+    return features
+
+def _computefeatures_unload(args):
+    img, featsets, kwargs = args
+    features = computefeatures(img, featsets, **kwargs)
+    img.unload()
+    return features
+
+def icomputefeatures(imgs, featsets, n_jobs=None, executor=None, prefetch=0, **kwargs):
+    '''
+    for features in icomputefeatures(imgs, featsets, n_jobs=None, executor=None, prefetch=0, **kwargs):
+        ...
+
+    Generator version of computefeatures for a list of images.
+
+    Feature vectors are yielded one at a time, in the same order as imgs, as
+    soon as they are available. Each image is unloaded after its features
+    are computed.
+
+    Parameters
+    ----------
+        * *n_jobs*: number of processes to spread the images over
+                (default: 1, i.e., compute in this process).
+                Use -1 for one process per CPU.
+        * *executor*: an object with an ``imap`` method (e.g., a
+                multiprocessing.Pool). If given, n_jobs is ignored.
+        * *prefetch*: when computing in this process, the number of images
+                to load in the background (see pyslic.image.prefetch)
+        * other arguments are passed to computefeatures
+
+    When running in separate processes, images are pickled and, therefore,
+    loaded again by the worker process (see Image). Images whose data is not
+    backed by files must be processed with n_jobs=1.
+
+    @see computefeatures
+    '''
+    if type(featsets) == str:
+        featsets = _featsfor(featsets)
+    tasks = ((img, featsets, kwargs) for img in imgs)
+    if executor is not None:
+        for features in executor.imap(_computefeatures_unload, tasks):
+            yield features
+        return
+    if n_jobs is None or n_jobs == 1:
+        if prefetch:
+            imgs = prefetch_images(imgs, prefetch)
+        for img in imgs:
+            yield _computefeatures_unload((img, featsets, kwargs))
+        return
+    import multiprocessing
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(n_jobs)
+    try:
+        for features in pool.imap(_computefeatures_unload, tasks):
+            yield features
+    finally:
+        pool.terminate()
+
 def featurenames(featsets):
     '''
     names = featurenames(featsets)
 
     Returns a list of feature names. The argument has the same
     meaning as the argument to computefeatures.
+
+    Raises ValueError if some of the groups have no names (e.g., 'pftas' or
+    the scaled Haralick features, 'har1',...).
     '''
-    featsets = _featsfor(featsets)
+    if type(featsets) == str:
+        featsets = _featsfor(featsets)
     names=[]
     for F in featsets:
         if F == 'edg':
@@ -258,10 +504,14 @@ def featurenames(featsets):
             names.extend(imgskelfeatures.names)
         elif F == 'zer':
             names.extend(znames(12,34.5))
-        elif F == 'tas':
-            names.extend(tas.names)
-        elif F == 'pftas':
-            names.extend(pftas.names)
+        elif F in ('tas', 'pftas'):
+            # (mahotas' tas functions do not have names)
+            function = (tas if F == 'tas' else pftas)
+            if not hasattr(function, 'names'):
+                raise ValueError('pyslic.features.featurenames: feature set %s has no names' % F)
+            names.extend(function.names)
+        elif _unnamedpat.match(F) or _lbppat.match(F):
+            raise ValueError('pyslic.features.featurenames: feature set %s has no names' % F)
         else:
             raise Exception('Unknown feature set: %s' % F)
     return names
@@ -26,9 +26,29 @@ from scipy import ndimage
 from mahotas.edge import sobel
 import math
 
-def edgefeatures(protproc):
+def _histogram_edges(values, bins):
+    # The bin edges which np.histogram(values, bins) uses
+    mn = values.min()
+    mx = values.max()
+    if mn == mx:
+        mn -= .5
+        mx += .5
+    return np.linspace(mn, mx, bins+1)
+
+def _histogram(values, bins):
+    # Same counts as np.histogram(values, bins)[0], with a single bincount
+    edges = _histogram_edges(values, bins)
+    mn = edges[0]
+    indices = ((values - mn) * (bins/(edges[-1] - mn))).astype(np.intp)
+    indices[indices == bins] -= 1
+    # Correct the rounding of the division at the edges
+    indices[values < edges[indices]] -= 1
+    indices[(values >= edges[indices+1]) & (indices != bins-1)] += 1
+    return np.bincount(indices, minlength=bins)
+
+def edgefeatures(protproc, edges=None):
     """
-    values = edgefeatures(protproc)
+    values = edgefeatures(protproc, edges=None)
        where protproc contains the pre-processed fluorescence image.
        Pre-processed means that the image has been cropped and had
       Features calculated include:
@@ -56,33 +76,32 @@ def edgefeatures(protproc):
 
     M.Velliste June 2, 2002: added SLF names
     Ported to Python by Luis Pedro Coelho
+
+    edges, if given, should be mahotas.edge.sobel(protproc) (so that it can
+    be shared with other features).
     """
 
     binimg = (protproc > 0)
-    edges = sobel(protproc)
+    if edges is None:
+        edges = sobel(protproc)
     A = edges.sum()/binimg.sum()
     #A = bwarea(edge(imageproc,'canny',[]))/bwarea(im2bw(imageproc)) ;
 
-    # Directional edge filters
-    N = np.array([
-            [ 1, 1, 1],
-            [ 0, 0, 0],
-            [-1,-1,-1]],
-            np.float_)
-    W = np.array([
-            [ 1, 0,-1],
-            [ 1, 0,-1],
-            [ 1, 0,-1]],
-            np.float_)
-
-    # Calculation of the gradient from two orthogonal directions
-    protproc = asarray(protproc.copy(), np.float_)
-    iprocN = ndimage.convolve(protproc,N)
-    iprocW = ndimage.convolve(protproc,W)
-
-    # Calculate the magnitude and direction of the gradient
-    iprocmag = np.sqrt(iprocN**2. + iprocW**2.)
-    iproctheta = np.arctan2(iprocN, iprocW)
+    # Calculation of the gradient from two orthogonal directions:
+    # convolution with the directional edge filters
+    #    N = [[ 1, 1, 1],    W = [[ 1, 0,-1],
+    #         [ 0, 0, 0],         [ 1, 0,-1],
+    #         [-1,-1,-1]]         [ 1, 0,-1]]
+    # done as two 1-D passes each. On integer images the sums are exact in
+    # float32, which halves the memory used.
+    protproc = np.asanyarray(protproc)
+    if protproc.dtype.kind in 'biu' and protproc.dtype.itemsize <= 2:
+        protproc = protproc.astype(np.float32)
+    else:
+        protproc = protproc.astype(np.float_)
+    iprocN = ndimage.correlate1d(ndimage.correlate1d(protproc, [1,1,1], axis=1), [-1,0,1], axis=0)
+    iprocW = ndimage.correlate1d(ndimage.correlate1d(protproc, [1,1,1], axis=0), [-1,0,1], axis=1)
+    del protproc
 
     # Change by MV:
     # Identify pixels in iprocmag that are not 0
@@ -90,16 +109,25 @@ def edgefeatures(protproc):
     # this was incorrectly based on identifying non-zero
     # pixels in iproctheta, which does remove zero-magnitude
     # edges, but it also removes edges that face exactly east.
-    v = iproctheta.ravel()
-    v_mag = iprocmag.ravel()
-    v = v[v_mag > 0]
-    v_mag = v_mag[v_mag > 0]
+    nonzero = (iprocN != 0)
+    nonzero |= (iprocW != 0)
+    iprocN = iprocN[nonzero].astype(np.float_)
+    iprocW = iprocW[nonzero].astype(np.float_)
+    del nonzero
+
+    # Calculate the magnitude and direction of the gradient
+    v = np.arctan2(iprocN, iprocW)
+    iprocN **= 2
+    iprocW **= 2
+    iprocN += iprocW
+    v_mag = np.sqrt(iprocN, iprocN)
+    del iprocW
 
     if v.size == 0:
         return zeros(5)
 
     # Histogram the gradient directions
-    h,_ = histogram(v,8)
+    h = _histogram(v,8)
 
     # max/min ratio
     maxidx=argmax(h)
@@ -130,8 +158,8 @@ def edgefeatures(protproc):
     #  the first two bins of the histogram.
     # Change by MV: Made it be based on edge magnitude histogram. Was
     # incorrectly based on edge direction histogram before.
-    h_mag,_ = histogram(v_mag,4)
-    homogeneity = h_mag[0]/h_mag.sum()
+    # Only the first bin of the histogram (with 4 bins) is needed
+    homogeneity = np.count_nonzero(v_mag < _histogram_edges(v_mag,4)[1])/v_mag.size
 
     return array([A,homogeneity,maxminratio,maxnextmaxratio,sumdiff])
 
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2012  Murphy Lab
+# Carnegie Mellon University
+#
+# Written by Luis Pedro Coelho <lpc@cmu.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License,
+# or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# For additional information visit http://murphylab.web.cmu.edu or
+# send email to murphy@cmu.edu
+
+from __future__ import division
+import os
+import re
+import hashlib
+import numpy as np
+from ..pyslic_version import __version__
+
+__all__ = ['FeatureCache']
+
+def _funcname(f):
+    return '%s.%s' % (getattr(f, '__module__', None), getattr(f, '__name__', repr(f)))
+
+def _canonical(v):
+    if isinstance(v, dict):
+        return '{%s}' % ', '.join('%r: %s' % (k, _canonical(v[k])) for k in sorted(v.keys()))
+    if isinstance(v, (list, tuple)):
+        return '[%s]' % ', '.join(_canonical(e) for e in v)
+    return repr(v)
+
+class FeatureCache(object):
+    '''
+    cache = FeatureCache(directory, max_bytes=2**30, hash_content=False)
+
+    Persistent cache of feature vectors, stored in `directory`.
+
+    Each feature group (e.g., 'har', 'skl',...) is stored separately, so that
+    computing a feature set which overlaps with one computed earlier only
+    computes the missing groups. Use it by passing it to computefeatures:
+
+        features = computefeatures(imgs, 'SLF33', cache=cache)
+
+    Entries are keyed by:
+        * the channel files (path, modification time & size, or their
+          content if hash_content is True),
+        * the image's load_function, post_load actions and scale,
+        * img.regions, if they were set in memory (and not loaded from a
+          file),
+        * the preprocessing flag and the other arguments to computefeatures
+          (options, region, haralick.scale,...),
+        * the pyslic version.
+
+    Changes to img.channeldata which are done outside of computefeatures
+    (i.e., not in a post_load action) are not seen by the cache.
+
+    When the cache grows above max_bytes, the least recently used entries are
+    removed.
+    '''
+    def __init__(self, directory, max_bytes=(1 << 30), hash_content=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self._size = None
+
+    def __getstate__(self):
+        return (self.directory, self.max_bytes, self.hash_content)
+
+    def __setstate__(self, state):
+        self.directory, self.max_bytes, self.hash_content = state
+        self._size = None
+
+    def _filekey(self, fname):
+        if self.hash_content:
+            h = hashlib.sha1()
+            input = file(fname, 'rb')
+            try:
+                while True:
+                    data = input.read(1 << 20)
+                    if not data:
+                        break
+                    h.update(data)
+            finally:
+                input.close()
+            return h.hexdigest()
+        st = os.stat(fname)
+        return '%s:%s:%s' % (os.path.abspath(fname), st.st_mtime, st.st_size)
+
+    def imagekey(self, img, params):
+        '''
+        key = cache.imagekey(img, params)
+
+        Returns the key for img, given a dictionary with the feature
+        computation parameters, or None if img cannot be cached (e.g., if its
+        channels are not files).
+        '''
+        h = hashlib.sha1()
+        h.update(__version__)
+        try:
+            for ch in sorted(img.channels.keys()):
+                fnames = img.channels[ch]
+                if type(fnames) != list:
+                    fnames = [fnames]
+                h.update('%s=%s;' % (ch, ','.join(self._filekey(f) for f in fnames)))
+        except (OSError, IOError, TypeError):
+            return None
+        h.update(_funcname(img.load_function))
+        h.update(_canonical([_funcname(p) for p in img.post_load]))
+        h.update(repr(img.scale))
+        if img.regions is not None and 'crop' not in img.channels:
+            # Regions set in memory (regions loaded from a file are keyed by
+            # the file)
+            regions = np.ascontiguousarray(img.regions)
+            h.update('regions=%s%s;' % (regions.dtype.str, regions.shape))
+            h.update(regions)
+        h.update(_canonical(params))
+        return h.hexdigest()
+
+    def _path(self, key, group):
+        group = re.sub(r'[^A-Za-z0-9_.-]', '_', group)
+        return os.path.join(self.directory, key[:2], '%s-%s.npy' % (key, group))
+
+    def get(self, key, group):
+        '''
+        values = cache.get(key, group)
+
+        Returns the features for group or None if they are not in the cache.
+        '''
+        path = self._path(key, group)
+        try:
+            values = np.load(path)
+        except (IOError, ValueError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return values
+
+    def put(self, key, group, values):
+        '''
+        cache.put(key, group, values)
+
+        Stores the features for group.
+        '''
+        path = self._path(key, group)
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Another process may have created it in the meanwhile
+                if not os.path.isdir(dirname):
+                    raise
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        output = file(tmp, 'wb')
+        try:
+            np.save(output, np.asarray(values))
+        finally:
+            output.close()
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.rename(tmp, path)
+        if self._size is not None:
+            self._size += os.path.getsize(path) - replaced
+        if self.size() > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        if not os.path.exists(self.directory):
+            return entries
+        for sub in os.listdir(self.directory):
+            subdir = os.path.join(self.directory, sub)
+            if not os.path.isdir(subdir):
+                continue
+            for f in os.listdir(subdir):
+                if f.endswith('.npy'):
+                    path = os.path.join(subdir, f)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self):
+        '''
+        nbytes = cache.size()
+
+        Total size of the cache entries
+        '''
+        if self._size is None:
+            self._size = sum(s for _,s,_ in self._entries())
+        return self._size
+
+    def evict(self, max_bytes=None):
+        '''
+        cache.evict(max_bytes={.9 * cache.max_bytes})
+
+        Removes the least recently used entries until the cache is no larger
+        than max_bytes.
+        '''
+        if max_bytes is None:
+            max_bytes = .9 * self.max_bytes
+        entries = self._entries()
+        entries.sort()
+        total = sum(s for _,s,_ in entries)
+        for _,s,path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= s
+        self._size = total
+
+    def clear(self):
+        '''
+        cache.clear()
+
+        Removes all entries
+        '''
+        self.evict(0)
+
+# vim: set ts=4 sts=4 sw=4 expandtab smartindent:
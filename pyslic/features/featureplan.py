@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2012  Murphy Lab
+# Carnegie Mellon University
+#
+# Written by Luis Pedro Coelho <lpc@cmu.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License,
+# or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# For additional information visit http://murphylab.web.cmu.edu or
+# send email to murphy@cmu.edu
+
+from __future__ import division
+from scipy import ndimage
+from .imgskelfeats import object_skeletons
+from mahotas.edge import sobel
+from mahotas.polygon import fill_convexhull as convexhull
+from .texture import block_sum_pyramid
+
+__all__ = ['FeaturePlan', 'Intermediates']
+
+def _binary(procprotein):
+    return (procprotein > 0)
+
+def _labeled(procprotein, binary):
+    labeled,_ = ndimage.label(binary)
+    return labeled
+
+def _objects(procprotein, labeled):
+    return ndimage.find_objects(labeled)
+
+def _hull(procprotein, binary):
+    return convexhull(binary)
+
+def _skeleton(procprotein, labeled, objects):
+    return object_skeletons(labeled, objects)
+
+def _sobel(procprotein):
+    return sobel(procprotein)
+
+def _har_pyramid(procprotein):
+    return block_sum_pyramid(procprotein, (2,3,4,5,6))
+
+# name -> (dependencies, function)
+# function is called as function(procprotein, *dependencies)
+_nodes = {
+    'binary'    : ((), _binary),
+    'labeled'   : (('binary',), _labeled),
+    'objects'   : (('labeled',), _objects),
+    'hull'      : (('binary',), _hull),
+    'skeleton'  : (('labeled', 'objects'), _skeleton),
+    'sobel'     : ((), _sobel),
+    'har-pyramid' : ((), _har_pyramid),
+}
+
+# feature group -> nodes it uses
+_group_inputs = {
+    'img'           : ('labeled',),
+    'obj-field'     : ('labeled',),
+    'obj-field-dna' : ('labeled',),
+    'skl'           : ('labeled', 'objects', 'skeleton'),
+    'skel'          : ('labeled', 'objects', 'skeleton'),
+    'hul'           : ('hull',),
+    'hull'          : ('hull',),
+    'hullsize'      : ('hull',),
+    'edg'           : ('sobel',),
+    'edge'          : ('sobel',),
+    'har2'          : ('har-pyramid',),
+    'har3'          : ('har-pyramid',),
+    'har4'          : ('har-pyramid',),
+    'har5'          : ('har-pyramid',),
+    'har6'          : ('har-pyramid',),
+}
+
+def _closure(nodes):
+    seen = set()
+    queue = list(nodes)
+    while queue:
+        n = queue.pop()
+        if n not in seen:
+            seen.add(n)
+            queue.extend(_nodes[n][0])
+    return seen
+
+class Intermediates(object):
+    '''
+    Intermediate results on the processed protein image, which are shared
+    between feature groups.
+
+    Each intermediate (a node in the dependency graph) is computed at most
+    once, when it is first requested:
+
+        shared = Intermediates(procprotein)
+        labeled = shared.get('labeled')
+
+    Available intermediates:
+        * 'binary': procprotein > 0
+        * 'labeled': ndimage.label('binary')
+        * 'objects': ndimage.find_objects('labeled')
+        * 'hull': convex hull of 'binary'
+        * 'skeleton': skeleton of each object in 'labeled' (see
+          imgskelfeats.object_skeletons)
+        * 'sobel': mahotas.edge.sobel(procprotein)
+        * 'har-pyramid': block sums of procprotein for har2,...,har6
+          (see texture.block_sum_pyramid)
+    '''
+    __slots__ = ['procprotein', 'values']
+    def __init__(self, procprotein):
+        self.procprotein = procprotein
+        self.values = {}
+
+    def get(self, name):
+        '''
+        value = shared.get(name)
+
+        Returns intermediate `name`, computing it (and its dependencies) if needed.
+        '''
+        if name not in self.values:
+            deps,function = _nodes[name]
+            self.values[name] = function(self.procprotein, *[self.get(d) for d in deps])
+        return self.values[name]
+
+    def release(self, names):
+        '''
+        shared.release(names)
+
+        Frees the memory used by intermediates `names` (they will be recomputed
+        if requested again).
+        '''
+        for n in names:
+            self.values.pop(n, None)
+
+class FeaturePlan(object):
+    '''
+    plan = FeaturePlan(featsets)
+
+    Works out which intermediates are used by a list of feature groups and
+    when each of them is no longer needed.
+
+        shared = Intermediates(procprotein)
+        for i,F in enumerate(featsets):
+            ... (use shared.get(n) for n in plan.inputs(F))
+            shared.release(plan.done(i))
+    '''
+    __slots__ = ['featsets', 'released']
+    def __init__(self, featsets):
+        self.featsets = featsets
+        last_use = {}
+        for i,F in enumerate(featsets):
+            for n in _closure(self.inputs(F)):
+                last_use[n] = i
+        self.released = [[] for F in featsets]
+        for n,i in last_use.iteritems():
+            self.released[i].append(n)
+
+    def inputs(self, F):
+        '''
+        nodes = plan.inputs(F)
+
+        Intermediates that feature group F uses
+        '''
+        return _group_inputs.get(F, ())
+
+    def done(self, i):
+        '''
+        nodes = plan.done(i)
+
+        Intermediates that are not needed after the i-th feature group
+        '''
+        return self.released[i]
+
+# vim: set ts=4 sts=4 sw=4 expandtab smartindent:
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2012  Murphy Lab
+# Carnegie Mellon University
+#
+# Written by Luis Pedro Coelho <lpc@cmu.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License,
+# or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# For additional information visit http://murphylab.web.cmu.edu or
+# send email to murphy@cmu.edu
+
+from __future__ import division
+import os
+import cPickle as pickle
+import numpy as np
+
+__all__ = ['FeatureWriter', 'read_features']
+
+_header_name = 'header.pickle'
+_format_version = 2
+
+def _shardname(i):
+    return 'features-%05d.npy' % i
+
+def _idsname(shard):
+    # The ids & labels of the rows of a shard are kept next to it (so that
+    # the header does not grow with the number of rows)
+    return shard[:-len('.npy')] + '.ids.pickle'
+
+def _atomic_write(fname, write):
+    tmp = '%s.%s.tmp' % (fname, os.getpid())
+    output = file(tmp, 'wb')
+    try:
+        write(output)
+    finally:
+        output.close()
+    os.rename(tmp, fname)
+
+def _read_pickle(fname):
+    input = file(fname, 'rb')
+    try:
+        return pickle.load(input)
+    finally:
+        input.close()
+
+def _write_pickle(fname, obj):
+    _atomic_write(fname, (lambda output: pickle.dump(obj, output, pickle.HIGHEST_PROTOCOL)))
+
+def _read_header(directory):
+    header = _read_pickle(os.path.join(directory, _header_name))
+    if header.get('version') != _format_version:
+        raise IOError("pyslic.features.featurewriter: unknown format in '%s'" % directory)
+    header['ids'] = []
+    header['labels'] = []
+    for shard,_ in header['shards']:
+        ids,labels = _read_pickle(os.path.join(directory, _idsname(shard)))
+        header['ids'].extend(ids)
+        header['labels'].extend(labels)
+    return header
+
+class FeatureWriter(object):
+    '''
+    output = FeatureWriter(directory, featurenames=None, chunk_size=256)
+
+    Writes feature vectors to disk as they are computed:
+
+        output = FeatureWriter('features/')
+        for img,features in zip(imgs, icomputefeatures(imgs, 'SLF33')):
+            output.append(features, img.id, img.label)
+        output.close()
+
+    or, equivalently:
+
+        computefeatures(imgs, 'SLF33', output=FeatureWriter('features/'))
+
+    Rows are kept in memory until chunk_size of them have been appended.
+    They are then written to `directory` as a new .npy file (a shard), with
+    their ids & labels in a small file next to it, and the header (feature
+    names & list of shards) is updated. All are written atomically (the
+    header last), so that if the process is interrupted, at most the rows of
+    the current chunk are lost.
+
+    If `directory` already contains features, they are kept and new rows are
+    appended to them. Use `output.done(id)` to check whether an image was
+    already processed (computefeatures does this automatically), so that an
+    interrupted computation can be resumed.
+
+    Use read_features to load the result.
+    '''
+    def __init__(self, directory, featurenames=None, chunk_size=256):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.pending = []
+        if os.path.exists(os.path.join(directory, _header_name)):
+            header = _read_header(directory)
+            self.shards = header['shards']
+            self.ids = header['ids']
+            self.labels = header['labels']
+            self.featurenames = header['featurenames']
+            self.nfeatures = header['nfeatures']
+            if featurenames is not None:
+                if self.featurenames is not None and list(featurenames) != list(self.featurenames):
+                    raise ValueError('pyslic.features.FeatureWriter: feature names do not match the ones in %s' % directory)
+                self.featurenames = featurenames
+        else:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            self.shards = []
+            self.ids = []
+            self.labels = []
+            self.featurenames = featurenames
+            self.nfeatures = None
+        self.completed = set(id for id in self.ids if id is not None)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def done(self, id):
+        '''
+        is_done = output.done(id)
+
+        Returns whether the features for the image with this id were written.
+        '''
+        return id is not None and id in self.completed
+
+    def append(self, features, id=None, label=None):
+        '''
+        output.append(features, id=None, label=None)
+
+        Appends a feature vector
+        '''
+        features = np.asarray(features)
+        if self.nfeatures is None:
+            self.nfeatures = len(features)
+        elif len(features) != self.nfeatures:
+            raise ValueError('pyslic.features.FeatureWriter: expected %s features (got %s)' % (self.nfeatures, len(features)))
+        self.pending.append((features, id, label))
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        output.flush()
+
+        Writes the rows appended so far to disk
+        '''
+        if not self.pending:
+            return
+        data = np.array([f for f,_,_ in self.pending])
+        ids = [id for _,id,_ in self.pending]
+        labels = [label for _,_,label in self.pending]
+        shard = _shardname(len(self.shards))
+        _atomic_write(os.path.join(self.directory, shard), (lambda output: np.save(output, data)))
+        _write_pickle(os.path.join(self.directory, _idsname(shard)), (ids, labels))
+        self.shards.append((shard, len(data)))
+        self.ids.extend(ids)
+        self.labels.extend(labels)
+        self.completed.update(id for id in ids if id is not None)
+        self.pending = []
+        header = {
+            'version' : _format_version,
+            'shards' : self.shards,
+            'featurenames' : self.featurenames,
+            'nfeatures' : self.nfeatures,
+        }
+        _write_pickle(os.path.join(self.directory, _header_name), header)
+
+    close = flush
+
+def read_features(directory, mmap=False):
+    '''
+    features,ids,labels,featurenames = read_features(directory, mmap=False)
+
+    Reads the features written by a FeatureWriter.
+
+    features[i] is the feature vector of the image with id ids[i] and label
+    labels[i]. featurenames is None if they were not given to the writer.
+
+    If mmap is True and all the features are in a single shard, features is
+    a read-only memory map.
+    '''
+    header = _read_header(directory)
+    shards = [os.path.join(directory, shard) for shard,_ in header['shards']]
+    if not shards:
+        features = np.zeros((0, (header['nfeatures'] or 0)))
+    elif mmap and len(shards) == 1:
+        features = np.load(shards[0], mmap_mode='r')
+    else:
+        features = np.concatenate([np.load(s) for s in shards])
+    return features, header['ids'], header['labels'], header['featurenames']
+
+# vim: set ts=4 sts=4 sw=4 expandtab smartindent:
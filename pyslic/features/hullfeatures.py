@@ -22,50 +22,299 @@
 from __future__ import division
 import numpy
 from mahotas import bwperim
-from imgmoments import imgcentmoments
+from imgmoments import MomentSet
 from mahotas.polygon import fill_convexhull as convexhull
+from mahotas.polygon import convexhull as convexhull_polygon
 
 from numpy import *
 import numpy as np
-from scipy.ndimage import center_of_mass
+from ..utils import mosaic_layout
 
-__all__ = ['hullfeatures','hullsizefeatures']
+__all__ = ['hullfeatures','hullsizefeatures','convexhull_areas','convexhull_sizes','polygon_moments']
 
 def _bwarea(img):
     if img.dtype != np.bool:
         img = (img > 0)
     return img.sum()
 
-def _hull_computations(imageproc,imagehull = None):
-    # Just share code between the two functions below
-    if imagehull is None:
-        imagehull = convexhull(imageproc > 0)
+def _paint(shape, ys, x0s, x1s, values=1):
+    # canvas with canvas[ys[i], x0s[i]:x1s[i]] += values[i] for all i
+    # (x0s <= x1s)
+    diff = np.zeros((shape[0], shape[1]+1), np.int32)
+    np.add.at(diff, (ys, x0s), values)
+    np.add.at(diff, (ys, x1s), -values)
+    return diff.cumsum(1)[:,:-1]
 
-    Ahull = _bwarea(imagehull)
-    Phull = _bwarea(bwperim(imagehull))
+def _fill_convexhulls(labeled, objects):
+    '''
+    hulls, boxes, positions = _fill_convexhulls(labeled, objects)
+
+    convexhull(labeled[objects[i]] == (i+1)) for all objects at once, laid
+    out by mosaic_layout in a single image: the hull of object i is
+    hulls[y:y+h,x:x+w], where (y,x) is positions[i] & (h,w) the shape of
+    objects[i]. boxes[y,x] is i+1 inside that box (and 0 between boxes).
+
+    Only the hull vertices are computed object by object: the polygons are
+    then filled in all at once, following mahotas.polygon.fill_polygon
+    row by row (including its quirks, so that the result is the same).
+    '''
+    N = len(objects)
+    shapes = [((s[0].stop-s[0].start, s[1].stop-s[1].start) if s is not None else (0,0)) for s in objects]
+    positions,shape = mosaic_layout(shapes)
+    shapes = np.array(shapes, np.intp).reshape((N,2))
+    positions = np.array(positions, np.intp).reshape((N,2))
+    ids = np.arange(N)
+
+    rows = np.repeat(ids, shapes[:,0])
+    ys = positions[rows,0] + np.arange(len(rows)) - np.repeat(shapes[:,0].cumsum() - shapes[:,0], shapes[:,0])
+    boxes = _paint(shape, ys, positions[rows,1], positions[rows,1] + shapes[rows,1], rows+1)
+
+    vertices = [convexhull_polygon(labeled[s] == (i+1)) if s is not None else np.zeros((0,2), np.intp)
+                    for i,s in enumerate(objects)]
+    nvertices = np.array([len(v) for v in vertices], np.intp)
+    hulls = np.zeros(shape, bool)
+    if nvertices.sum():
+        p = np.concatenate(vertices).astype(float)
+        pobj = np.repeat(ids, nvertices)
+        # pj is the previous vertex (the last one, for the first)
+        prev = np.arange(len(p)) - 1
+        firsts = nvertices.cumsum() - nvertices
+        prev[firsts[nvertices > 0]] = (firsts + nvertices - 1)[nvertices > 0]
+        pj = p[prev]
+        # Each edge cuts the rows in (min(y), max(y)]
+        dy = np.abs(pj[:,0] - p[:,0]).astype(np.intp)
+        edge = np.repeat(np.arange(len(p)), dy)
+        y = np.minimum(p[edge,0], pj[edge,0]) + 1 + np.arange(len(edge)) - np.repeat(dy.cumsum() - dy, dy)
+        x = p[edge,1] + (y-p[edge,0])/(pj[edge,0]-p[edge,0])*(pj[edge,1]-p[edge,1])
+        obj = pobj[edge]
+        order = np.lexsort((x, y, obj))
+        y = y[order].astype(np.intp)
+        x = x[order]
+        obj = obj[order]
+        # The sorted nodes of each row are filled in pairs
+        first = np.ones(len(y), bool)
+        first[1:] = (y[1:] != y[:-1]) | (obj[1:] != obj[:-1])
+        starts = np.flatnonzero(first)
+        rank = np.arange(len(y)) - np.repeat(starts, np.diff(np.r_[starts, len(y)]))
+        left = np.flatnonzero(rank % 2 == 0)
+        left = left[left+1 < len(y)]
+        left = left[~first[left+1]]
+        obj = obj[left]
+        x0 = np.floor(x[left]).astype(np.intp)
+        x1 = np.minimum(np.floor(x[left+1]+1).astype(np.intp), shapes[obj,1])
+        valid = (x0 < x1)
+        obj = obj[valid]
+        hulls = (_paint(shape, y[left][valid] + positions[obj,0], x0[valid] + positions[obj,1], x1[valid] + positions[obj,1]) > 0)
+    # fill_convexhull also sets the pixels of the object itself
+    py,px = np.nonzero(labeled)
+    obj = labeled[py,px] - 1
+    valid = (obj < N)
+    obj = obj[valid]
+    starts = np.array([((s[0].start, s[1].start) if s is not None else (0,0)) for s in objects], np.intp).reshape((N,2))
+    hulls[py[valid] - starts[obj,0] + positions[obj,0], px[valid] - starts[obj,1] + positions[obj,1]] = True
+    return hulls, boxes, positions
+
+def convexhull_areas(binimg, labeled, objects=None):
+    '''
+    areas = convexhull_areas(binimg, labeled, objects=None)
+
+    areas[i] is the area of the convex hull of the pixels of binimg which
+    belong to object i+1 of labeled, i.e.,
+
+        convexhull(binimg[objects[i]] & (labeled[objects[i]] == (i+1))).sum()
+
+    objects is ndimage.find_objects(labeled) (computed if not given).
+    '''
+    if objects is None:
+        from scipy.ndimage import find_objects
+        objects = find_objects(labeled)
+    labeled = np.where(np.asarray(binimg, bool), labeled, 0)
+    hulls,boxes,_ = _fill_convexhulls(labeled, objects)
+    return np.bincount(boxes[hulls], minlength=len(objects)+1)[1:]
+
+def convexhull_sizes(labeled, objects=None):
+    '''
+    Ahull, Phull, semimajor, semiminor = convexhull_sizes(labeled, objects=None)
+
+    Hull area, perimeter & semi-axes of the hull ellipse of every object of
+    labeled at once: the i-th elements are those computed by hullsizefeatures
+    (with method='raster') for labeled[objects[i]] == (i+1).
+
+    objects is ndimage.find_objects(labeled) (computed if not given).
+    '''
+    if objects is None:
+        from scipy.ndimage import find_objects
+        objects = find_objects(labeled)
+    N = len(objects)
+    hulls,boxes,positions = _fill_convexhulls(labeled, objects)
+    # bwperim: hull pixels with a 4-neighbour which is outside the hull, but
+    # inside the box (outside the box counts as hull)
+    outside = np.pad(boxes.astype(bool) & ~hulls, 1, 'constant')
+    perim = hulls & (outside[:-2,1:-1] | outside[2:,1:-1] | outside[1:-1,:-2] | outside[1:-1,2:])
+    Ahull = np.bincount(boxes[hulls], minlength=N+1)[1:].astype(float)
+    Phull = np.bincount(boxes[perim], minlength=N+1)[1:].astype(float)
+
+    y,x = np.nonzero(hulls)
+    obj = boxes[y,x]
+    y = (y - positions[obj-1,0]).astype(float)
+    x = (x - positions[obj-1,1]).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y -= (np.bincount(obj, y, minlength=N+1)[1:]/Ahull)[obj-1]
+        x -= (np.bincount(obj, x, minlength=N+1)[1:]/Ahull)[obj-1]
+        mu20 = np.bincount(obj, x*x, minlength=N+1)[1:]
+        mu11 = np.bincount(obj, x*y, minlength=N+1)[1:]
+        mu02 = np.bincount(obj, y*y, minlength=N+1)[1:]
+        semimajor,semiminor = _ellipse_axes(Ahull, mu20, mu11, mu02)
+    return Ahull, Phull, semimajor, semiminor
+
+# Hulls have few vertices, so the functions below work on lists of (y,x)
+# tuples: numpy's per call overhead would dominate.
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
 
-    cofy,cofx = center_of_mass(imagehull)
-    hull_mu00 = imgcentmoments(imagehull,0,0,cofy,cofx)
-    hull_mu11 = imgcentmoments(imagehull,1,1,cofy,cofx)
-    hull_mu02 = imgcentmoments(imagehull,0,2,cofy,cofx)
-    hull_mu20 = imgcentmoments(imagehull,2,0,cofy,cofx)
+def _ordered_hull(points):
+    # Andrew's monotone chain, for the (few) points of a Minkowski sum
+    points = sorted(set(points))
+    if len(points) < 3:
+        return points
+    def cross(o, a, b):
+        return (a[0]-o[0])*(b[1]-o[1]) - (a[1]-o[1])*(b[0]-o[0])
+    lower = []
+    upper = []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
 
+def _shoelace(vertices):
+    # area & raw moments (1, y, x, y**2, xy, x**2) of the region enclosed by
+    # the polygon (by Green's theorem)
+    m00 = m01 = m10 = m02 = m11 = m20 = 0.
+    y0,x0 = vertices[-1]
+    for y1,x1 in vertices:
+        a = x0*y1 - x1*y0
+        m00 += a
+        m01 += a*(y0+y1)
+        m10 += a*(x0+x1)
+        m02 += a*(y0*y0+y0*y1+y1*y1)
+        m11 += a*(x0*y1+2*x0*y0+2*x1*y1+x1*y0)
+        m20 += a*(x0*x0+x0*x1+x1*x1)
+        y0,x0 = y1,x1
+    sign = (1. if m00 >= 0 else -1.)
+    return sign*m00/2., sign*m01/6., sign*m10/6., sign*m02/12., sign*m11/24., sign*m20/12.
+
+def polygon_moments(vertices, raster=True):
+    '''
+    area, perimeter, cofy, cofx, mu20, mu11, mu02 = polygon_moments(vertices, raster=True)
+
+    Size and second order central moments of a convex polygon, computed in
+    closed form from its (y,x) vertices (e.g., the output of
+    mahotas.polygon.convexhull), in O(len(vertices)).
+
+    mu20, mu11 & mu02 follow MomentSet.central(x, y), i.e.,
+    mu20 is the second moment along x (columns).
+
+    If raster is False, these are the values for the continuous polygon
+    (its area, length of its boundary,...).
+
+    If raster is True, they approximate the values for the polygon filled
+    in on the pixel grid (vertices must then be integer):
+        * area is the number of grid points inside or on the polygon (Pick's
+          theorem),
+        * perimeter is the number of grid points along its boundary
+          (8-connected, as bwperim counts them),
+        * the moments are those of the union of the unit squares around the
+          grid points, scaled down to points.
+    These are close to, but not the same as, the values computed on the
+    output of fill_convexhull, which is not exactly the digitized polygon
+    (and bwperim does not count pixels on the image border).
+    '''
+    vertices = [(float(y),float(x)) for y,x in np.asarray(vertices).reshape((-1,2)).tolist()]
+    if not vertices:
+        return 0., 0., 0., 0., 0., 0., 0.
+    steps = [(abs(y1-y0), abs(x1-x0)) for (y0,x0),(y1,x1) in zip(vertices, vertices[1:]+vertices[:1])]
+    if not raster:
+        area, m01, m10, m02, m11, m20 = _shoelace(vertices)
+        perimeter = sum(sqrt(dy*dy+dx*dx) for dy,dx in steps)
+        if area == 0:
+            n = len(vertices)
+            return 0., perimeter, sum(y for y,_ in vertices)/n, sum(x for _,x in vertices)/n, 0., 0., 0.
+    else:
+        B = sum(_gcd(int(dy), int(dx)) for dy,dx in steps)
+        area = _shoelace(vertices)[0] + B/2. + 1
+        perimeter = max(sum(max(dy,dx) for dy,dx in steps), 1.)
+        squares = _ordered_hull([(y+dy,x+dx) for y,x in vertices for dy,dx in ((-.5,-.5),(-.5,.5),(.5,.5),(.5,-.5))])
+        m00, m01, m10, m02, m11, m20 = _shoelace(squares)
+        scale = area/m00
+        m01 *= scale
+        m10 *= scale
+        # a unit square has a variance of 1/12 around its centre
+        m02 = (m02 - m00/12.) * scale
+        m11 *= scale
+        m20 = (m20 - m00/12.) * scale
+    cofy = m01/area
+    cofx = m10/area
+    mu20 = max(m20 - area*cofx*cofx, 0.)
+    mu11 = m11 - area*cofx*cofy
+    mu02 = max(m02 - area*cofy*cofy, 0.)
+    return area, perimeter, cofy, cofx, mu20, mu11, mu02
+
+def _ellipse_axes(mu00, mu20, mu11, mu02):
 # Parameters of the 'image ellipse'
 #   (the constant intensity ellipse with the same mass and
 #   second order moments as the original image.)
 #   From Prokop, RJ, and Reeves, AP.  1992. CVGIP: Graphical
 #   Models and Image Processing 54(5):438-460
-    hull_semimajor = sqrt((2 * (hull_mu20 + hull_mu02 + \
-                    sqrt((hull_mu20 - hull_mu02)**2 + \
-                    4 * hull_mu11**2)))/hull_mu00) 
+    hull_semimajor = sqrt((2 * (mu20 + mu02 + \
+                    sqrt((mu20 - mu02)**2 + \
+                    4 * mu11**2)))/mu00)
+
+    hull_semiminor = sqrt((2 * (mu20 + mu02 - \
+                    sqrt((mu20 - mu02)**2 + \
+                    4 * mu11**2)))/mu00)
+    return hull_semimajor, hull_semiminor
 
-    hull_semiminor = sqrt((2 * (hull_mu20 + hull_mu02 - \
-                    sqrt((hull_mu20 - hull_mu02)**2 + \
-                    4 * hull_mu11**2)))/hull_mu00) 
+def _hull_computations(imageproc,imagehull = None,method='raster'):
+    # Just share code between the two functions below
+    if method == 'polygon':
+        Ahull, Phull, _, _, hull_mu20, hull_mu11, hull_mu02 = polygon_moments(convexhull_polygon(imageproc > 0))
+        if Ahull == 0:
+            return None, 0, 0, nan, nan
+        with np.errstate(invalid='ignore'):
+            hull_semimajor, hull_semiminor = _ellipse_axes(Ahull, hull_mu20, hull_mu11, hull_mu02)
+        # The minor axis of a hull which is a line can come out as sqrt(-epsilon)
+        if isnan(hull_semiminor):
+            hull_semiminor = 0.
+        return None, Ahull, Phull, hull_semimajor, hull_semiminor
+    if method != 'raster':
+        raise ValueError, "pyslic.features.hullfeatures: method must be 'raster' or 'polygon' (got %s)" % method
+    if imagehull is None:
+        imagehull = convexhull(imageproc > 0)
+
+    Ahull = _bwarea(imagehull)
+    Phull = _bwarea(bwperim(imagehull))
+
+    moments = MomentSet(imagehull,2)
+    hull_mu00 = moments.central(0,0)
+    hull_mu11 = moments.central(1,1)
+    hull_mu02 = moments.central(0,2)
+    hull_mu20 = moments.central(2,0)
+
+    hull_semimajor, hull_semiminor = _ellipse_axes(hull_mu00, hull_mu20, hull_mu11, hull_mu02)
     return imagehull,Ahull, Phull, hull_semimajor, hull_semiminor
 
-def hullsizefeatures(imageproc,imagehull=None):
+def hullsizefeatures(imageproc,imagehull=None,method='raster'):
     '''
+    values = hullsizefeatures(imageproc, imagehull=None, method='raster')
+
     Compute image size features
 
     Area
@@ -73,9 +322,16 @@ def hullsizefeatures(imageproc,imagehull=None):
     Perimeter
     Hull Semi-major axis
     Hull Semi-minor axis
+
+    If method is 'polygon', these are computed from the vertices of the hull
+    (see polygon_moments) instead of from the filled in hull image
+    (imagehull is then not used).
     '''
 
-    _,Ahull, Phull, hull_semimajor, hull_semiminor = _hull_computations(imageproc,imagehull)
+    _,Ahull, Phull, hull_semimajor, hull_semiminor = _hull_computations(imageproc,imagehull,method)
+    return _hullsizefeatures(Ahull, Phull, hull_semimajor, hull_semiminor)
+
+def _hullsizefeatures(Ahull, Phull, hull_semimajor, hull_semiminor):
     values=array([Ahull,sqrt(Ahull),Phull,hull_semimajor,hull_semiminor])
     values=r_[values,1./(values+(values==0))]
     return values
@@ -94,19 +350,25 @@ hullsizefeatures.names = [
 'hullsize:inv(semiminor))'
 ]
 
-def hullfeatures(imageproc,imagehull=None):
+def hullfeatures(imageproc,imagehull=None,method='raster'):
     """
+    values = hullfeatures(imageproc, imagehull=None, method='raster')
+
     Compute hull features:
 
     hullfract:          bwarea/hullarea
     hullshape:          roundness of hull
     hull_eccentricity:  eccentricity of hull ellipse
+
+    If method is 'polygon', these are computed from the vertices of the hull
+    (see polygon_moments) instead of from the filled in hull image
+    (imagehull is then not used).
     """
 
-    if imagehull is None:
-        imagehull = convexhull(imageproc > 0)
+    imagehull,Ahull, Phull, hull_semimajor, hull_semiminor = _hull_computations(imageproc,imagehull,method)
+    return _hullfeatures(imageproc, Ahull, Phull, hull_semimajor, hull_semiminor)
 
-    imagehull,Ahull, Phull, hull_semimajor, hull_semiminor = _hull_computations(imageproc,imagehull)
+def _hullfeatures(imageproc, Ahull, Phull, hull_semimajor, hull_semiminor):
     if Ahull == 0: return numpy.array([0,0,0])
     hullfract = double((imageproc > 0).sum())/Ahull
     hullshape = (Phull**2)/(4*pi*Ahull)
@@ -62,9 +62,9 @@ def imgfeatures(imageproc, isfield):
 
     return imgfeaturesdna(imageproc, None, isfield)
 
-def imgfeaturesdna(imageproc, dnaproc, isfield=False):
+def imgfeaturesdna(imageproc, dnaproc, isfield=False, labeled=None):
     """
-    values = imgfeaturesdna(imageproc, dnaproc, isfield=False)
+    values = imgfeaturesdna(imageproc, dnaproc, isfield=False, labeled=None)
 
     calculates object features for imageproc
     where imageproc contains the pre-processed fluorescence image,
@@ -79,6 +79,8 @@ def imgfeaturesdna(imageproc, dnaproc, isfield=False):
         * dnaproc: pre-processed DNA image
         * isfield: whether to calculate only field level features
                 (default: False)
+        * labeled: ndimage.label(imageproc > 0)[0], if it has already been
+                computed (default: compute it)
 
     Features calculated include:
       - Number of objects
@@ -97,7 +99,11 @@ def imgfeaturesdna(imageproc, dnaproc, isfield=False):
       - DNA/Image: fraction of image that overlaps with DNA
     """
     bwimage = (imageproc > 0)
-    imagelabeled,nr_objs = ndimage.label(bwimage)
+    if labeled is None:
+        imagelabeled,nr_objs = ndimage.label(bwimage)
+    else:
+        imagelabeled = labeled
+        nr_objs = (int(labeled.max()) if labeled.size else 0)
     if not nr_objs:
         nfeatures = 5
         if not isfield:
@@ -24,10 +24,84 @@
 # For additional information visit http://murphylab.web.cmu.edu or
 # send email to murphy@cmu.edu
 
+from __future__ import division
 import numpy as np
-from mahotas import center_of_mass
 
-__all__ = ['imgmoments','imgcentmoments']
+__all__ = ['imgmoments','imgcentmoments','MomentSet']
+
+def _shift(n, c):
+    # row n of the binomial expansion of (t + c)**n: C(n,i) * c**(n-i)
+    coefs = np.ones(1)
+    for _ in xrange(n):
+        coefs = np.r_[coefs, 0] + np.r_[0, coefs]
+    return coefs * c ** np.arange(n, -1, -1, dtype=float)
+
+class MomentSet(object):
+    """
+    moments = MomentSet(img, order, center=None)
+
+    All the moments of img up to `order` (along each axis), computed in a
+    single pass over the image.
+
+    Moments are indexed as in imgcentmoments: moments.central(x,y) is the
+    central moment of order x along the columns and y along the rows.
+
+    Central moments are taken around `center` (a (y,x) pair), which defaults
+    to the centroid of img.
+
+    Attributes
+    ----------
+        * m00: total mass
+        * centroid: (y,x) centroid
+        * center: (y,x) point around which the central moments are taken
+        * mu: array such that mu[x,y] == moments.central(x,y)
+    """
+    __slots__ = ['order', 'm00', 'centroid', 'center', 'mu']
+    def __init__(self, img, order, center=None):
+        img = np.asanyarray(img)
+        if not np.issubdtype(img.dtype, float):
+            img = img.astype(float)
+        r,c = img.shape
+        self.order = order
+        self.m00 = img.sum()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.centroid = (np.dot(img.sum(1), np.arange(r, dtype=float))/self.m00,
+                             np.dot(img.sum(0), np.arange(c, dtype=float))/self.m00)
+        if center is None:
+            center = self.centroid
+        self.center = tuple(center)
+        cofy,cofx = self.center
+        powers = np.arange(order+1)
+        px = (np.arange(c, dtype=float) - cofx)[:,None] ** powers
+        py = (np.arange(r, dtype=float) - cofy)[:,None] ** powers
+        self.mu = np.dot(np.dot(img, px).T, py)
+
+    def central(self, x, y):
+        """
+        mu_xy = moments.central(x, y)
+
+        Moment of order x along the columns and y along the rows around
+        moments.center (see imgcentmoments)
+        """
+        return self.mu[x,y]
+
+    def raw(self, x, y):
+        """
+        m_xy = moments.raw(x, y)
+
+        Moment around the origin (see imgmonents)
+        """
+        cofy,cofx = self.center
+        return np.dot(np.dot(_shift(x, cofx), self.mu[:x+1,:y+1]), _shift(y, cofy))
+
+    def normalized(self, x, y):
+        """
+        eta_xy = moments.normalized(x, y)
+
+        Scale invariant central moment: mu_xy/mu_00**(1+(x+y)/2)
+        """
+        return self.mu[x,y]/self.mu[0,0]**(1+(x+y)/2)
+
 def imgmonents(img, x, y):
     """
      M = imgmonents(IMG, X, Y) calculates the moment MXY for IMAGE
@@ -48,19 +122,11 @@ def imgcentmoments(img,x,y,cofy=None,cofx=None):
     M_xy = imgcentmoments(img,x,y, cofy=None, cofx=None)
 
     @param cofy and cofx are optional and computed from the image if not given
+
+    See MomentSet for computing several moments of the same image.
     """
-    if cofy is None or cofx is None:
-        print 'calling center_of_mass'
-        cofy, cofx = center_of_mass(img)
-    if not np.issubdtype(img.dtype, float):
-        img = img.astype(float)
-    r,c = img.shape
-    p = np.arange(c)
-    p -= cofx
-    p **= x
-    inter = np.dot(img, p)
-    p = np.arange(r)
-    p -= cofy
-    p **= y
-    return np.dot(inter, p)
+    center = None
+    if cofy is not None and cofx is not None:
+        center = (cofy,cofx)
+    return MomentSet(img, max(x,y), center).central(x,y)
 
@@ -29,34 +29,82 @@ from scipy import ndimage
 from mahotas.bbox import croptobbox
 from mahotas import thin
 from mahotas.polygon import fill_convexhull as convexhull
+from .hullfeatures import convexhull_areas
 
-__all__ = ['imgskelfeatures', 'find_branch_points']
+__all__ = ['imgskelfeatures', 'find_branch_points', 'object_skeletons']
 
-def imgskelfeatures(protproc):
+def object_skeletons(labeled, objects=None):
     """
-    values = imgskelfeatures(protproc)
+    skeleton = object_skeletons(labeled, objects=None)
+
+    Returns a binary image with the skeleton of each object in labeled, i.e.,
+    skeleton[objects[i]] & (labeled[objects[i]] == (i+1)) is the same as
+    thin(labeled[objects[i]] == (i+1)).
+
+    The whole image is thinned at once. Objects which touch diagonally
+    (ndimage.label uses 4-connectivity, while thinning looks at all 8
+    neighbours) are thinned separately.
+    """
+    skeleton = thin(labeled > 0)
+    touching = []
+    for a,b in [(labeled[:-1,:-1], labeled[1:,1:]), (labeled[:-1,1:], labeled[1:,:-1])]:
+        diagonal = (a != b) & (a > 0) & (b > 0)
+        touching.append(a[diagonal])
+        touching.append(b[diagonal])
+    touching = numpy.unique(numpy.concatenate(touching))
+    if len(touching):
+        if objects is None:
+            objects = ndimage.find_objects(labeled)
+        for i in touching:
+            slice = objects[i-1]
+            objmask = (labeled[slice] == i)
+            skeleton[slice][objmask] = thin(objmask)[objmask]
+    return skeleton
+
+def imgskelfeatures(protproc, labeled=None, objects=None, skeleton=None):
+    """
+    values = imgskelfeatures(protproc, labeled=None, objects=None, skeleton=None)
     Compute skeleton features for protproc
 
     where protproc contains the pre-processed fluorescence image,
     Pre-processed means that the image has been cropped and had
     pixels of interest selected (via a threshold, for instance).
-    """
-    values = []
 
+    labeled (ndimage.label(protproc > 0)[0]), objects (ndimage.find_objects(labeled))
+    and skeleton (object_skeletons(labeled, objects)) are computed if not given.
+    """
     # Find objects in the image
-    labeled,N = ndimage.label(protproc > 0)
+    if labeled is None:
+        labeled,N = ndimage.label(protproc > 0)
+    else:
+        N = (labeled.max() if labeled.size else 0)
     if N == 0:
         return numpy.zeros(5,numpy.float64)
-    objects = ndimage.find_objects(labeled)
-    for i,slice in enumerate(objects):
-        # Get an image of the single object
-        objimage = protproc[slice] * (labeled[slice] == (i+1))
-        # Compute skeleton features
-        skelfeats=_objskelfeats(objimage)
-        values.append(skelfeats)
+    if objects is None:
+        objects = ndimage.find_objects(labeled)
+    if skeleton is None:
+        skeleton = object_skeletons(labeled, objects)
+
+    # Per object sums (index 0 is the background)
+    objects_only = numpy.where(labeled > 0, protproc, 0)
+    objsize = numpy.bincount(labeled.ravel(), minlength=N+1)[1:]
+    obj_fluor = numpy.bincount(labeled.ravel(), objects_only.ravel(), minlength=N+1)[1:]
+    skel_labels = labeled[skeleton]
+    skellen = numpy.bincount(skel_labels, minlength=N+1)[1:]
+    skel_fluor = numpy.bincount(skel_labels, objects_only[skeleton], minlength=N+1)[1:]
+    branch_points = find_branch_points(skeleton)
+    no_of_branch_points = numpy.bincount(labeled[branch_points], minlength=N+1)[1:]
+    hullsize = numpy.maximum(convexhull_areas(skeleton, labeled, objects), skellen) # Corner cases such as [[1]]
+
+    values = numpy.zeros((N,5))
+    present = (objsize > 0)
+    values[present,0] = skellen[present]
+    values[present,1] = skellen[present] / hullsize[present]
+    values[present,2] = skellen[present] / objsize[present]
+    values[present,3] = skel_fluor[present] / obj_fluor[present]
+    values[present,4] = no_of_branch_points[present] / skellen[present]
 
     # Average the skeleton features over the whole cell
-    values=numpy.array(values)
     values=values.mean(0)
     return values
 
@@ -83,11 +131,12 @@ def find_branch_points(img):
     branch_points = img*ndimage.convolve(img,kernel,mode='constant')
     return (branch_points >= 3)
 
-def _objskelfeats(objimg):
+def _objskelfeats(objimg, objskel=None):
     """
-    feats = _objskelfeats(objimg)
+    feats = _objskelfeats(objimg, objskel=None)
 
     Calculate skeleton features for the object OBJIMG.
+    objskel is its skeleton (default: computed from objimg).
     """
     objimg = objimg
     objbin = objimg > 0
@@ -96,7 +145,8 @@ def _objskelfeats(objimg):
     if objsize == 0:
         return numpy.zeros(5)
 
-    objskel = thin(objbin)
+    if objskel is None:
+        objskel = thin(objbin)
     skellen = objskel.sum()
 
 
@@ -31,26 +31,65 @@ from scipy import ndimage
 from mahotas.bbox import bbox
 
 from ..image import Image
-from mahotas import euler
-from .hullfeatures import hullfeatures
-from mahotas import thin
-from mahotas.polygon import fill_convexhull as convexhull
-from .imgskelfeats import find_branch_points
-
-try:
-    import ncreduce
-    fast_sum = ncreduce.sum
-except ImportError:
-    fast_sum = np.sum
-
-def objectfeatures(img):
+from .hullfeatures import convexhull_sizes, _hull_computations
+from .imgskelfeats import find_branch_points, object_skeletons
+
+# mahotas.euler's lookup table for 8-connectivity, indexed by the 2x2 window
+#   8*f[i,j] + 4*f[i,j-1] + 2*f[i-1,j] + f[i-1,j-1]
+_euler_lookup8 = np.array([
+            0,  1,  1,  0,
+            1,  0, -2, -1,
+            1, -2,  0, -1,
+            0, -1, -1,  0,
+            ])/4.
+
+def _euler_labels(labeled, locations):
+    '''
+    eulers = _euler_labels(labeled, locations)
+
+    eulers[i] is mahotas.euler(labeled[locations[i]] == (i+1)).
+
+    labeled must be labeled with 8-connectivity, so that a 2x2 window never
+    contains pixels from two objects.
     '''
-    values=objectfeatures(img)
+    N = len(locations)
+    h,w = labeled.shape
+    # The smallest types that fit the labels & the coordinates (the
+    # temporaries below are all full size)
+    ltype = np.min_scalar_type(N)
+    ctype = np.min_scalar_type(max(h,w))
+    f = np.zeros((h+1, w+1), ltype)
+    f[1:,1:] = labeled
+    windows = [f[1:,1:], f[1:,:-1], f[:-1,1:], f[:-1,:-1]]
+    code = np.zeros((h,w), np.uint8)
+    for bit,window in zip((8,4,2,1), windows):
+        code[window > 0] |= bit
+    label = np.maximum(np.maximum(windows[0], windows[1]), np.maximum(windows[2], windows[3]))
+    # mahotas.euler on the bounding box only sees the windows which end inside it
+    bounds = np.zeros((4,N+1), ctype)
+    for i,slice in enumerate(locations):
+        if slice is not None:
+            bounds[:,i+1] = (slice[0].start, slice[0].stop, slice[1].start, slice[1].stop)
+    y = np.arange(h, dtype=ctype)[:,None]
+    x = np.arange(w, dtype=ctype)[None,:]
+    valid = (label > 0)
+    valid &= (y >= bounds[0][label])
+    valid &= (y < bounds[1][label])
+    valid &= (x >= bounds[2][label])
+    valid &= (x < bounds[3][label])
+    return np.bincount(label[valid], _euler_lookup8[code[valid]], minlength=N+1)[1:]
+
+def objectfeatures(img, hull_method='raster'):
+    '''
+    values=objectfeatures(img, hull_method='raster')
 
     This implements the object features described in
     "Object Type Recognition for Automated Analysis of Protein Subcellular Location"
     by Ting Zhao, Meel Velliste, Michael V. Boland, and Robert F. Murphy
     in IEEE Transaction on Image Processing
+
+    hull_method is the method argument of hullfeatures ('polygon' only
+    approximates the original hull features).
     '''
 
     protimg = img.get('procprotein')
@@ -77,25 +116,34 @@ def objectfeatures(img):
         centers **= 2
         sofs[:,1] = np.sqrt(centers.sum(1))
     locations = ndimage.find_objects(labeled, N)
+
+    # With 8-connected objects, thinning the whole image at once gives the
+    # skeleton of each object.
+    binskel = object_skeletons(labeled, locations)
+    skel_labels = labeled[binskel]
+    def per_object(labels, weights=None):
+        return np.bincount(labels.ravel(), weights, minlength=N+1)[1:N+1]
+
+    sofs[:, 0] = per_object(labeled)
+    if dnaimg is not None:
+        sofs[:, 2] = per_object(labeled[bindna])
+    sofs[:, 4] = _euler_labels(labeled, locations)
+    sofs[:, 6] = per_object(skel_labels)
     sofs[:, 9] = ndimage.measurements.sum(protimg, labeled, indices)
-    for obji in xrange(N):
-        slice = locations[obji]
-        binobj = (labeled[slice] == (obji+1)).copy()
-        protobj = protimg[slice]
-        binskel = thin(binobj)
-        objhull = convexhull(binobj)
-        no_of_branch_points = fast_sum(find_branch_points(binskel))
-        hfeats = hullfeatures(binobj,objhull)
-        sofs[obji,0] = fast_sum(binobj)
-        if dnaimg is not None:
-            sofs[obji,2] = fast_sum(binobj&bindna[slice])
-        sofs[obji, 3] = hfeats[2]
-        sofs[obji, 4] = euler(binobj)
-        sofs[obji, 5] = hfeats[1]
-        sofs[obji, 6] = fast_sum(binskel)
-        sofs[obji, 7] = hfeats[0]
-        sofs[obji, 9] /= fast_sum(binskel*protobj)
-        sofs[obji,10] = no_of_branch_points
+    sofs[:, 9] /= per_object(skel_labels, protimg[binskel].astype(float))
+    sofs[:,10] = per_object(labeled[find_branch_points(binskel)])
+    if hull_method == 'raster':
+        Ahull,Phull,semimajor,semiminor = convexhull_sizes(labeled, locations)
+    else:
+        # (the polygon hull features are computed from the vertices)
+        Ahull,Phull,semimajor,semiminor = np.array([_hull_computations(labeled[slice] == (obji+1), method=hull_method)[1:]
+                                                        for obji,slice in enumerate(locations)]).T
+    # As in hullfeatures
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hull = (Ahull != 0)
+        sofs[:, 3] = np.where(hull & (semimajor != 0), np.sqrt(semimajor**2 - semiminor**2)/semimajor, 0)
+        sofs[:, 5] = np.where(hull, Phull**2/(4*pi*Ahull), 0)
+        sofs[:, 7] = np.where(hull, sofs[:,0]/Ahull, 0)
     sofs[:,2] /= sofs[:,0]
     sofs[:,8] = sofs[:,6]/sofs[:,0]
     sofs[:,10] /= sofs[:,6]
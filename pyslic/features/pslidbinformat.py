@@ -24,16 +24,31 @@
 
 from __future__ import division, with_statement
 from struct import pack, unpack
+import numpy as np
 
 __all__ = ['readpslidbin','writepslidbin']
-def readpslidbin(filename):
-    input = file(filename)
+
+_float32 = np.dtype('>f4')
+_int32 = np.dtype('>i4')
+
+def readpslidbin(filename, mmap=False):
+    '''
+    features, real_slf_names, slf_names, names, imageurls, maskurls = readpslidbin(filename, mmap=False)
+
+    Reads a PSLID binary feature file (version 5).
+
+    features is a (rows x cols) float32 array. If mmap is True, it is a
+    read-only numpy.memmap into the file (useful for very large files).
+    '''
+    input = file(filename, 'rb')
     def read_int32():
         bytes = input.read(4)
         return unpack('>i',bytes)[0]
-    def read_float32():
-        bytes = input.read(4)
-        return unpack('>f',bytes)[0]
+    def read_int32s(n):
+        data = input.read(4*n)
+        if len(data) != 4*n:
+            raise IOError('pyslic.readpslidbin: file is truncated')
+        return np.fromstring(data, _int32)
     def read_str():
         nbytes = read_int32()
         return input.read(nbytes)
@@ -41,51 +56,55 @@ def readpslidbin(filename):
         return read_str().split('@')[:-1]
     def read_intlist():
         n = read_int32()
-        return [read_int32() for i in xrange(n)]
-    version = read_int32()
-    if version != 5:
-        raise NotImplementedError('pyslic.readpslidbin: Can only read version 5 files')
-    rows = read_int32()
-    cols = read_int32()
-    features = [read_float32() for i in xrange(cols)]
-    featids = read_intlist()
-    real_slf_names = read_strlist()
-    slf_names = read_strlist()
-    names = read_strlist()
-    n_sampleids = read_int32()
-    samples = [read_int32() for i in xrange(n_sampleids)]
-    settype = read_int32()
-    imageurls = read_strlist()
-    maskurls = read_strlist()
-    #ndims = read_int32()  # This is in the documentation but not in the matlab code
-    n_channels = read_int32()
-    channel_nrs = [read_int32() for i in xrange(n_channels)]
+        return read_int32s(n).tolist()
+    try:
+        version = read_int32()
+        if version != 5:
+            raise NotImplementedError('pyslic.readpslidbin: Can only read version 5 files')
+        rows = read_int32()
+        cols = read_int32()
+        if mmap:
+            features = np.memmap(filename, _float32, mode='r', offset=input.tell(), shape=(rows,cols))
+            input.seek(4*rows*cols, 1)
+        else:
+            data = input.read(4*rows*cols)
+            if len(data) != 4*rows*cols:
+                raise IOError('pyslic.readpslidbin: file is truncated')
+            features = np.fromstring(data, _float32).reshape((rows,cols))
+        featids = read_intlist()
+        real_slf_names = read_strlist()
+        slf_names = read_strlist()
+        names = read_strlist()
+        samples = read_intlist()
+        settype = read_int32()
+        imageurls = read_strlist()
+        maskurls = read_strlist()
+        #ndims = read_int32()  # This is in the documentation but not in the matlab code
+        channel_nrs = read_intlist()
+    finally:
+        input.close()
     return features, real_slf_names, slf_names, names, imageurls, maskurls
-        
+
 def writepslidbin(output, features, real_slf_names, slf_names, names, imageurls, maskurls, settype, channel_nrs):
     if type(output) in (str,unicode):
-        output = file(output, 'w')
+        output = file(output, 'wb')
     def write_int32(x):
         output.write(pack('>i',x))
-    def write_float32(x):
-        output.write(pack('>f',x))
     def write_strlist(s):
         s = ''.join(a+'@' for a in s)
         write_int32(len(s))
         output.write(s)
     def write_intlist(l):
         write_int32(len(l))
-        for i in l:
-            write_int32(i)
+        output.write(np.asarray(l, _int32).tostring())
+    features = np.asanyarray(features)
     if len(features.shape) == 1:
         features = features.reshape((1,features.size))
     rows,cols = features.shape
     write_int32(5) # Version
     write_int32(rows)
     write_int32(cols)
-    for fs in features:
-        for f in fs:
-            write_float32(f)
+    output.write(np.ascontiguousarray(features, _float32).tostring())
     write_intlist([])
     write_strlist(real_slf_names)
     write_strlist(slf_names)
@@ -96,4 +115,3 @@ def writepslidbin(output, features, real_slf_names, slf_names, names, imageurls,
     write_strlist(maskurls)
     write_intlist(channel_nrs)
     output.close()
-
@@ -23,9 +23,13 @@
 # For additional information visit http://murphylab.web.cmu.edu or
 # send email to murphy@cmu.edu
 
+from __future__ import division
+import numpy as np
+from scipy import ndimage
 from mahotas.texture import haralick as haralickfeatures
+from ..utils import mosaic_layout
 
-__all__ = ['haralickfeatures']
+__all__ = ['haralickfeatures', 'block_sum_pyramid', 'cooccurrence_regions', 'haralick_regions', 'haralick_crops']
 
 haralickfeatures.names=[
     'angular_second_moment',
@@ -42,3 +46,210 @@ haralickfeatures.names=[
     'info_measure_corr_2']
 haralickfeatures.slfnames = [ ('SLF3.%d' % n) for n in xrange(66,66+13)]
 
+def block_sum_pyramid(img, rates):
+    '''
+    levels = block_sum_pyramid(img, rates)
+
+    Downsampled versions of img, where each pixel is the sum of a rate x rate
+    block. levels[rate] is the same as
+
+        C = np.ones((rate,rate))
+        ndimage.convolve(np.array(img,np.uint16), C)[::rate,::rate]
+
+    (including the border handling and the uint16 overflow), but all levels
+    are computed from a single summed-area table instead of a convolution per
+    level.
+
+    The sums are computed with integers and wrapped to 16 bits explicitly
+    (modulo 2**16), so that the result does not depend on how the platform
+    casts out of range doubles to uint16.
+    '''
+    img = np.asarray(img).astype(np.int64) & 0xFFFF
+    h,w = img.shape
+    # A convolution with a rate x rate kernel sums the block starting at
+    # i - (rate-1)//2. The border is ndimage's 'reflect' mode.
+    before = max([(r-1)//2 for r in rates])
+    after = max([r-1-(r-1)//2 for r in rates])
+    padded = np.pad(img, ((before,after),(before,after)), 'symmetric')
+    integral = np.zeros((padded.shape[0]+1, padded.shape[1]+1), np.int64)
+    integral[1:,1:] = padded.cumsum(0, dtype=np.int64).cumsum(1)
+    levels = {}
+    for r in rates:
+        start = before - (r-1)//2
+        rows = np.arange(start, start+h, r)
+        cols = np.arange(start, start+w, r)
+        sums = integral[np.ix_(rows+r,cols+r)] \
+                - integral[np.ix_(rows,cols+r)] \
+                - integral[np.ix_(rows+r,cols)] \
+                + integral[np.ix_(rows,cols)]
+        levels[r] = (sums & 0xFFFF).astype(np.uint16)
+    return levels
+
+# Same directions (and order) as mahotas.texture.haralick
+_deltas = [(0,1), (1,1), (1,0), (1,-1)]
+
+def _shifted(f, dy, dx):
+    h,w = f.shape
+    a = f[max(0,-dy):h-max(0,dy), max(0,-dx):w-max(0,dx)]
+    b = f[max(0,dy):h-max(0,-dy), max(0,dx):w-max(0,-dx)]
+    return a,b
+
+def cooccurrence_regions(f, labeled, nr_labels=None, ignore_zeros=False):
+    '''
+    cmats = cooccurrence_regions(f, labeled, nr_labels=None, ignore_zeros=False)
+
+    Computes the symmetric co-occurrence matrices of the regions of a labeled
+    image in a single pass.
+
+    cmats[L-1,d] is the co-occurrence matrix of region L in the d-th
+    direction (same directions as mahotas.texture.haralick). Only pairs of
+    pixels which both belong to region L are counted. If ignore_zeros, pairs
+    where either value is zero are not counted either.
+
+    Parameters
+    ----------
+        * f: 2-D integer image (e.g., quantized to a small number of grey
+                levels, as cmats has shape (nr_labels, 4, f.max()+1, f.max()+1))
+        * labeled: labeled image of the same shape (0 is background)
+        * nr_labels: number of labels (default: labeled.max())
+    '''
+    f = np.asanyarray(f)
+    labeled = np.asanyarray(labeled)
+    if f.dtype.kind not in 'iu':
+        raise TypeError('pyslic.features.texture.cooccurrence_regions: f must be of integer type')
+    if f.shape != labeled.shape or len(f.shape) != 2:
+        raise ValueError('pyslic.features.texture.cooccurrence_regions: f and labeled must be 2-D images of the same shape')
+    if f.size and f.min() < 0:
+        raise ValueError('pyslic.features.texture.cooccurrence_regions: f must be non-negative')
+    if nr_labels is None:
+        nr_labels = int(labeled.max()) if labeled.size else 0
+    B = (int(f.max())+1 if f.size else 1)
+    cmats = np.zeros((nr_labels, len(_deltas), B, B), np.intp)
+    for d,(dy,dx) in enumerate(_deltas):
+        a,b = _shifted(f, dy, dx)
+        la,lb = _shifted(labeled, dy, dx)
+        valid = (la == lb) & (la > 0) & (la <= nr_labels)
+        if ignore_zeros:
+            valid &= (a != 0) & (b != 0)
+        base = (la[valid].astype(np.intp)-1) * (B*B)
+        a = a[valid].astype(np.intp)
+        b = b[valid].astype(np.intp)
+        counts = np.bincount(np.concatenate((base + a*B + b, base + b*B + a)), minlength=nr_labels*B*B)
+        cmats[:,d] = counts.reshape((nr_labels,B,B))
+    return cmats
+
+def _entropy(p, axes):
+    return -(p * np.log2(p + (p == 0))).sum(axes)
+
+def haralick_regions(f, labeled, nr_labels=None, ignore_zeros=False, return_mean=False):
+    '''
+    features = haralick_regions(f, labeled, nr_labels=None, ignore_zeros=False, return_mean=False)
+
+    Haralick features for all the regions of a labeled image at once.
+
+    features[L-1] are the 4 x 13 Haralick features of region L (or, if
+    return_mean, their mean over the 4 directions), i.e., the same as
+
+        mahotas.texture.haralick(f * (labeled == L), ignore_zeros=True)
+
+    when ignore_zeros is True (see cooccurrence_regions for which pairs of
+    pixels are counted). The co-occurrence matrices are computed in a single
+    pass over the image and the features are computed for all regions
+    together. Directions in which a region has no pairs of pixels (e.g., the
+    horizontal direction of a one pixel wide region) get NaN features.
+    '''
+    cmats = cooccurrence_regions(f, labeled, nr_labels, ignore_zeros)
+    N,D,B,_ = cmats.shape
+    # Feature 10 depends on the size of the co-occurrence matrix, which (for
+    # a single image) is the maximum grey value + 1:
+    if N:
+        maxv = ndimage.maximum(f, labeled, np.arange(1,N+1))
+        maxv = np.nan_to_num(np.array(maxv, float)).astype(np.intp) + 1
+    else:
+        maxv = np.zeros(0, np.intp)
+
+    T = cmats.sum(3).sum(2).astype(float)
+    empty = (T == 0)
+    T[empty] = 1.
+    p = cmats / T[:,:,None,None]
+
+    k = np.arange(B, dtype=float)
+    k2 = k**2
+    tk = np.arange(2*B, dtype=float)
+    tk2 = tk**2
+    i,j = np.mgrid[:B,:B]
+
+    px = p.sum(2)
+    py = p.sum(3)
+    ux = np.dot(px, k)
+    uy = np.dot(py, k)
+    vx = np.dot(px, k2) - ux**2
+    vy = np.dot(py, k2) - uy**2
+    sx = np.sqrt(vx)
+    sy = np.sqrt(vy)
+
+    # px_plus_y[s] = sum_{i+j=s} p[i,j] & px_minus_y[s] = sum_{|i-j|=s} p[i,j]
+    flat = p.reshape((N*D,B*B))
+    offsets = (np.arange(N*D)*(2*B))[:,None]
+    px_plus_y = np.bincount((offsets + (i+j).ravel()).ravel(), flat.ravel(), minlength=N*D*2*B).reshape((N,D,2*B))
+    offsets = (np.arange(N*D)*B)[:,None]
+    px_minus_y = np.bincount((offsets + np.abs(i-j).ravel()).ravel(), flat.ravel(), minlength=N*D*B).reshape((N,D,B))
+
+    feats = np.empty((N,D,13))
+    feats[:,:,0] = (p**2).sum(3).sum(2)
+    feats[:,:,1] = np.dot(px_minus_y, k2)
+    constant = (sx == 0.) | (sy == 0.)
+    sxsy = sx*sy
+    sxsy[constant] = 1.
+    feats[:,:,2] = (np.dot(flat, (i*j).ravel()).reshape((N,D)) - ux*uy) / sxsy
+    feats[:,:,2][constant] = 1.
+    feats[:,:,3] = vx
+    feats[:,:,4] = np.dot(flat, 1./(1. + (i-j).ravel()**2)).reshape((N,D))
+    feats[:,:,5] = np.dot(px_plus_y, tk)
+    feats[:,:,6] = np.dot(px_plus_y, tk2) - feats[:,:,5]**2
+    feats[:,:,7] = _entropy(px_plus_y, 2)
+    feats[:,:,8] = _entropy(p, (3,2))
+    # variance of px_minus_y[:maxv] (the remaining entries are zero)
+    n = maxv[:,None].astype(float)
+    feats[:,:,9] = (px_minus_y**2).sum(2)/n - (px_minus_y.sum(2)/n)**2
+    feats[:,:,10] = _entropy(px_minus_y, 2)
+
+    HX = _entropy(px, 2)
+    HY = _entropy(py, 2)
+    cross = px[:,:,:,None] * py[:,:,None,:]
+    cross += (cross == 0)
+    HXY1 = -(p * np.log2(cross)).sum(3).sum(2)
+    HXY2 = -(cross * np.log2(cross)).sum(3).sum(2)
+    HXY = np.maximum(HX, HY)
+    HXY[HXY == 0.] = 1.
+    feats[:,:,11] = (feats[:,:,8] - HXY1)/HXY
+    feats[:,:,12] = np.sqrt(np.maximum(0, 1 - np.exp(-2. * (HXY2 - feats[:,:,8]))))
+    feats[empty] = np.nan
+    if return_mean:
+        return feats.mean(1)
+    return feats
+
+def haralick_crops(imgs, return_mean=False):
+    '''
+    features = haralick_crops(imgs, return_mean=False)
+
+    Haralick features of several (small) images at once: features[i] is the
+    same as haralickfeatures(imgs[i]) (or its mean over the 4 directions, if
+    return_mean), up to rounding.
+
+    The images are laid out side by side (one pixel apart) in rows of a
+    single image, which is passed to haralick_regions with each image as a
+    region. Therefore, the cost depends on the total number of pixels and not
+    on the number of images.
+    '''
+    imgs = [np.asanyarray(img) for img in imgs]
+    if not imgs:
+        return np.zeros((0,13) if return_mean else (0,4,13))
+    positions,shape = mosaic_layout([img.shape for img in imgs])
+    mosaic = np.zeros(shape, np.result_type(*imgs))
+    labeled = np.zeros(mosaic.shape, np.int32)
+    for i,(img,(y,x)) in enumerate(zip(imgs, positions)):
+        h,w = img.shape
+        mosaic[y:y+h,x:x+w] = img
+        labeled[y:y+h,x:x+w] = i+1
+    return haralick_regions(mosaic, labeled, len(imgs), return_mean=return_mean)
@@ -24,9 +24,66 @@
 # Ported to Python by Luis Pedro Coelho <lpc@cmu.edu>
 
 from __future__ import division
-import mahotas.zernike
+import numpy as np
+from math import factorial
+from .imgmoments import MomentSet
 
-__all__ = ['zernike']
+__all__ = ['zernike', 'zernike_batch']
+
+# D -> (coefficients, n, l): the Zernike radial polynomial of the j-th moment
+# is sum_k coefficients[j,k] * rho**k, and its angular order is l[j]
+_coefficients = {}
+
+def _zernike_coefficients(D):
+    if D not in _coefficients:
+        ns = []
+        ls = []
+        coefficients = []
+        for n in xrange(D+1):
+            for l in xrange(n+1):
+                if (n-l)%2 == 0:
+                    R = np.zeros(D+1)
+                    for m in xrange((n-l)//2+1):
+                        R[n-2*m] = (-1)**m * factorial(n-m) / \
+                            float(factorial(m)*factorial((n-2*m+l)//2)*factorial((n-2*m-l)//2))
+                    ns.append(n)
+                    ls.append(l)
+                    coefficients.append(R)
+        _coefficients[D] = (np.array(coefficients), np.array(ns), np.array(ls))
+    return _coefficients[D]
+
+def _zernike(img, D, radius, coefficients, ns, ls):
+    cofy,cofx = MomentSet(img, 0).centroid
+    if np.isnan(cofy):
+        return np.zeros(len(ns))
+    # Only the pixels in the bounding box of the circle can be used
+    y0 = max(int(np.floor(cofy - radius)), 0)
+    x0 = max(int(np.floor(cofx - radius)), 0)
+    img = img[y0:int(np.ceil(cofy + radius))+1, x0:int(np.ceil(cofx + radius))+1]
+    ys,xs = np.nonzero(img > 0)
+    values = img[ys,xs].astype(np.float_)
+    ys += y0
+    xs += x0
+    yn = (ys - cofy)/radius
+    xn = (xs - cofx)/radius
+    rho = np.sqrt(xn*xn + yn*yn)
+    np.maximum(rho, 1e-9, rho)
+    inside = (rho <= 1.)
+    rho = rho[inside]
+    values = values[inside]
+    values /= values.sum()
+    # conj((x + iy)/rho) ** l and rho ** k for all the needed l & k
+    angle = (xn[inside] - 1j*yn[inside])/rho
+    angles = np.empty((len(rho), D+1), np.complex_)
+    rhos = np.empty((len(rho), D+1))
+    angles[:,0] = 1.
+    rhos[:,0] = values
+    for p in xrange(1,D+1):
+        angles[:,p] = angles[:,p-1] * angle
+        rhos[:,p] = rhos[:,p-1] * rho
+    # M[k,l] = sum(values * rho**k * conj(A)**l)
+    M = np.dot(rhos.T, angles)
+    return np.abs((coefficients * M[:,ls].T).sum(1) * (ns+1)/np.pi)
 
 def zernike(img,D,radius,scale):
     """
@@ -40,11 +97,27 @@ def zernike(img,D,radius,scale):
        * radius is used as the maximum radius for the Zernike polynomials.
        * scale is the scale of the image.
 
+    The polynomials are evaluated on the circle of the given radius around
+    the centre of mass of img (as mahotas.features.zernike_moments does).
+
     Reference: Teague, MR. (1980). Image Analysis via the General
       Theory of Moments.  J. Opt. Soc. Am. 70(8):920-930.
     """
-    return mahotas.zernike.zernike(img, D, radius/float(scale))
+    coefficients, ns, ls = _zernike_coefficients(D)
+    return _zernike(img, D, radius/float(scale), coefficients, ns, ls)
 
+def zernike_batch(imgs, D, radius, scale):
+    """
+    zvalues = zernike_batch(imgs, D, radius, scale)
+
+    Zernike moments of several images (e.g., of all the regions of a
+    field), so that zvalues[i] is zernike(imgs[i], D, radius, scale).
+    """
+    coefficients, ns, ls = _zernike_coefficients(D)
+    zvalues = np.empty((len(imgs), len(ns)))
+    for i,img in enumerate(imgs):
+        zvalues[i] = _zernike(img, D, radius/float(scale), coefficients, ns, ls)
+    return zvalues
 
 def znames(D,radius):
     """
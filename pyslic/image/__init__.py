@@ -23,5 +23,6 @@
 # send email to murphy@cmu.edu
 
 import io
-from image import Image, setshowimage, loadedimage
+from image import Image, setshowimage, loadedimage, prefetch
+from datacache import set_cache_size, cache_stats, clear_cache
 # vim: set ts=4 sts=4 sw=4 expandtab smartindent:
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2012  Murphy Lab
+# Carnegie Mellon University
+# 
+# Written by Luis Pedro Coelho <lpc@cmu.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License,
+# or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# For additional information visit http://murphylab.web.cmu.edu or
+# send email to murphy@cmu.edu
+
+from __future__ import division
+import threading
+import numpy as np
+
+__all__ = ['ImageDataCache', 'set_cache_size', 'cache_stats', 'clear_cache']
+
+class ImageDataCache(object):
+    '''
+    cache = ImageDataCache(max_bytes=0)
+
+    A least-recently-used cache of decoded channel arrays, keyed by filename
+    and load function, which holds at most max_bytes of data.
+
+    Cached arrays are shared between all the images which load the same file
+    and are, therefore, marked read-only. Memory mapped arrays are never
+    cached (they are cheap to reopen).
+
+    Attributes
+    ----------
+        * hits, misses, evictions: counters
+        * nbytes: total size of the cached arrays
+    '''
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        '''
+        cache.clear()
+
+        Removes all entries and resets the counters.
+        '''
+        self.data = {}
+        self.last_use = {}
+        self.tick = 0
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, fname, load_function):
+        '''
+        A = cache.load(fname, load_function)
+
+        Returns load_function(fname), using the cached version if present.
+        '''
+        if self.max_bytes <= 0:
+            return load_function(fname)
+        key = (fname, load_function)
+        self.lock.acquire()
+        try:
+            A = self.data.get(key)
+            if A is not None:
+                self.hits += 1
+                self.tick += 1
+                self.last_use[key] = self.tick
+                return A
+            self.misses += 1
+        finally:
+            self.lock.release()
+        A = load_function(fname)
+        if isinstance(A, np.memmap) or A.nbytes > self.max_bytes:
+            return A
+        A.flags.writeable = False
+        self.lock.acquire()
+        try:
+            if key not in self.data:
+                self.data[key] = A
+                self.nbytes += A.nbytes
+            self.tick += 1
+            self.last_use[key] = self.tick
+            self._evict(self.max_bytes)
+        finally:
+            self.lock.release()
+        return A
+
+    def _evict(self, max_bytes):
+        if self.nbytes <= max_bytes:
+            return
+        for _,key in sorted((t,k) for k,t in self.last_use.iteritems()):
+            if self.nbytes <= max_bytes:
+                break
+            self.nbytes -= self.data.pop(key).nbytes
+            del self.last_use[key]
+            self.evictions += 1
+
+    def set_max_bytes(self, max_bytes):
+        '''
+        cache.set_max_bytes(max_bytes)
+
+        Change the size of the cache (evicting entries if needed).
+        Set to 0 to disable caching.
+        '''
+        self.lock.acquire()
+        try:
+            self.max_bytes = max_bytes
+            self._evict(max(max_bytes, 0))
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        '''
+        stats = cache.stats()
+
+        Returns a dictionary with the counters and current size of the cache.
+        '''
+        return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'evictions' : self.evictions,
+            'nbytes' : self.nbytes,
+            'entries' : len(self.data),
+            'max_bytes' : self.max_bytes,
+            }
+
+_cache = ImageDataCache()
+
+def set_cache_size(max_bytes):
+    '''
+    set_cache_size(max_bytes)
+
+    Sets the size of the global cache of decoded channel data used by
+    Image.load() and Image.get(). By default it is 0, i.e., caching is
+    disabled.
+
+    With caching enabled, the same file is decoded only once while it stays
+    in the cache (e.g., when a collection is iterated over by
+    preprocess_collection and then by computefeatures). Channel arrays
+    returned by the cache are read-only.
+    '''
+    _cache.set_max_bytes(max_bytes)
+
+def cache_stats():
+    '''
+    stats = cache_stats()
+
+    Returns the counters of the global channel data cache (see ImageDataCache.stats).
+    '''
+    return _cache.stats()
+
+def clear_cache():
+    '''
+    clear_cache()
+
+    Empties the global channel data cache and resets its counters.
+    '''
+    _cache.lock.acquire()
+    try:
+        _cache.clear()
+    finally:
+        _cache.lock.release()
+
+# vim: set ts=4 sts=4 sw=4 expandtab smartindent:
@@ -22,17 +22,26 @@
 # For additional information visit http://murphylab.web.cmu.edu or
 # send email to murphy@cmu.edu
 
-from __future__ import division
+from __future__ import division, with_statement
 import numpy
 from contextlib import contextmanager
+from collections import deque
 import mahotas
+from . import datacache
 
-__all__ = ['Image', 'setshowimage','loadedimage']
+__all__ = ['Image', 'setshowimage','loadedimage','prefetch']
 
 def _open_file_bw(fname):
     """
     Force a file to be B&W
+
+    Files in numpy's .npy format are returned as read-only memory maps.
     """
+    if fname.endswith('.npy'):
+        A = numpy.load(fname, mmap_mode='r')
+        if A.ndim == 3:
+            A = A.max(2)
+        return A
     try:
         from mahotas import imread
     except OSError:
@@ -74,6 +83,54 @@ def loadedimage(img):
     if not wasloaded:
         img.unload()
 
+def prefetch(images, depth=2):
+    '''
+    for img in prefetch(images, depth=2):
+        ...
+
+    Iterates over images, loading the next `depth` images on background
+    threads while the current one is being processed.
+
+    Like loadedimage, each image is unloaded once the loop moves on to the
+    next one (unless it was already loaded). This works with any function
+    which calls lazy_load() or uses loadedimage(), for example::
+
+        for img in prefetch(imgs):
+            labeled = watershed_segment(img)
+
+    See also the prefetch argument of computefeatures and preprocess_collection.
+    '''
+    if depth <= 0:
+        for img in images:
+            with loadedimage(img):
+                yield img
+        return
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(depth)
+    pending = deque()
+    images = iter(images)
+    def submit():
+        for img in images:
+            pending.append((img, img.loaded, pool.apply_async(img.lazy_load)))
+            return
+    try:
+        for i in xrange(depth):
+            submit()
+        while pending:
+            img,wasloaded,loading = pending.popleft()
+            submit()
+            loading.get()
+            yield img
+            if not wasloaded:
+                img.unload()
+    finally:
+        pool.close()
+        for img,wasloaded,loading in pending:
+            loading.wait()
+            if not wasloaded:
+                img.unload()
+        pool.join()
+
 class Image(object):
     """
     Represents a multi-channel image.
@@ -92,6 +149,7 @@ class Image(object):
 
         * loaded: Boolean, whether the image has been loaded.
         * load_function: a function that takes a filename and returns an array.
+            Loading goes through the channel data cache (see set_cache_size).
         * post_load: a list of functions that are called post-loading. They are called with self as their single argument.
             This is useful for implementing normalisation, for example.
                 
@@ -179,20 +237,25 @@ class Image(object):
         for k,v in self.channels.items():
             if k != 'crop': # Crop is called "regions"
                 if type(v) == list:
-                    self.channeldata[k]=[]
-                    for f in v:
-                        self.channeldata[k].append(self.load_function(f))
-                    self.channeldata[k]=numpy.array(self.channeldata[k])
+                    first = self._load_file(v[0])
+                    stack = numpy.empty((len(v),)+first.shape, first.dtype)
+                    stack[0] = first
+                    for i,f in enumerate(v[1:]):
+                        stack[i+1] = self._load_file(f)
+                    self.channeldata[k]=stack
                 else:
-                    self.channeldata[k]=self.load_function(v)
+                    self.channeldata[k]=self._load_file(v)
         if 'crop' in self.channels:
-            self.regions = self.load_function(self.channels['crop'])
+            self.regions = self._load_file(self.channels['crop'])
             # These files often need to be fixed 
             self.regions,_ = mahotas.label(self.regions)
         self.loaded = True
         for post in self.post_load:
             post(self)
 
+    def _load_file(self, fname):
+        return datacache._cache.load(fname, self.load_function)
+
     def unload(self):
         '''
         Unloads the channel data
@@ -224,7 +287,7 @@ class Image(object):
             self.lazy_load()
         if channelid in self.channeldata:
             return self.channeldata[channelid]
-        return self.load_function(self.channels[channelid])
+        return self._load_file(self.channels[channelid])
 
     def composite(self, idx = 0, processed = False):
         '''
@@ -24,8 +24,10 @@
 
 from readtjz import readtjz_recursive, readtjz
 from ksr import read_ksr_dir, detect_ksr_dir
-from ic100 import detect_ic100dir, read_ic100dir
-from read_cellomics_dib import read_cellomics_dib
+from ic100 import detect_ic100dir, read_ic100dir, read_ic100_BMPs, read_ic100_well
+from read_cellomics_dib import read_cellomics_dib, read_cellomics_dibs
+from .npy import read_npy, use_npy_sidecars
 from .tiff_pairs import read_tiff_pairs_dir
 import dirtransversal
 from .autoload import auto_detect_load
+from .dirindex import DirIndex
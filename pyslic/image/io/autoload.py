@@ -28,16 +28,28 @@ from ic100 import *
 from ksr import *
 from readtjz import *
 from tiff_pairs import *
+from dirindex import DirIndex
 
-def auto_detect_load(basedir):
+def auto_detect_load(basedir, manifest=None, threads=None):
     '''
-    imgs = auto_detect_load(basedir)
+    imgs = auto_detect_load(basedir, manifest=None, threads=None)
 
     Auto-detect the type of directory and load
     images from it.
 
     Returns None if it cannot read the directory
 
+    The directory tree is listed only once and the listing is shared between
+    the detection and reading functions (see DirIndex).
+
+    Parameters
+    ----------
+        * manifest: file in which to save the listing of the directory tree.
+                If it exists, directories which have not changed since it
+                was saved are not listed again.
+        * threads: if given, list the whole tree upfront using this number
+                of threads (faster on network filesystems)
+
     Currently supported:
     --------------------
         * dirtransversal
@@ -46,17 +58,24 @@ def auto_detect_load(basedir):
         * TJZ containing directory
         * TIFF pairs directory
     '''
-    if detect_dirtransversal(basedir):
-        return dirtransversal(basedir)
-    if detect_ic100dir_flat(basedir):
-        return read_ic100dir_flat(basedir)
-    if detect_ic100dir(basedir):
-        return read_ic100dir(basedir)
-    if detect_ksr_dir(basedir):
-        return read_ksr_dir(basedir)
-    if detect_tjzdir(basedir):
-        return readtjz_recursive(basedir)
-    if detect_tiff_pairs(basedir):
-        return read_tiff_pairs_dir(basedir)
-    return None
+    index = DirIndex(basedir, manifest)
+    if threads is not None:
+        index.scan(threads)
+    try:
+        if detect_dirtransversal(basedir, index=index):
+            return dirtransversal(basedir, index=index)
+        if detect_ic100dir_flat(basedir, index=index):
+            return read_ic100dir_flat(basedir, index=index)
+        if detect_ic100dir(basedir, index=index):
+            return read_ic100dir(basedir, index=index)
+        if detect_ksr_dir(basedir, index=index):
+            return read_ksr_dir(basedir, index=index)
+        if detect_tjzdir(basedir, index=index):
+            return readtjz_recursive(basedir, index=index)
+        if detect_tiff_pairs(basedir, index=index):
+            return read_tiff_pairs_dir(basedir, index=index)
+        return None
+    finally:
+        if manifest is not None:
+            index.save(manifest)
 # vim: set ts=4 sts=4 sw=4 expandtab smartindent:
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2012  Murphy Lab
+# Carnegie Mellon University
+# 
+# Written by Luis Pedro Coelho <lpc@cmu.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License,
+# or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# For additional information visit http://murphylab.web.cmu.edu or
+# send email to murphy@cmu.edu
+
+
+from __future__ import division
+import os
+import re
+import time
+import fnmatch
+import cPickle as pickle
+
+__all__ = ['DirIndex', 'get_index']
+
+try:
+    _scandir = os.scandir
+except AttributeError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
+_FILE, _DIR, _LINKDIR = 0, 1, 2
+_manifest_version = 1
+_magic = re.compile('[*?[]')
+
+def _scan(path):
+    '''
+    entries = _scan(path)
+
+    Returns a list of (name, kind) for the entries in directory path (in the
+    same order as os.listdir), where kind is one of _FILE, _DIR or _LINKDIR
+    (a symbolic link to a directory).
+    '''
+    entries = []
+    if _scandir is not None:
+        for e in _scandir(path):
+            if e.is_dir():
+                entries.append((e.name, (_LINKDIR if e.is_symlink() else _DIR)))
+            else:
+                entries.append((e.name, _FILE))
+        return entries
+    for name in os.listdir(path):
+        p = os.path.join(path, name)
+        if os.path.isdir(p):
+            entries.append((name, (_LINKDIR if os.path.islink(p) else _DIR)))
+        else:
+            entries.append((name, _FILE))
+    return entries
+
+class DirIndex(object):
+    '''
+    index = DirIndex(basedir, manifest=None)
+
+    Index of the directory tree below basedir.
+
+    Each directory is listed (using os.scandir when available) at most once,
+    the first time it is used, so that the functions which detect and read
+    the different directory formats can share a single scan of the tree.
+
+    The index can be saved to a manifest file (see `save`). When a manifest
+    is given, directories whose modification time has not changed are not
+    listed again, which makes re-scanning an unchanged tree a matter of one
+    stat() per directory.
+
+    The methods mirror the functions in os, os.path & glob.
+    '''
+    def __init__(self, basedir, manifest=None):
+        self.basedir = basedir
+        self.dirs = {}
+        self.kinds = {}
+        self.manifest = {}
+        if manifest is not None and os.path.exists(manifest):
+            input = file(manifest, 'rb')
+            try:
+                try:
+                    version,dirs = pickle.load(input)
+                    if version == _manifest_version:
+                        self.manifest = dirs
+                except (EOFError, ValueError, TypeError, pickle.UnpicklingError):
+                    pass
+            finally:
+                input.close()
+
+    def _entries(self, path):
+        path = os.path.abspath(path)
+        entries = self.dirs.get(path)
+        if entries is None:
+            mtime = os.stat(path).st_mtime
+            saved = self.manifest.get(path)
+            if saved is not None and saved[0] == mtime:
+                entries = saved[1]
+            else:
+                entries = _scan(path)
+            self.dirs[path] = entries
+            self.kinds[path] = dict(entries)
+            self.manifest[path] = (mtime, entries)
+        return entries
+
+    def _kind(self, path):
+        parent,name = os.path.split(os.path.abspath(path))
+        if not name:
+            return (_DIR if os.path.isdir(path) else None)
+        try:
+            self._entries(parent)
+        except OSError:
+            return None
+        return self.kinds[os.path.abspath(parent)].get(name)
+
+    def listdir(self, path):
+        '''
+        names = index.listdir(path)
+
+        Equivalent to os.listdir(path)
+        '''
+        return [n for n,_ in self._entries(path)]
+
+    def exists(self, path):
+        '''
+        Equivalent to os.path.lexists(path)
+        '''
+        return self._kind(path) is not None
+
+    def isdir(self, path):
+        '''
+        Equivalent to os.path.isdir(path)
+        '''
+        return self._kind(path) in (_DIR, _LINKDIR)
+
+    def glob(self, pattern):
+        '''
+        names = index.glob(pattern)
+
+        Equivalent to glob.glob(pattern)
+        '''
+        dirname,basename = os.path.split(pattern)
+        if not _magic.search(pattern):
+            if basename:
+                if self.exists(pattern):
+                    return [pattern]
+            elif self.isdir(dirname):
+                return [pattern]
+            return []
+        if not dirname:
+            return self._glob1(os.curdir, basename)
+        if dirname != pattern and _magic.search(dirname):
+            dirs = self.glob(dirname)
+        else:
+            dirs = [dirname]
+        results = []
+        for dirname in dirs:
+            if _magic.search(basename):
+                names = self._glob1(dirname, basename)
+            elif (self.isdir(dirname) if basename == '' else self.exists(os.path.join(dirname, basename))):
+                names = [basename]
+            else:
+                names = []
+            results.extend([os.path.join(dirname, name) for name in names])
+        return results
+
+    def _glob1(self, dirname, pattern):
+        try:
+            names = self.listdir(dirname or os.curdir)
+        except OSError:
+            return []
+        if pattern[0] != '.':
+            names = [n for n in names if n[0] != '.']
+        return fnmatch.filter(names, pattern)
+
+    def walk(self, top):
+        '''
+        for root,dirs,files in index.walk(top):
+            ...
+
+        Equivalent to os.walk(top)
+        '''
+        try:
+            entries = self._entries(top)
+        except OSError:
+            return
+        dirs = [n for n,k in entries if k != _FILE]
+        files = [n for n,k in entries if k == _FILE]
+        yield top, dirs, files
+        kinds = self.kinds[os.path.abspath(top)]
+        for d in dirs:
+            if kinds.get(d) == _DIR:
+                for res in self.walk(os.path.join(top, d)):
+                    yield res
+
+    def scan(self, threads=None):
+        '''
+        index.scan(threads=None)
+
+        Lists the whole tree below basedir now (instead of when each directory
+        is first used). If threads > 1, several directories are listed in
+        parallel, which is much faster on network filesystems.
+        '''
+        pool = None
+        if threads is not None and threads > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(threads)
+        def subdirs(path):
+            try:
+                entries = self._entries(path)
+            except OSError:
+                return []
+            return [os.path.join(path, n) for n,k in entries if k == _DIR]
+        try:
+            level = [self.basedir]
+            while level:
+                if pool is not None:
+                    children = pool.map(subdirs, level)
+                else:
+                    children = map(subdirs, level)
+                level = [d for ds in children for d in ds]
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def save(self, manifest):
+        '''
+        index.save(manifest)
+
+        Saves the directories listed so far to file manifest, which can be
+        passed to the constructor later.
+        '''
+        # Directories modified in the last few seconds are not saved: their
+        # modification time might not change if they change again (on
+        # filesystems with coarse timestamps).
+        recent = time.time() - 2
+        dirs = dict((p,v) for p,v in self.manifest.iteritems() if v[0] < recent)
+        tmp = '%s.%s.tmp' % (manifest, os.getpid())
+        output = file(tmp, 'wb')
+        try:
+            pickle.dump((_manifest_version, dirs), output, pickle.HIGHEST_PROTOCOL)
+        finally:
+            output.close()
+        os.rename(tmp, manifest)
+
+def get_index(basedir, index=None):
+    '''
+    index = get_index(basedir, index=None)
+
+    Returns index if it is not None or a new DirIndex(basedir) otherwise.
+    '''
+    if index is None:
+        return DirIndex(basedir)
+    return index
+
+# vim: set ts=4 sts=4 sw=4 expandtab smartindent:
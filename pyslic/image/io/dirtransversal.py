@@ -25,26 +25,29 @@
 from __future__ import division
 from collections import defaultdict
 import os.path
-from os.path import isdir
 from ..image import Image
+from .dirindex import get_index
 
 __all__ = ['loadimages','detect_dirtransversal','dirtransversal']
 
 def _validfilename(f):
     return f.endswith('.png') or f.endswith('.tif') or f.endswith('.bmp')
 
-def detect_dirtransversal(startdir):
+def detect_dirtransversal(startdir, index=None):
     '''
-    is_dirtransversal = detect_dirtransversal(startdir)
+    is_dirtransversal = detect_dirtransversal(startdir, index=None)
 
     Returns true if startdir seems like the start of a dirtransversal
     directory.
+
+    index is an optional DirIndex of startdir.
     '''
+    index = get_index(startdir, index)
     count_pos = 0
-    for d in os.listdir(startdir):
+    for d in index.listdir(startdir):
         d = os.path.join(startdir,d)
-        if isdir(d):
-            subs = os.listdir(d)
+        if index.isdir(d):
+            subs = index.listdir(d)
             if not 'prot' in subs:
                 return False
             for sub in subs:
@@ -52,9 +55,9 @@ def detect_dirtransversal(startdir):
             count_pos += 1
     return bool(count_pos)
 
-def dirtransversal(startdir):
+def dirtransversal(startdir, index=None):
     """
-    images = loadimages(startdir)
+    images = loadimages(startdir, index=None)
 
     Load images which are stored in files below directory startdir
     This function expects a directory structure like:
@@ -75,8 +78,11 @@ def dirtransversal(startdir):
                 ...
         class2/
             ....
+
+    index is an optional DirIndex of startdir.
     """
     assert type(startdir) is not unicode, 'pyslic.image.io.dirtransversal does not work with unicode input' # The problem is that it creates images with unicode paths which cannot be loaded!
+    index = get_index(startdir, index)
     images = []
     labelcount = defaultdict(int)
     def _loadimage(d,dna,prot,crop):
@@ -90,15 +96,15 @@ def dirtransversal(startdir):
         if crop:
             res.channels['crop']= os.path.abspath(os.path.join(startdir,d,'crop',crop))
         return res
-    for d in sorted(os.listdir(startdir)):
-        if not isdir(os.path.join(startdir,d)): continue
-        D = os.listdir(os.path.join(startdir,d,'dna'))
+    for d in sorted(index.listdir(startdir)):
+        if not index.isdir(os.path.join(startdir,d)): continue
+        D = index.listdir(os.path.join(startdir,d,'dna'))
         D.sort()
-        P = os.listdir(startdir+'/'+d+'/prot')
+        P = index.listdir(startdir+'/'+d+'/prot')
         P.sort()
         C = None
-        if isdir(os.path.join(startdir,d,'crop')):
-            C = os.listdir(os.path.join(startdir,d,'crop'))
+        if index.isdir(os.path.join(startdir,d,'crop')):
+            C = index.listdir(os.path.join(startdir,d,'crop'))
             C.sort()
 
         Di,Pi,Ci = 0,0,0
@@ -25,95 +25,156 @@
 
 from __future__ import division
 import numpy
+import struct
 from ..image import Image
+from .dirindex import get_index
+from .pixels import read_pixels
 import os
-from glob import glob
 import re
 from collections import defaultdict
-from os.path import exists, abspath
+from os.path import abspath
 import random
 
-def detect_ic100dir(basedir):
+def detect_ic100dir(basedir, index=None):
     '''
-    is_ic100_dir = detect_ic100dir(basedir)
+    is_ic100_dir = detect_ic100dir(basedir, index=None)
 
     Returns True if basedir looks like a IC100 basedir
+
+    index is an optional DirIndex of basedir.
     '''
-    return exists('%s/tables' % basedir) and exists('%s/ProtocolArchive' % basedir)
+    index = get_index(basedir, index)
+    return index.exists('%s/tables' % basedir) and index.exists('%s/ProtocolArchive' % basedir)
+
+# See http://en.wikipedia.org/wiki/BMP_file_format
+# magick, size, reserved, reserved, offset, [DIB header:] hsize, width,
+# height, planes, bitsppixel, compression, imgsize, hres, vres, colours,
+# importantcolours
+_bmp_header = struct.Struct('<2sIHHIIIIHHIIIIII')
 
-def read_ic100_BMP(input):
+def _read_bmp_header(input):
+    try:
+        magick,_,_,_,offset,hsize,width,height,_,bitsppixel,_,_,_,_,_,_ = \
+                _bmp_header.unpack(input.read(_bmp_header.size))
+    except struct.error:
+        raise IOError("Cannot load image '%s' (truncated header)" % input)
+    if magick != 'BM': raise IOError, 'read_ic100_BMP: Unknown file format'
+    if hsize != 40:
+        raise IOError, 'Header size is not 40'
+    if bitsppixel == 8:
+        dtype = numpy.dtype(numpy.uint8)
+    elif bitsppixel == 16:
+        dtype = numpy.dtype('<H')
+    else:
+        raise IOError, 'Bits per pixel is not 8 or 16'
+    return offset, (height,width), dtype
+
+def read_ic100_BMP(input, mmap=False):
     '''
-    img = read_ic100_BMP(file_or_filename)
+    img = read_ic100_BMP(file_or_filename, mmap=False)
 
     Reads a BMP from the IC100. If it's 8-bits, then this is just the traditional
     Windows BMP format. However, 16-bit grey-scale BMPs are not correctly handled by
     traditional software and are handled by our code.
 
+    If mmap is True and input is a filename, the pixels are not read, but
+    returned as a read-only numpy.memmap.
+
     Reference: http://en.wikipedia.org/wiki/BMP_file_format
     '''
+    fname = input
     def do_close(): pass
     if type(input) == str:
-        input=file(input)
+        input=file(input, 'rb')
         do_close = input.close
     try:
-        def get2():
-            S=input.read(2)
-            return ord(S[0])+(ord(S[1])<<8)
-        def get4():
-            S=input.read(4)
-            return ord(S[0])+(ord(S[1])<<8)+(ord(S[2])<<16)+(ord(S[3])<<24)
-
-        # See http://en.wikipedia.org/wiki/BMP_file_format
-        magick = input.read(2)
-        if magick != 'BM': raise IOError, 'read_ic100_BMP: Unknown file format'
-        size=get4()
-        get2()
-        get2()
-        offset=get4()
-        hsize=get4()
-        width=get4()
-        height=get4()
-        planes=get2()
-        bitsppixel=get2()
-        compression=get4()
-        imgsize=get4()
-        hres=get4()
-        vres=get4()
-        colours=get4()
-        importantcolours=get4()
-
-        # I don't actually know what the 12 bytes are, but it seems it is some
-        # additional header which is safe to ignore
-        if hsize != 40:
-            raise IOError, 'Header size is not 40'
-        if bitsppixel == 8:
-            img = numpy.empty((height,width),numpy.uint8)
-        elif bitsppixel == 16:
-            img = numpy.empty((height,width),numpy.dtype('<H'))
+        # input may be a file object which does not start at the beginning
+        start = input.tell()
+        offset,shape,dtype = _read_bmp_header(input)
+        if mmap and type(fname) == str:
+            img = numpy.memmap(fname, dtype, mode='r', offset=offset, shape=shape)
         else:
-            raise IOError, 'Bits per pixel is not 8 or 16'
-        input.seek(offset)
-        img.data[:] = input.read() # This is very fast
+            img = read_pixels(input, start+offset, shape, dtype)
         # The scan order needs to be fixed
         return img[::-1,:]
-    except TypeError:
-        raise IOError("Cannot load image '%s' (TypeError)" % input)
     finally:
         do_close()
 
-def read_ic100dir(basedir):
+def read_ic100_BMPs(fnames):
+    '''
+    imgs = read_ic100_BMPs(fnames)
+
+    Reads several IC100 BMPs of the same size and type (e.g., all the
+    fields of a channel in a well) into a single array, so that
+    imgs[i] is read_ic100_BMP(fnames[i]).
+    '''
+    imgs = None
+    for i,fname in enumerate(fnames):
+        input = file(fname, 'rb')
+        try:
+            offset,shape,dtype = _read_bmp_header(input)
+            if imgs is None:
+                imgs = numpy.empty((len(fnames),)+shape, dtype)
+            elif imgs.shape[1:] != shape or imgs.dtype != dtype:
+                raise IOError("read_ic100_BMPs: '%s' differs in size or type from '%s'" % (fname, fnames[0]))
+            read_pixels(input, offset, shape, dtype, imgs[i])
+        finally:
+            input.close()
+    if imgs is None:
+        return numpy.empty((0,0,0), numpy.uint8)
+    return imgs[:,::-1,:]
+
+def read_ic100_well(welldir, index=None):
+    '''
+    channels = read_ic100_well(welldir, index=None)
+
+    Reads all the images of a well in an IC100 directory (i.e., one of
+    the tables/well_* directories).
+
+    Returns a dictionary channel name -> array of fields, where channel name
+    is one of 'dna', 'protein' or 'autofluorescence'.
+
+    index is an optional DirIndex of welldir.
     '''
-    imgs = read_ic100dir(basedir)
+    index = get_index(welldir, index)
+    channels = {}
+    for i,ch in enumerate(_channels):
+        fnames = index.glob('%s/channel_%s/*.bmp' % (welldir, i))
+        fnames.sort()
+        channels[ch] = read_ic100_BMPs(fnames)
+    return channels
+
+def read_ic100_BMP_mmap(input):
+    '''
+    img = read_ic100_BMP_mmap(filename)
+
+    Equivalent to read_ic100_BMP(filename, mmap=True)
+    '''
+    return read_ic100_BMP(input, mmap=True)
+
+def _bmploader(mmap):
+    if mmap:
+        return read_ic100_BMP_mmap
+    return read_ic100_BMP
+
+def read_ic100dir(basedir, mmap=False, index=None):
+    '''
+    imgs = read_ic100dir(basedir, mmap=False, index=None)
 
     Read IC100 output starting on basedir
+
+    If mmap is True, the images will be loaded as read-only memory maps.
+
+    index is an optional DirIndex of basedir.
     '''
     assert type(basedir) is not unicode, 'pyslic.image.io.read_ic100dir does not work with unicode input' # The problem is that it creates images with unicode paths which cannot be loaded!
+    index = get_index(basedir, index)
     imgs=[]
-    wells=glob('%s/tables/well_*' % basedir)
+    wells=index.glob('%s/tables/well_*' % basedir)
     for well in wells:
-        channel_0=glob('%s/channel_0/*.bmp' % well)
-        channel_1=glob('%s/channel_1/*.bmp' % well)
-        channel_2=glob('%s/channel_2/*.bmp' % well)
+        channel_0=index.glob('%s/channel_0/*.bmp' % well)
+        channel_1=index.glob('%s/channel_1/*.bmp' % well)
+        channel_2=index.glob('%s/channel_2/*.bmp' % well)
         channel_0.sort()
         channel_1.sort()
         channel_2.sort()
@@ -121,7 +182,7 @@ def read_ic100dir(basedir):
         wellpat=re.compile('well__([A-Z])___?([0-9]{1,2})')
         for i,c0,c1,c2 in zip(xrange(len(channel_0)),channel_0,channel_1,channel_2):
             img=Image()
-            img.load_function=read_ic100_BMP
+            img.load_function=_bmploader(mmap)
             img.channels['dna']=c0
             img.channels['protein']=c1
             img.channels['autofluorescence']=c2
@@ -136,14 +197,16 @@ def read_ic100dir(basedir):
 _flat_pat = re.compile(r'(^|/)[0-9]{5,8}[A-Z_]+[0-9]__([A-H])___?([0-9]{1,2})_T_001_ch_0([012])_image_0+([1-9][0-9]?)_Z_001\.bmp$')
 _channels = ('dna','protein','autofluorescence')
 
-def detect_ic100dir_flat(basedir):
+def detect_ic100dir_flat(basedir, index=None):
     '''
-    is_flat_ic100dir = detect_ic100dir_flat(basedir)
+    is_flat_ic100dir = detect_ic100dir_flat(basedir, index=None)
 
     Returns whether it seems like read_ic100dir_flat can
     parse the structure of basedir.
+
+    index is an optional DirIndex of basedir.
     '''
-    bmps = glob(basedir+'/*.bmp')
+    bmps = get_index(basedir, index).glob(basedir+'/*.bmp')
     if not bmps: return False
     random.shuffle(bmps)
     for b in bmps[:2+len(bmps)//10]:
@@ -151,14 +214,18 @@ def detect_ic100dir_flat(basedir):
             return True
     return False
 
-def read_ic100dir_flat(basedir):
+def read_ic100dir_flat(basedir, mmap=False, index=None):
     '''
-    imgs = read_ic100dir_flat(basedir)
+    imgs = read_ic100dir_flat(basedir, mmap=False, index=None)
 
     Read images from IC100 flat directory.
+
+    If mmap is True, the images will be loaded as read-only memory maps.
+
+    index is an optional DirIndex of basedir.
     '''
     wellfiles = defaultdict(dict)
-    for name in glob(basedir+'/*.bmp'):
+    for name in get_index(basedir, index).glob(basedir+'/*.bmp'):
         match = _flat_pat.search(name)
         if match is not None:
             _,wellrow,wellcol,channelnr,imageid = match.groups()
@@ -172,7 +239,7 @@ def read_ic100dir_flat(basedir):
             img.channels[ch] = abspath(f)
         img.id = (well,idx)
         img.label = well
-        img.load_function = read_ic100_BMP
+        img.load_function = _bmploader(mmap)
         images.append(img)
     images.sort(key=(lambda img: img.id))
     return images
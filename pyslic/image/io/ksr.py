@@ -28,19 +28,22 @@ import os.path
 import os
 import sys
 from ..image import Image
-from .read_cellomics_dib import read_cellomics_dib
+from .dirindex import get_index
+from .read_cellomics_dib import read_cellomics_dib, read_cellomics_dib_mmap
 from warnings import warn
 
 __all__ = ['read_ksr_dir','read_ksrdir','detect_ksrdir', 'detect_ksr_dir']
 _ksrpat=re.compile('KSR_.*t([0-9]+)([A-H][0-9]{1,2})f([0-9]+)d([0-9])\.(tif|TIF|DIB|dib)')
 
-def detect_ksrdir(dir):
+def detect_ksrdir(dir, index=None):
     '''
-    is_ksrdir = detect_ksrdir(dir)
+    is_ksrdir = detect_ksrdir(dir, index=None)
 
     Returns true if the directory seems to contain ksr files
+
+    index is an optional DirIndex of dir.
     '''
-    files = os.listdir(dir)
+    files = get_index(dir, index).listdir(dir)
     if not files:
         return False
     f = files[0]
@@ -56,15 +59,19 @@ def _fixlabel(L):
         return L[0]+L[2]
     return L
 
-def read_ksrdir(dir):
+def read_ksrdir(dir, mmap=False, index=None):
     '''
-    images = read_ksrdir(dirname)
+    images = read_ksrdir(dirname, mmap=False, index=None)
 
     Read all the files in dirname and return them as a dictionary:
         (WellName, FieldNr) -> Image
+
+    If mmap is True, DIB files will be loaded as read-only memory maps.
+
+    index is an optional DirIndex of dirname.
     '''
     assert type(dir) is not unicode, 'pyslic.image.io.read_ksrdir does not work with unicode input' # The problem is that it creates images with unicode paths which cannot be loaded!
-    files = os.listdir(dir)
+    files = get_index(dir, index).listdir(dir)
     channelcode = { 1 : 'dna', 2 : 'protein', 3 : 'autofl' }
     images={}
     multi_Ts = False
@@ -93,7 +100,7 @@ def read_ksrdir(dir):
         # If there's a DIB and a TIFF, take the DIB!
         # The logic below is simplified, but it works for our dataset:
         if isdib:
-            img.load_function = read_cellomics_dib
+            img.load_function = (read_cellomics_dib_mmap if mmap else read_cellomics_dib)
         if (channelcode[int(Channel)] not in img.channels) or isdib:
             img.channels[channelcode[int(Channel)]]=os.path.abspath(os.path.join(dir,f))
     return list(images.values())
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2012  Murphy Lab
+# Carnegie Mellon University
+# 
+# Written by Luis Pedro Coelho <lpc@cmu.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License,
+# or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# For additional information visit http://murphylab.web.cmu.edu or
+# send email to murphy@cmu.edu
+
+from __future__ import division
+import os
+import numpy as np
+
+__all__ = ['read_npy', 'npy_sidecar', 'write_npy_sidecar', 'use_npy_sidecars']
+
+def read_npy(fname):
+    '''
+    img = read_npy(fname)
+
+    Returns the array saved in fname (in numpy's .npy format) as a read-only
+    numpy.memmap.
+    '''
+    return np.load(fname, mmap_mode='r')
+
+def npy_sidecar(fname):
+    '''
+    sidecar = npy_sidecar(fname)
+
+    Name of the raw .npy file which holds the decoded pixels of fname
+    '''
+    return fname + '.npy'
+
+def write_npy_sidecar(fname, load_function):
+    '''
+    sidecar = write_npy_sidecar(fname, load_function)
+
+    Decodes fname (using load_function) and saves it in its .npy sidecar.
+    '''
+    sidecar = npy_sidecar(fname)
+    tmp = sidecar + '.tmp'
+    output = file(tmp, 'wb')
+    try:
+        np.save(output, np.ascontiguousarray(load_function(fname)))
+    finally:
+        output.close()
+    os.rename(tmp, sidecar)
+    return sidecar
+
+def use_npy_sidecars(img, create=True):
+    '''
+    use_npy_sidecars(img, create=True)
+
+    Switch img to loading its channels from raw .npy sidecar files as
+    read-only memory maps. This way, processes which work on the same image
+    share its data through the operating system's page cache.
+
+    If create is True, missing sidecars are written (decoding the channel
+    files with img.load_function). Otherwise, they must already exist.
+    '''
+    load_function = img.load_function
+    def sidecar(fname):
+        if create and not (os.path.exists(npy_sidecar(fname)) and
+                    os.path.getmtime(npy_sidecar(fname)) >= os.path.getmtime(fname)):
+            return write_npy_sidecar(fname, load_function)
+        return npy_sidecar(fname)
+    for ch,fname in img.channels.items():
+        if type(fname) == list:
+            img.channels[ch] = [sidecar(f) for f in fname]
+        else:
+            img.channels[ch] = sidecar(fname)
+    img.unload()
+    img.set_load_function(read_npy)
+
+# vim: set ts=4 sts=4 sw=4 expandtab smartindent:
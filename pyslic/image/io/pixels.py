@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2012  Murphy Lab
+# Carnegie Mellon University
+#
+# Written by Luis Pedro Coelho <lpc@cmu.edu>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License,
+# or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# For additional information visit http://murphylab.web.cmu.edu or
+# send email to murphy@cmu.edu
+
+
+from __future__ import division
+import numpy
+
+__all__ = ['read_pixels']
+
+def read_pixels(input, offset, shape, dtype, out=None):
+    '''
+    img = read_pixels(input, offset, shape, dtype, out=None)
+
+    Reads raw pixels of type dtype from the file object input, starting at
+    (absolute) offset, into out (or a new array of the given shape).
+
+    Raises IOError if the data is truncated.
+    '''
+    input.seek(offset)
+    if out is None:
+        out = numpy.empty(shape, dtype)
+    if type(input) == file:
+        n = input.readinto(out)
+    else:
+        data = input.read(out.nbytes)
+        n = len(data)
+        out.flat = numpy.frombuffer(data, out.dtype, n//out.dtype.itemsize)
+    if n != out.nbytes:
+        raise IOError("Cannot load image '%s' (truncated data)" % input)
+    return out
+
+# vim: set ts=4 sts=4 sw=4 expandtab smartindent:
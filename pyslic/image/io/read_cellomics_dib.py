@@ -24,10 +24,32 @@
 
 from __future__ import division
 import numpy
+import struct
+from .pixels import read_pixels
 
-__all__ = ['read_cellomics_dib']
+__all__ = ['read_cellomics_dib', 'read_cellomics_dib_mmap', 'read_cellomics_dibs']
 
-def read_cellomics_dib(input):
+# See http://en.wikipedia.org/wiki/BMP_file_format#Bitmap_information_.28DIB_header.29
+# hsize, width, height, planes, bitsppixel, compression, imgsize, hres, vres,
+# colours, importantcolours
+_dib_header = struct.Struct('<IIIHHIIIIII')
+# I don't actually know what the 12 bytes after the header are, but it seems
+# it is some additional header which is safe to ignore
+_dib_offset = _dib_header.size + 12
+
+def _read_dib_header(input):
+    try:
+        hsize,width,height,_,bitsppixel,_,_,_,_,_,_ = \
+                _dib_header.unpack(input.read(_dib_header.size))
+    except struct.error:
+        raise IOError("Cannot load image '%s' (truncated header)" % input)
+    if hsize != 40:
+        raise IOError, 'Header size is not 40'
+    if bitsppixel != 16:
+        raise IOError, 'Bits per pixel is not 16'
+    return (width,height)
+
+def read_cellomics_dib(input, mmap=False):
     '''
     Reads an image in Cellomics DIB format.
 
@@ -36,42 +58,59 @@ def read_cellomics_dib(input):
     Cellomics DIB format is slightly different than Window DIB format,
     as the data is 16-bit greyscale (as opposed to colour). Therefore,
     tools such as ImageMagick parse it incorrectly.
+
+    If mmap is True and input is a filename, the pixels are not read, but
+    returned as a read-only numpy.memmap.
     '''
 
+    fname = input
+    def do_close(): pass
     if type(input) == str:
-        input=file(input)
+        input=file(input, 'rb')
+        do_close = input.close
+    try:
+        # input may be a file object which does not start at the beginning
+        start = input.tell()
+        shape = _read_dib_header(input)
+        if mmap and type(fname) == str:
+            img=numpy.memmap(fname,numpy.dtype('<H'),mode='r',offset=_dib_offset,shape=shape)
+        else:
+            img=read_pixels(input, start+_dib_offset, shape, numpy.dtype('<H'))
+        # The scan order needs to be fixed
+        return img[::-1,:]
+    finally:
+        do_close()
 
-    def get2():
-        S=input.read(2)
-        return ord(S[0])+(ord(S[1])<<8)
-    def get4():
-        S=input.read(4)
-        return ord(S[0])+(ord(S[1])<<8)+(ord(S[2])<<16)+(ord(S[3])<<24)
+def read_cellomics_dibs(fnames):
+    '''
+    imgs = read_cellomics_dibs(fnames)
 
-    # See http://en.wikipedia.org/wiki/BMP_file_format#Bitmap_information_.28DIB_header.29
-    hsize=get4()
-    width=get4()
-    height=get4()
-    planes=get2()
-    bitsppixel=get2()
-    compression=get4()
-    imgsize=get4()
-    hres=get4()
-    vres=get4()
-    colours=get4()
-    importantcolours=get4()
+    Reads several Cellomics DIB images of the same size (e.g., all the fields
+    of a well) into a single array, so that imgs[i] is
+    read_cellomics_dib(fnames[i]).
+    '''
+    imgs = None
+    for i,fname in enumerate(fnames):
+        input = file(fname, 'rb')
+        try:
+            shape = _read_dib_header(input)
+            if imgs is None:
+                imgs = numpy.empty((len(fnames),)+shape, numpy.dtype('<H'))
+            elif imgs.shape[1:] != shape:
+                raise IOError("read_cellomics_dibs: '%s' differs in size from '%s'" % (fname, fnames[0]))
+            read_pixels(input, _dib_offset, shape, imgs.dtype, imgs[i])
+        finally:
+            input.close()
+    if imgs is None:
+        return numpy.empty((0,0,0), numpy.dtype('<H'))
+    return imgs[:,::-1,:]
 
-    # I don't actually know what the 12 bytes are, but it seems it is some
-    # additional header which is safe to ignore
-    input.read(12)
-    if hsize != 40:
-        raise IOError, 'Header size is not 40'
-    if bitsppixel != 16:
-        raise IOError, 'Bits per pixel is not 16'
-    img=numpy.zeros((width,height),numpy.dtype('<H'))
-    img.data[:]=input.read(2*width*height) # This is very fast
+def read_cellomics_dib_mmap(input):
+    '''
+    img = read_cellomics_dib_mmap(filename)
 
-    # The scan order needs to be fixed
-    return img[::-1,:]
+    Equivalent to read_cellomics_dib(filename, mmap=True)
+    '''
+    return read_cellomics_dib(input, mmap=True)
 
 # vim: set ts=4 sts=4 sw=4 expandtab smartindent:
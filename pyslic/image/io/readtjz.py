@@ -24,9 +24,65 @@
 
 from __future__ import division
 import os
+import threading
+import zipfile
 from ..image import Image
+from .dirindex import get_index
 
-__all__ = ['readtjz_recursive','readtjz', 'detect_tjzdir']
+__all__ = ['readtjz_recursive','readtjz', 'detect_tjzdir', 'read_all_stacks', 'close_zipfiles']
+
+# Pool of open ZipFile objects, so that the central directory of an archive
+# is parsed once and not once per slice. A ZipFile cannot be shared across a
+# fork (the file position is shared), so the pool belongs to a single process.
+_max_open = 16
+_pool_lock = threading.RLock()
+_pool_pid = None
+_pool = {}
+_pool_tick = 0
+
+def _zipfile(fname):
+    '''
+    Z = _zipfile(fname)
+
+    Returns an open ZipFile for fname from the pool. Must be called with
+    _pool_lock held (and Z should only be used while holding it).
+    '''
+    global _pool_pid, _pool_tick
+    if _pool_pid != os.getpid():
+        _pool.clear()
+        _pool_pid = os.getpid()
+    fname = os.path.abspath(fname)
+    st = os.stat(fname)
+    stamp = (st.st_mtime, st.st_size)
+    _pool_tick += 1
+    if fname in _pool:
+        Z,zstamp,_ = _pool[fname]
+        if zstamp == stamp:
+            _pool[fname] = (Z, zstamp, _pool_tick)
+            return Z
+        Z.close()
+        del _pool[fname]
+    Z = zipfile.ZipFile(fname)
+    while len(_pool) >= _max_open:
+        oldest = min(_pool, key=(lambda k: _pool[k][2]))
+        _pool.pop(oldest)[0].close()
+    _pool[fname] = (Z, stamp, _pool_tick)
+    return Z
+
+def close_zipfiles():
+    '''
+    close_zipfiles()
+
+    Closes all the zip files which readtjz keeps open.
+    '''
+    _pool_lock.acquire()
+    try:
+        if _pool_pid == os.getpid():
+            for Z,_,_ in _pool.itervalues():
+                Z.close()
+        _pool.clear()
+    finally:
+        _pool_lock.release()
 
 def getfileinsidezip(fname,inner):
     '''
@@ -34,11 +90,18 @@ def getfileinsidezip(fname,inner):
 
     Returns the contents of the file inner inside the zip file zipname
     '''
-    import zipfile
-    Z=zipfile.ZipFile(fname)
-    S=Z.read(inner)
-    Z.close()
-    return S
+    _pool_lock.acquire()
+    try:
+        return _zipfile(fname).read(inner)
+    finally:
+        _pool_lock.release()
+
+def _decode(S):
+    from mahotas.freeimage import imreadfromblob
+    img = imreadfromblob(S)
+    if len(img.shape) > 2:
+        return img.mean(2)
+    return img
 
 def _getimage(fname,inner):
     '''
@@ -46,12 +109,7 @@ def _getimage(fname,inner):
 
     Reads an image inside a zip file
     '''
-    from mahotas.freeimage import imreadfromblob
-    S = getfileinsidezip(fname,inner)
-    img = imreadfromblob(S)
-    if len(img.shape) > 2:
-        return img.mean(2)
-    return img
+    return _decode(getfileinsidezip(fname,inner))
 
 def readimageinzip(P):
     zip=os.path.dirname(P)
@@ -67,9 +125,8 @@ def _getlabel(T):
     else:
         return T
 
-def _parsedir(base):
-    from glob import glob
-    Tjzs=glob('%s/*000.flex.tjz' % base)
+def _parsedir(base, index):
+    Tjzs=index.glob('%s/*000.flex.tjz' % base)
     Tjzs.sort()
 
     images=[]
@@ -77,15 +134,41 @@ def _parsedir(base):
         images.extend(readtjz(t))
     return images
 
+def _stacks(path):
+    _pool_lock.acquire()
+    try:
+        names = _zipfile(path).namelist()
+    finally:
+        _pool_lock.release()
+    return sorted([inner for inner in names if inner.startswith('Stack-')])
+
+def read_all_stacks(path):
+    '''
+    stacks = read_all_stacks(path)
+
+    Reads all the slices ('Stack-00000', 'Stack-00001',...) inside the TJZ
+    file path at once.
+
+    Returns a list of arrays, in slice order (so that, as in readtjz, the
+    protein channel of the i-th image is stacks[2*i] and its DNA channel is
+    stacks[2*i+1]).
+    '''
+    _pool_lock.acquire()
+    try:
+        Z = _zipfile(path)
+        data = [Z.read(inner) for inner in _stacks(path)]
+    finally:
+        _pool_lock.release()
+    return [_decode(S) for S in data]
+
 def readtjz(path):
     '''
     images = readtjz(path)
 
     Returns all the images inside readtjz.
     '''
-    import zipfile
     images=[]
-    Nstacks=len(filter(lambda inner: inner.startswith('Stack-'),zipfile.ZipFile(path).namelist()))
+    Nstacks=len(_stacks(path))
     if (Nstacks % 2):
         import warnings
         warnings.warn('pyslic.image.io.readtjz: Nr of slices is not an even number.')
@@ -102,23 +185,26 @@ def readtjz(path):
         images.append(img)
     return images
 
-def readtjz_recursive(base):
+def readtjz_recursive(base, index=None):
     '''
-    images = readtjz_recursive(basedir)
+    images = readtjz_recursive(basedir, index=None)
 
     Look for all directories below basedir for TJZ files and return the images
     inside them.
 
+    index is an optional DirIndex of basedir.
+
     Returns a list of Image objects
     '''
+    index = get_index(base, index)
     images=[]
-    for root,_,_ in os.walk(base):
-        images.extend(_parsedir(root))
+    for root,_,_ in index.walk(base):
+        images.extend(_parsedir(root, index))
     return images
 
-def detect_tjzdir(base, max_files=512):
+def detect_tjzdir(base, max_files=512, index=None):
     '''
-    is_tjzdir = detect_tjzdir(basedir,max_files=512)
+    is_tjzdir = detect_tjzdir(basedir,max_files=512, index=None)
 
     Returns True if it seems like a directory of TJZ files.
 
@@ -127,9 +213,10 @@ def detect_tjzdir(base, max_files=512):
 
         * max_files: maximum number of files to look at before giving up.
                 Set to None for no maximum (default: 512)
+        * index: DirIndex of basedir (optional)
     '''
     cnt = 0
-    for root,_,files in os.walk(base):
+    for root,_,files in get_index(base, index).walk(base):
         for f in files:
             cnt += 1
             if f.endswith('.tzj'):
@@ -23,10 +23,11 @@
 # send email to murphy@cmu.edu
 
 from __future__ import division, with_statement
-from os import listdir, path
+from os import path
 import re
 from collections import defaultdict
 import pyslic
+from .dirindex import get_index
 
 _name_pat = re.compile('([A-Z0-9]{5,6})_Image_([0-9]+)_(prot|dna).tiff')
 def _channelname(c):
@@ -34,16 +35,19 @@ def _channelname(c):
         return 'protein'
     return c
 
-def read_tiff_pairs_dir(directory):
+def read_tiff_pairs_dir(directory, index=None):
     '''
-    imgs = read_tiff_pairs_dir(directory)
+    imgs = read_tiff_pairs_dir(directory, index=None)
 
     Read the files in `directory` if it contains TIFF pairs
         (i.e., image_prot.tiff/image_dna.tiff)
     and returns a list of the images found.
+
+    index is an optional DirIndex of directory.
     '''
+    index = get_index(directory, index)
     imgs = defaultdict(pyslic.image.Image)
-    for fname in listdir(directory):
+    for fname in index.listdir(directory):
         match = _name_pat.match(fname)
         if match is not None:
             code,nr,type = match.groups()
@@ -54,10 +58,11 @@ def read_tiff_pairs_dir(directory):
     return imgs.values()
 
 
-def detect_tiff_pairs(directory):
+def detect_tiff_pairs(directory, index=None):
     '''
     '''
-    for img in listdir(directory):
+    index = get_index(directory, index)
+    for img in index.listdir(directory):
         if img.endswith('_prot.tiff'):
             base = img[:-len('_prot.tiff')]
-            return path.exists(path.join(directory, base+'_dna.tiff'))
+            return index.exists(path.join(directory, base+'_dna.tiff'))
@@ -35,7 +35,7 @@ from scipy import ndimage
 from warnings import warn
 fn = np
 
-__all__ = ['preprocessimg', 'precomputestats', 'bgsub']
+__all__ = ['preprocessimg', 'precomputestats', 'bgsub', 'preprocess_channels']
 
 def precomputestats(image):
     image.lazy_load()
@@ -50,6 +50,8 @@ def preprocessimage(image, regionid=None, crop=True, options = {}):
     """
     Preprocess the image
 
+    The results are stored in image.channeldata (see preprocess_channels).
+
     image should be an Image object
     regionid should be an integer, which indexes into image.region
 
@@ -64,6 +66,22 @@ def preprocessimage(image, regionid=None, crop=True, options = {}):
             - 'rc': Riddlar-Calvard
             - 'mean':  Image mean
     """
+    image.channeldata.update(preprocess_channels(image, regionid, crop, options))
+
+def preprocess_channels(image, regionid=None, crop=True, options = {}):
+    """
+    channels = preprocess_channels(image, regionid=None, crop=True, options={})
+
+    Preprocess the image and return the results as a dictionary with keys
+    'procprotein', 'resprotein' and (if the image has a DNA channel)
+    'procdna'.
+
+    Unlike preprocessimage, this does not modify image (other than loading
+    it), so it can be called for different regions of the same image at the
+    same time (e.g., from several threads).
+
+    See preprocessimage for the meaning of the arguments.
+    """
     def preprocessimg(img):
         if len(img.shape) > 2:
             assert len(img.shape) == 3, "Cannot handle images of more than 3 dimensions."
@@ -78,9 +96,10 @@ def preprocessimage(image, regionid=None, crop=True, options = {}):
                 return out_proc,out_res
             else:
                 raise Exception('pyslic.preprocessimg: Do not know how to handle 3d.mode: %s' % options['3d.mode'])
+        # img may be a view into image.channeldata or image.temp
+        img = img.copy()
         if do_bgsub:
             regions = image.regions
-            img = img.copy()
             if regions is not None:
                 if options.get('bgsub.way','ml') == 'ml':
                     img *= (regions == regionid)
@@ -102,6 +121,7 @@ def preprocessimage(image, regionid=None, crop=True, options = {}):
         return img,residual
     image.lazy_load()
 
+    results = {}
     protein = image.channeldata['protein']
     dna = image.channeldata.get('dna')
     do_bgsub = True
@@ -111,21 +131,21 @@ def preprocessimage(image, regionid=None, crop=True, options = {}):
     if regionid is not None and 'region_ids' in image.temp:
         location = image.temp['region_ids'][regionid - 1]
         if location is None:
-            image.channeldata['procprotein'] = \
-                image.channeldata['resprotein'] = \
-                image.channeldata['procdna'] = np.zeros((0,0), dtype=protein.dtype)
-            return
+            results['procprotein'] = \
+                results['resprotein'] = \
+                results['procdna'] = np.zeros((0,0), dtype=protein.dtype)
+            return results
         protein = protein[location]
         if dna is not None:
             dna = dna[location]
-    image.channeldata['procprotein'],image.channeldata['resprotein'] = preprocessimg(protein)
+    results['procprotein'],results['resprotein'] = preprocessimg(protein)
     if dna is not None:
-        image.channeldata['procdna'],_ = preprocessimg(dna)
+        results['procdna'],_ = preprocessimg(dna)
 
     if crop:
-        fullimage = (image.channeldata['procprotein'] > 0) | (image.channeldata['resprotein'] >0)
+        fullimage = (results['procprotein'] > 0) | (results['resprotein'] >0)
         if 'dna' in image.channeldata:
-            fullimage |= (image.channeldata['procdna'] > 0)
+            fullimage |= (results['procdna'] > 0)
 
         min1,max1,min2,max2 = bbox(fullimage)
         border = 2
@@ -134,10 +154,11 @@ def preprocessimage(image, regionid=None, crop=True, options = {}):
         max1 += border
         max2 += border
 
-        image.channeldata['procprotein'] = image.channeldata['procprotein'][min1:max1,min2:max2]
-        image.channeldata['resprotein'] = image.channeldata['resprotein'][min1:max1,min2:max2]
+        results['procprotein'] = results['procprotein'][min1:max1,min2:max2]
+        results['resprotein'] = results['resprotein'][min1:max1,min2:max2]
         if 'dna' in image.channeldata:
-            image.channeldata['procdna'] = image.channeldata['procdna'][min1:max1,min2:max2]
+            results['procdna'] = results['procdna'][min1:max1,min2:max2]
+    return results
 
 
 def thresholdfor(img,options = {}):
@@ -26,7 +26,7 @@ from __future__ import division, with_statement
 import numpy
 import numpy as np
 from scipy.ndimage import gaussian_filter
-from ..image import Image, loadedimage
+from ..image import Image, loadedimage, prefetch as prefetch_images
 
 __all__ = [
     'preprocess_collection',
@@ -38,9 +38,9 @@ __all__ = [
     'NullPreprocessor',
     ]
 
-def preprocess_collection(imgs,P):
+def preprocess_collection(imgs,P,prefetch=0):
     '''
-    P = process_collection(imgs,P)
+    P = process_collection(imgs,P,prefetch=0)
     
     This function does:
 
@@ -49,7 +49,12 @@ def preprocess_collection(imgs,P):
                 P.see(img)
         P.finish()
         return P
+
+    If prefetch > 0, that many images are loaded in the background
+    (see pyslic.image.prefetch).
     '''
+    if prefetch:
+        imgs = prefetch_images(imgs, prefetch)
     for img in imgs:
         with loadedimage(img):
             P.see(img)
@@ -135,6 +140,9 @@ class FixIllumination(object):
         '''
         img.lazy_load()
         P=img.channeldata[self.channel]
+        if not P.flags.writeable:
+            # e.g., memory mapped images
+            P = P.copy()
         P /= self.S
         img.channeldata[self.channel] = P
 
@@ -26,7 +26,6 @@ from __future__ import division
 import numpy
 from ..imageprocessing import thresholding
 from ..utils import get_random
-from collections import defaultdict
 from scipy import ndimage
 def _unhaar(X):
     w,h=X.shape
@@ -40,32 +39,96 @@ def _unhaar(X):
 def _haar(X):
     return X[::2,::2]/4.+X[1::2,::2]/4.+X[::2,1::2]/4.+X[1::2,1::2]/4.
 
-def _converge(P,R,b,max_iters_converge=1000):
-    Pm=numpy.empty(P.shape,numpy.float32) # Pre-allocate: saves time
-    argmax=numpy.zeros_like(P)
-    maxval=numpy.zeros(P.shape,numpy.float32)
+def _crop(slice, margin, shape):
+    return tuple(numpy.s_[max(s.start-margin,0):min(s.stop+margin,n)] for s,n in zip(slice,shape))
+
+def _relabel(P):
+    # Renumber the labels 1,2,... in order of first occurrence (0 stays 0)
+    labels,first,inverse = numpy.unique(P.ravel(), return_index=True, return_inverse=True)
+    order = numpy.argsort(first)
+    order = order[labels[order] != 0]
+    ids = numpy.zeros(len(labels), P.dtype)
+    ids[order] = numpy.arange(1, len(order)+1)
+    return ids[inverse].reshape(P.shape)
+
+def _gaussian_weights(b):
+    # The weights which gaussian_filter(., b) uses (obtained by filtering an
+    # impulse, so that they are exactly the same)
+    radius = int(4.0*b + 0.5)
+    impulse = numpy.zeros(2*radius+1)
+    impulse[radius] = 1
+    return ndimage.gaussian_filter1d(impulse, b, mode='constant')[::-1].copy()
+
+def _smooth(X, weights, output):
+    # Same as gaussian_filter(X, b, output=output), but without recomputing
+    # the weights on every call
+    ndimage.correlate1d(X, weights, 0, output)
+    ndimage.correlate1d(output, weights, 1, output)
+    return output
+
+def _smooth_label(args):
+    # Smoothed indicator of label m on its neighbourhood
+    P,m,slice,weights = args
+    radius = len(weights)//2
+    outer = _crop(slice, 2*radius, P.shape)
+    inner = _crop(slice, radius, P.shape)
+    indicator = (P[outer] == m).astype(numpy.float32)
+    values = _smooth(indicator, weights, indicator)
+    return inner, values[tuple(numpy.s_[s.start-o.start:s.stop-o.start] for s,o in zip(inner,outer))]
+
+def _converge(P,R0,b,max_iters_converge=1000,pool=None):
+    '''
+    P = _converge(P,R0,b,max_iters_converge=1000,pool=None)
+
+    Each pixel votes for the label m whose smoothed indicator
+    gaussian_filter(P==m, b) (plus R0 for the background, m=0) is largest,
+    until P no longer changes. Ties go to the smallest label.
+
+    If pool is given, the labels are smoothed on it (the votes are still
+    counted in label order, so the result does not depend on the pool).
+    '''
+    dtype = P.dtype
+    P = numpy.asarray(P, numpy.intp)
+    weights = _gaussian_weights(b)
+    # Pre-allocate: saves time
+    indicator = numpy.empty(P.shape,numpy.float32)
+    maxval = numpy.empty(P.shape,numpy.float32)
     for i in xrange(max_iters_converge):
-        maxval*=0
-        maxval-=1e8
-        for m in xrange(int(P.max())+1):
-            Pm[:,:]=(P==m)
-            Pm=ndimage.gaussian_filter(Pm,b)+R[m] # Pm=ndimage.convolve(Pm,numpy.ones((2*b+1,2*b+1)))+R[m]
-            argmax[maxval<Pm]=m
-            maxval=maxval*(argmax!=m)+(argmax==m)*Pm
+        argmax = numpy.zeros_like(P)
+        numpy.equal(P, 0, indicator)
+        _smooth(indicator,weights,maxval)
+        maxval += R0
+        if P.max() == 0:
+            break
+        # The smoothed indicator of label m is zero further than the filter
+        # radius from its bounding box, so a label with no pixels (or outside
+        # of its neighbourhood) only scores 0. The first label (m=1) takes all the
+        # pixels where the background score is negative; after that, all
+        # scores are non-negative and zero never wins.
+        negative = (maxval < 0)
+        argmax[negative] = 1
+        maxval[negative] = 0
+        del negative
+        labels = [(P,m+1,slice,weights) for m,slice in enumerate(ndimage.find_objects(P)) if slice is not None]
+        if pool is not None:
+            smoothed = pool.imap(_smooth_label, labels, max(len(labels)//64,1))
+        else:
+            smoothed = (_smooth_label(args) for args in labels)
+        for (_,m,_,_),(inner,values) in zip(labels, smoothed):
+            best = maxval[inner]
+            better = (best < values)
+            best[better] = values[better]
+            argmax[inner][better] = m
         if (P == argmax).all(): break
-        P=argmax.copy()
-    mis=defaultdict(xrange(1,int(P.max())+1).__iter__().next)
-    mis[0]=0 # set 0 to 0, because it is special
-    for i in xrange(P.size):
-        P.flat[i]=mis[P.flat[i]]
-    return P
+        P=argmax
+    return _relabel(P).astype(dtype)
 
 def _sigmoid(x):
     return -2./(1.+numpy.exp(-x))+1
 
-def active_masks(f,Kmax,Kmin,A,Mmax,alpha,beta,gamma,b=2,R=None):
+def active_masks(f,Kmax,Kmin,A,Mmax,alpha,beta,gamma,b=2,R=None,threads=None):
     '''
-    Regions = active_masks(f,Kmax,Kmin,A,Mmax,alpha,beta,gamma,b=2,R=None)
+    Regions = active_masks(f,Kmax,Kmin,A,Mmax,alpha,beta,gamma,b=2,R=None,threads=None)
 
     Inputs:
     f:      the image
@@ -77,6 +140,8 @@ def active_masks(f,Kmax,Kmin,A,Mmax,alpha,beta,gamma,b=2,R=None):
     b:      How much to smooth the regions before voting
     R:      Any object which supports R.randint (default: numpy.random). To control 
             the random initialization
+    threads: Number of threads to smooth the regions on (the result is the
+            same for any number of threads)
 
     In this implementation, regions 0 is special and corresponds to the background
     '''
@@ -100,19 +165,27 @@ def active_masks(f,Kmax,Kmin,A,Mmax,alpha,beta,gamma,b=2,R=None):
     nh//=2**Kmax
     nw//=2**Kmax
     P=numpy.array([[R.randint(0,Mmax-1) for i in xrange(nw)] for j in xrange(nh)]) # P is \Psi
-    for k in xrange(Kmax,Kmin-1,-1):
-        for a in A[k]:
-            G1=alpha*_sigmoid(beta*(ndimage.gaussian_filter(f,a)-gamma))
-            R0=G1
-            for i in xrange(k):
-                R0=_haar(R0)
-            P=_converge(P,[R0]+[R0*0 for m in xrange(int(P.max()))],b)
-        P=_unhaar(P)
+    pool = None
+    if threads is not None and threads > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(threads)
+    try:
+        for k in xrange(Kmax,Kmin-1,-1):
+            for a in A[k]:
+                G1=alpha*_sigmoid(beta*(ndimage.gaussian_filter(f,a)-gamma))
+                R0=G1
+                for i in xrange(k):
+                    R0=_haar(R0)
+                P=_converge(P,R0,b,pool=pool)
+            P=_unhaar(P)
+    finally:
+        if pool is not None:
+            pool.terminate()
     return P[:h,:w]
 
-def active_masks_dna(f,thresh=None,R=None):
+def active_masks_dna(f,thresh=None,R=None,threads=None):
     '''
-    Regions = active_masks_dna(f,thresh=None,R=None)
+    Regions = active_masks_dna(f,thresh=None,R=None,threads=None)
 
     Calls active_masks(f,...) with appropriate parameters for DNA images.
     
@@ -120,9 +193,10 @@ def active_masks_dna(f,thresh=None,R=None):
     f:      The image
     thresh: The threshold to use (default: automatically determined)
     R:      Any object with support for R.randint (default: numpy.random)
+    threads: Number of threads to use (see active_masks)
     '''
     if thresh is None:
         thresh=thresholding.murphy_rc(f)
-    return active_masks(f,3,1,{3: [8.,4.,2.], 2 : [8.,4.,2.], 1: [2.]},256,1.2,2*f[f<thresh].std(),thresh,2,R)
+    return active_masks(f,3,1,{3: [8.,4.,2.], 2 : [8.,4.,2.], 1: [2.]},256,1.2,2*f[f<thresh].std(),thresh,2,R,threads)
 
 # vim: set ts=4 sts=4 sw=4 expandtab smartindent:
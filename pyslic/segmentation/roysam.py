@@ -26,6 +26,7 @@ from __future__ import division
 import numpy as np
 from numpy import linalg
 from collections import defaultdict
+import heapq
 try:
     import ncreduce
     fast_all = ncreduce.all
@@ -93,20 +94,59 @@ def border(W,Bc=None):
     '''
     bg = W.max()
     B = np.zeros_like(W)
+    if Bc is None:
+        Bc = np.array([[0,1,0],[1,1,1],[0,1,0]], bool)
+    Bc = np.asanyarray(Bc, bool)
+    h,w = W.shape
+    cy,cx = Bc.shape[0]//2, Bc.shape[1]//2
+    # For every pixel p (labeled n), the largest object obji next to it (i.e.,
+    # with p in dilate(W == obji,Bc)) and the list of all the (obji, n) pairs
+    # which touch
+    nlabels = np.int64(bg)+1
+    inner = (W != 0) & (W != bg)
+    adjacent = np.zeros(W.shape, W.dtype)
+    pairs = []
+    for dy,dx in zip(*np.nonzero(Bc)):
+        if dy == cy and dx == cx: continue
+        # As in mahotas.dilate, pixels outside the image are taken from the
+        # nearest pixel inside it
+        obj = W.take((np.arange(h)-(dy-cy)).clip(0,h-1), 0)
+        obj = obj.take((np.arange(w)-(dx-cx)).clip(0,w-1), 1)
+        touch = inner & (obj != W) & (obj != 0) & (obj != bg)
+        np.maximum(adjacent, np.where(touch, obj, 0), adjacent)
+        pairs.append(obj[touch].astype(np.int64)*nlabels + W[touch].astype(np.int64))
     neighbours = defaultdict(set)
-    border_id = defaultdict(xrange(1,W.max()**2).__iter__().next)
-    for obji in xrange(1,W.max()):
-        B_obji = (mahotas.dilate(W == obji,Bc)-(W==obji))
-        for neighbour in np.unique(W[B_obji]):
-            if neighbour == 0 or neighbour == bg: continue
-            a1,a2 = obji,neighbour
+    border_id = {}
+    if pairs:
+        # np.unique sorts by (obji, neighbour): the order of the loop over
+        # objects & their neighbours, in which the borders are numbered
+        for code in np.unique(np.concatenate(pairs)):
+            a1,a2 = divmod(int(code), int(nlabels))
             if a2 < a1: a1,a2 = a2,a1
-            B[B_obji & (W==neighbour)] = border_id[a1,a2]
+            if (a1,a2) not in border_id:
+                border_id[a1,a2] = len(border_id)+1
             neighbours[a1].add(a2)
             neighbours[a2].add(a1)
-    return B, dict(neighbours), dict(border_id)
+    if border_id:
+        # The last object (in the loop order) next to a pixel sets its border
+        keys = np.array(sorted(border_id.keys()), np.int64)
+        keys = keys[:,0]*nlabels + keys[:,1]
+        ids = np.array([border_id[k] for k in sorted(border_id.keys())], W.dtype)
+        pixels = np.flatnonzero(adjacent)
+        a1 = adjacent.ravel()[pixels].astype(np.int64)
+        a2 = W.ravel()[pixels].astype(np.int64)
+        codes = np.minimum(a1,a2)*nlabels + np.maximum(a1,a2)
+        B.flat[pixels] = ids[np.searchsorted(keys, codes)]
+    return B, dict(neighbours), border_id
 
-def _compute_features(img):
+def _compute_features(img, method='raster'):
+    if method == 'polygon':
+        # The hull is not filled in: its features are computed (once, for
+        # both hullfeatures & hullsizefeatures) from its vertices
+        hf = features.hullfeatures
+        _,Ahull,Phull,semimajor,semiminor = hf._hull_computations(img,method=method)
+        Allfeats = np.r_[hf._hullfeatures(img,Ahull,Phull,semimajor,semiminor),hf._hullsizefeatures(Ahull,Phull,semimajor,semiminor)]
+        return Allfeats[np.array([0,1,2,3,5,6,7],int)]
     bimg = (img > 0)
     s00,s01,s10,s11 = bbox(bimg)
     if s00 > 0: s00 -= 1
@@ -116,10 +156,28 @@ def _compute_features(img):
     Allfeats = np.r_[features.hullfeatures.hullfeatures(img,hull),features.hullfeatures.hullsizefeatures(img,hull)]
     return Allfeats[np.array([0,1,2,3,5,6,7],int)]
 
+def _group_pixels(labeled):
+    # label -> flat indices of its pixels (in raster order)
+    flat = labeled.ravel()
+    order = np.argsort(flat, kind='mergesort')
+    labels,starts = np.unique(flat[order], return_index=True)
+    return dict(zip(labels, np.split(order, starts[1:])))
+
+def _union(p0, p1):
+    # union of two sets of flat indices, kept in raster order
+    pixels = np.concatenate((p0, p1))
+    pixels.sort()
+    return pixels
+
 class Merger(object):
     '''
     Implements Roysam's region merging algorithm.
 
+    Regions are merged in a union-find structure. Each region keeps the list
+    of its pixels (and each border, the list of its pixels), so that merging
+    two regions or evaluating a merge only looks at the pixels involved. The
+    shape score of each region is cached until the region changes.
+
     REFERENCE
     Gang Lin, Umesh Adiga, Kathy Olson, John F. Guzowski, Carol A. Barnes, and Badrinath Roysam
     "A Hybrid 3-D Watershed Algorithm Incorporating Gradient Cues & Object Models for Automatic
@@ -127,60 +185,118 @@ class Merger(object):
      Vol. 56A, No. 1, pp. 23-36 Cytometry Part A, November 2003.
     '''
 
-    def __init__(self,dna,mu,iSigma,thresh=None):
+    def __init__(self,dna,mu,iSigma,thresh=None,hull_method='raster'):
         '''
         M = Merged(dna)
+
+        hull_method is 'raster' or 'polygon' (see
+        features.hullfeatures.hullfeatures).
         '''
         self.mu = mu
         self.iSigma = iSigma
+        self.hull_method = hull_method
         self.C = pymorph.gradm(dna)
         self.W,self.WL = roysam_watershed(dna,thresh)
         self.B,self.neighbours,self.border_id = border(self.W)
         self.border_regions=dict((y,x) for x,y in self.border_id.iteritems())
+        self._parent = range(int(self.W.max())+1)
+        self._pixels = _group_pixels(self.W)
+        self._border_pixels = _group_pixels(self.B)
+        self._border_pixels.pop(0, None)
+        self._logS = {}
+        self._Cmean = {}
+
+    def _find(self,c):
+        '''Current label of (original) region c'''
+        parent = self._parent
+        root = c
+        while parent[root] != root:
+            root = parent[root]
+        while parent[c] != root:
+            parent[c],c = root,parent[c]
+        return root
+
+    def _labeled(self):
+        '''Labeled image with the current regions'''
+        labels = np.array([self._find(c) for c in xrange(len(self._parent))], self.W.dtype)
+        return labels[self.W]
+
+    def _borders(self):
+        '''Border image with the current borders'''
+        B = np.zeros_like(self.B)
+        for b,pixels in self._border_pixels.iteritems():
+            B.flat[pixels] = b
+        return B
 
     def _merge(self,c0,c1):
         '''Merge region c0 & c1'''
-        self.W[self.W==c1] = c0
+        self._parent[c1] = c0
+        self._pixels[c0] = _union(self._pixels[c0], self._pixels.pop(c1))
+        for cache in (self._logS, self._Cmean):
+            cache.pop(c0, None)
+            cache.pop(c1, None)
         self.neighbours[c0].remove(c1)
         self.neighbours[c1].remove(c0)
         self.neighbours[c0].update(self.neighbours[c1])
-        del self.neighbours[c1]
-        for v in self.neighbours.values():
-            if c1 in v:
-                v.remove(c1)
-                v.add(c0)
-        b = self.border_id[min(c0,c1),max(c0,c1)]
-        del self.border_id[min(c0,c1),max(c0,c1)]
-        self.B[self.B==b] = 0
-        for (r0,r1),b in self.border_id.items():
-            if r0 == c1 or r1 == c1:
-                del self.border_id[r0,r1]
-                if r1 == c1:
-                    r1 = r0
-                d0,d1 = min(r1,c0),max(r1,c0)
-                if (d0,d1) in self.border_id:
-                    self.B[self.B==b] = self.border_id[d0,d1]
-                else:
-                    self.border_id[d0,d1] = b
-                
+        others = self.neighbours.pop(c1)
+        b = self.border_id.pop((min(c0,c1),max(c0,c1)))
+        self._border_pixels.pop(b, None)
+        for r in others:
+            v = self.neighbours[r]
+            v.remove(c1)
+            v.add(c0)
+            b = self.border_id.pop((min(r,c1),max(r,c1)))
+            d0,d1 = min(r,c0),max(r,c0)
+            if (d0,d1) in self.border_id:
+                d = self.border_id[d0,d1]
+                pixels = self._border_pixels.pop(b, None)
+                if pixels is not None:
+                    self._border_pixels[d] = _union(self._border_pixels.get(d, pixels[:0]), pixels)
+            else:
+                self.border_id[d0,d1] = b
+
+    def _region_mask(self,pixels):
+        '''The region with the given pixels on its bounding box (with a
+        margin of 1 pixel, as _compute_features uses)'''
+        h,w = self.W.shape
+        ys = pixels // w
+        xs = pixels % w
+        y0 = max(ys.min()-1, 0)
+        x0 = max(xs.min()-1, 0)
+        mask = np.zeros((min(ys.max()+2,h)-y0, min(xs.max()+2,w)-x0), bool)
+        mask[ys-y0, xs-x0] = True
+        return mask
+
+    def _logS_pixels(self,pixels):
+        F = _compute_features(self._region_mask(pixels), self.hull_method)
+        return -.5*np.sqrt( np.dot(np.dot(F-self.mu,self.iSigma),F-self.mu) )
+
+    def _region_logS(self,c):
+        if c not in self._logS:
+            self._logS[c] = self._logS_pixels(self._pixels[c])
+        return self._logS[c]
+
+    def _region_Cmean(self,c):
+        if c not in self._Cmean:
+            self._Cmean[c] = self.C.ravel()[self._pixels[c]].mean()
+        return self._Cmean[c]
+
     def _Rw(self,c0,c1):
         '''Implement Rw in the paper.'''
         def RSw(c0,c1):
-            def logS(img):
-                F = _compute_features(img)
-                return -.5*np.sqrt( np.dot(np.dot(F-self.mu,self.iSigma),F-self.mu) )
-            S0 = logS(self.W == c0)
-            S1 = logS(self.W == c1)
-            Sc = logS((self.W == c0)|(self.W == c1))
+            S0 = self._region_logS(c0)
+            S1 = self._region_logS(c1)
+            Sc = self._logS_pixels(_union(self._pixels[c0], self._pixels[c1]))
             logR = np.log(2)+Sc-S0-S1
             if abs(logR) < 100:
                 return np.exp(logR)
             return np.exp(np.sign(logR)*100)
         def RGw(c0,c1):
             b = self.border_id[min(c0,c1),max(c0,c1)]
-            if np.all(self.B != b):
+            pixels = self._border_pixels.get(b)
+            if pixels is None or not len(pixels):
                 return .01 # A small number: these probably should not be merged
-            return (self.C[self.W==c0].mean()+self.C[self.W==c1].mean())/2./self.C[self.B==b].mean()
+            return (self._region_Cmean(c0)+self._region_Cmean(c1))/2./self.C.ravel()[pixels].mean()
         rs = RSw(c0,c1)
         rg = RGw(c0,c1)
         return rs * rg
@@ -188,43 +304,48 @@ class Merger(object):
     def greedy(self,beta=1.2):
         '''
         Merge regions greedily.
+
+        The merges are kept in a heap; entries made stale by a merge are
+        skipped when they come up.
         '''
         values = dict(((c0,c1),self._Rw(c0,c1)) for (c0,c1),b in self.border_id.iteritems())
-        while True:
-            if not values: break
-            val,best = max((y,x) for x,y in values.iteritems())
+        # Largest value first (ties: largest pair first)
+        queue = [(-val,-c0,-c1) for (c0,c1),val in values.iteritems()]
+        heapq.heapify(queue)
+        while queue:
+            val,b0,b1 = heapq.heappop(queue)
+            val,b0,b1 = -val,-b0,-b1
+            if values.get((b0,b1)) != val: continue
             if val < beta: break
-            b0,b1 = best
-            affected = self.neighbours[b0]|self.neighbours[b1]
-            del values[b0,b1]
-            for c0,c1 in values.keys():
-                if c0 in affected or c1 in affected:
-                    del values[c0,c1]
+            for r in self.neighbours[b1]:
+                del values[min(r,b1),max(r,b1)]
             self._merge(b0,b1)
-            for c0,c1 in self.border_id:
-                if (c0,c1) not in values:
-                    values[c0,c1] = self._Rw(c0,c1)
+            for r in self.neighbours[b0]:
+                c0,c1 = min(r,b0),max(r,b0)
+                values[c0,c1] = self._Rw(c0,c1)
+                heapq.heappush(queue, (-values[c0,c1],-c0,-c1))
+        self.W = self._labeled()
+        self.B = self._borders()
         self.W[self.W == self.W.max()] = 0
         return self.W
 
-
-def train_classifier(labeled_dnas):
+def train_classifier(labeled_dnas, hull_method='raster'):
     '''
-    classifier = train_classifier(labeled_dnas)
+    classifier = train_classifier(labeled_dnas, hull_method='raster')
     
     Learn a classifier for Roysam's Algorithm.
-        (to be used for greedy_roysam_merge)
+        (to be used for greedy_roysam_merge, with the same hull_method)
     '''
     F = []
     for dna in labeled_dnas:
         for obji in xrange(1,dna.max()+1):
-            F.append(_compute_features(dna==obji))
+            F.append(_compute_features(dna==obji, hull_method))
     F = np.array(F)
     return np.mean(F,0),linalg.inv(np.cov(F.T))
 
-def greedy_roysam_merge(dna, classifier, thresh=None):
+def greedy_roysam_merge(dna, classifier, thresh=None, hull_method='raster'):
     '''
-    labeled = greedy_roysam_merge(dna, classifier, thresh=None)
+    labeled = greedy_roysam_merge(dna, classifier, thresh=None, hull_method='raster')
 
     Implement Roysam's Greedy Merging Algorithm
 
@@ -235,9 +356,13 @@ def greedy_roysam_merge(dna, classifier, thresh=None):
         * classifier: shape properties
             (should be of the form returned by train_classifier)
         * thresh: Thresholding value or method
+        * hull_method: 'raster' (default) or 'polygon'. How the convex hull
+            features are computed (see features.hullfeatures.hullfeatures).
+            'polygon' is faster, but only approximates the original features.
+            Use the same method as for train_classifier.
     '''
     mu,iSigma = classifier
-    M = Merger(dna,mu,iSigma,thresh=thresh)
+    M = Merger(dna,mu,iSigma,thresh=thresh,hull_method=hull_method)
     M.greedy()
     return M.W
 
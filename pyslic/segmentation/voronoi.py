@@ -24,41 +24,93 @@
 
 from __future__ import division
 from numpy import *
-from scipy.ndimage import distance_transform_edt,label, median_filter
+import numpy as np
+from scipy.ndimage import distance_transform_edt, distance_transform_cdt, label, median_filter
 from mahotas.thresholding import otsu
 import nucleidetection
 
 __all__ = ['voronoi','gvoronoi']
+
+def _metric(distance, funcname):
+    if distance == 'euclidean':
+        return 'euclidean'
+    if distance in ('manhatan', 'manhattan', 'cityblock', 'city_block', 'taxicab'):
+        return 'cityblock'
+    if distance == 'chessboard':
+        return 'chessboard'
+    raise ValueError('pyslic.segmentation.%s: Distance "%s" not implemented' % (funcname, distance))
+
+# Minkowski p of each metric (for cKDTree)
+_minkowski_p = {
+    'euclidean' : 2,
+    'cityblock' : 1,
+    'chessboard' : inf,
+}
+
+def _distance(dy, dx, metric):
+    # distance for coordinate differences dy & dx (which are overwritten)
+    if metric == 'euclidean':
+        # (squared, as only comparisons are needed)
+        dy *= dy
+        dx *= dx
+        dy += dx
+        return dy
+    np.abs(dy, dy)
+    np.abs(dx, dx)
+    if metric == 'cityblock':
+        dy += dx
+        return dy
+    return np.maximum(dy, dx, dy)
+
+def _nearest_brute(ys, xs, cys, cxs, metric, chunk_size=(1 << 20)):
+    # argmin returns the first minimum, i.e., ties go to the lowest index
+    nearest = np.empty(len(ys), np.intp)
+    step = max(chunk_size // len(cys), 1)
+    for s in xrange(0, len(ys), step):
+        dy = ys[s:s+step,None] - cys[None,:]
+        dx = xs[s:s+step,None] - cxs[None,:]
+        nearest[s:s+step] = _distance(dy, dx, metric).argmin(1)
+    return nearest
+
+def _nearest(ys, xs, cys, cxs, metric):
+    if len(cys) < 8:
+        return _nearest_brute(ys, xs, cys, cxs, metric)
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return _nearest_brute(ys, xs, cys, cxs, metric)
+    tree = cKDTree(np.c_[cys, cxs])
+    _,nearest = tree.query(np.c_[ys, xs], k=2, p=_minkowski_p[metric])
+    # Pixels which are (almost) as close to the second centre as to the first
+    # are decided by comparing against all centres, which breaks ties in the
+    # same way for every metric.
+    first = _distance(ys - cys[nearest[:,0]], xs - cxs[nearest[:,0]], metric)
+    second = _distance(ys - cys[nearest[:,1]], xs - cxs[nearest[:,1]], metric)
+    nearest = nearest[:,0]
+    ambiguous = np.flatnonzero(second - first <= 1e-9 * (1. + first))
+    nearest[ambiguous] = _nearest_brute(ys[ambiguous], xs[ambiguous], cys, cxs, metric)
+    return nearest
+
 def voronoi(img,centers,distance='euclidean'):
     '''
     labeled = voronoi(img,centers,distance='euclidean')
 
+    labeled[y,x] is i+1 if centers[i] is the centre closest to (y,x) (ties
+    go to the first of the closest centres).
+
     distance can be one of
         'euclidean' : use euclidean distance (default)
-        'manhatan'  : use manhatan distance
+        'manhatan'  : use manhatan distance (syn: 'cityblock')
+        'chessboard': use chessboard distance
     '''
+    metric = _metric(distance, 'voronoi')
+    centers = np.asarray(centers, np.float_).reshape((-1,2))
+    if not len(centers):
+        raise ValueError('pyslic.segmentation.voronoi: no centers')
     labels=zeros_like(img)
     r,c=img.shape
-    def seuclidean(y,x,cy,cx):
-        dy=y-cy
-        dx=x-cx
-        return dy*dy+dx*dx
-    def manhatan(y,x,cy,cx):
-        dy=y-cy
-        dx=x-cx
-        return abs(dy)+abs(dx)
-    dist=seuclidean
-    if distance == 'manhatan' or distance == 'cityblock' or distance == 'city_block':
-        dist=manhatan
-    for y in xrange(r):
-        for x in xrange(c):
-            best=inf
-            for i,(cy,cx) in enumerate(centers):
-                now=dist(y,x,cy,cx)
-                if now < best:
-                    best=now
-                    besti=i+1
-            labels[y,x]=besti
+    ys,xs = np.indices((r,c), np.float_).reshape((2,-1))
+    labels.flat = _nearest(ys, xs, centers[:,0], centers[:,1], metric) + 1
     return labels
 
 def gvoronoi(labeled,distance='euclidean'):
@@ -69,16 +121,18 @@ def gvoronoi(labeled,distance='euclidean'):
 
     INPUT:
     * labeled: an array, of a form similar to the return of scipy.ndimage.label()
-    * distance: one of 'euclidean', 'manhatan'
+    * distance: one of 'euclidean', 'manhatan' (syn: 'cityblock'), 'chessboard'
 
     RETURN
     segmented is of the same size and type as labeled and
         segmented[y,x] is the label of the object at position y,x
     """
-    if distance == 'euclidean':
+    metric = _metric(distance, 'gvoronoi')
+    if metric == 'euclidean':
         L1,L2=distance_transform_edt(labeled== 0, return_distances=False,return_indices=True)
     else:
-        raise Exception('gvoronoi: Distance "%s" not implemented' % distance)
+        L1,L2=distance_transform_cdt(labeled== 0, metric=('taxicab' if metric == 'cityblock' else 'chessboard'),
+                                    return_distances=False, return_indices=True)
     return labeled[L1,L2]
 
 def gvoronoi_dna(dnaimg,distance='euclidean'):
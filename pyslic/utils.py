@@ -31,6 +31,7 @@ __all__ = [
     'get_pyrandom',
     'format_table',
     'format_confusion_matrix',
+    'mosaic_layout',
     ]
 
 def get_random(R):
@@ -116,4 +117,29 @@ def format_confusion_matrix(cmatrix,labels,format='latex'):
     '''
     return format_table(cmatrix.astype(np.uint32), labels, labels, format)
 
+def mosaic_layout(shapes):
+    '''
+    positions, shape = mosaic_layout(shapes)
+
+    Lays out boxes of the given (h,w) shapes side by side, one pixel apart,
+    in rows of a single image of size shape: box i goes at positions[i] (a
+    (y,x) pair).
+
+    Rows are filled up to about the width of a square of the same area.
+    '''
+    if not len(shapes):
+        return [], (0,0)
+    area = sum((h+1)*(w+1) for h,w in shapes)
+    width = max(max(w for _,w in shapes), int(np.sqrt(area)))
+    positions = []
+    y = x = rowh = 0
+    for h,w in shapes:
+        if x and x + w > width:
+            y += rowh + 1
+            x = rowh = 0
+        positions.append((y,x))
+        x += w + 1
+        rowh = max(rowh, h)
+    return positions, (y+rowh, width)
+
 # vim: set ts=4 sts=4 sw=4 expandtab smartindent:
@@ -0,0 +1,60 @@
+import sys
+import numpy as np
+from scipy import ndimage
+import pyslic.segmentation
+active_masks = sys.modules['pyslic.segmentation.active_masks']
+
+def _converge(P, R0, b):
+    # Straightforward version: smooth every label over the whole image
+    while True:
+        scores = []
+        for m in xrange(P.max()+1):
+            score = ndimage.gaussian_filter((P == m).astype(np.float32), b)
+            if m == 0:
+                score += R0
+            scores.append(score)
+        argmax = np.array(scores).argmax(0)
+        if np.all(argmax == P):
+            break
+        P = argmax
+    ids = {0:0}
+    for v in P.flat:
+        if v not in ids:
+            ids[v] = len(ids)
+    relabeled = P.copy()
+    for v,i in ids.iteritems():
+        relabeled[P == v] = i
+    return relabeled
+
+def test_relabel():
+    P = np.array([[3,3,0],[5,1,3]])
+    assert np.all(active_masks._relabel(P) == [[1,1,0],[2,3,1]])
+
+def test_converge():
+    r = np.random.RandomState(8)
+    for i in xrange(6):
+        P = r.randint(0, 12, size=(20,30))
+        P[P == 1] = 0
+        R0 = ((r.rand(20,30) - .5) * .6).astype(np.float32)
+        b = (1, 2, .7)[i % 3]
+        assert np.all(active_masks._converge(P.copy(), R0, b) == _converge(P.copy(), R0, b))
+
+def test_active_masks():
+    r = np.random.RandomState(9)
+    f = np.zeros((64,80))
+    f[r.randint(64, size=10), r.randint(80, size=10)] = 1
+    f = ndimage.gaussian_filter(f, 6) * 2000 + r.rand(64,80)
+    regions = active_masks.active_masks(f, 2, 1, {2:[4.,2.],1:[1.]}, 40, 1., 20., f.mean(), 1, R=np.random.RandomState(0))
+    assert regions.shape == f.shape
+    assert regions.max() > 1
+    assert set(np.unique(regions)) == set(range(int(regions.max())+1))
+
+def test_active_masks_threads():
+    r = np.random.RandomState(10)
+    f = np.zeros((64,80))
+    f[r.randint(64, size=10), r.randint(80, size=10)] = 1
+    f = ndimage.gaussian_filter(f, 6) * 2000 + r.rand(64,80)
+    args = (f, 2, 1, {2:[4.,2.],1:[1.]}, 40, 1., 20., f.mean(), 1)
+    regions = active_masks.active_masks(*args, R=np.random.RandomState(1))
+    threaded = active_masks.active_masks(*args, R=np.random.RandomState(1), threads=3)
+    assert np.all(regions == threaded)
@@ -0,0 +1,59 @@
+import numpy as np
+import os
+import tempfile
+import pyslic
+from pyslic.image.datacache import ImageDataCache
+
+def _load(fname):
+    return np.load(fname)
+
+def test_datacache():
+    directory = tempfile.mkdtemp()
+    try:
+        fnames = []
+        for i in xrange(4):
+            fname = os.path.join(directory, '%s.npy' % i)
+            np.save(fname, np.zeros((16,16), np.uint8) + i)
+            fnames.append(fname)
+        cache = ImageDataCache(3*16*16)
+        A = cache.load(fnames[0], _load)
+        assert cache.misses == 1
+        assert cache.load(fnames[0], _load) is A
+        assert cache.hits == 1
+        assert not A.flags.writeable
+        for f in fnames[1:]:
+            cache.load(f, _load)
+        assert cache.evictions == 1
+        assert cache.nbytes <= 3*16*16
+        cache.load(fnames[0], _load)
+        assert cache.misses == 5
+    finally:
+        for f in os.listdir(directory):
+            os.unlink(os.path.join(directory, f))
+        os.rmdir(directory)
+
+def test_disabled():
+    cache = ImageDataCache(0)
+    A = cache.load('ignored', lambda f: np.zeros(4))
+    assert A.flags.writeable
+    assert cache.nbytes == 0
+
+def test_image_uses_cache():
+    directory = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(directory, 'protein.npy')
+        np.save(fname, np.arange(64).reshape((8,8)))
+        pyslic.image.set_cache_size(1 << 20)
+        pyslic.image.clear_cache()
+        for i in xrange(3):
+            img = pyslic.Image(protein=fname)
+            img.set_load_function(_load)
+            assert np.all(img.get('protein') == np.arange(64).reshape((8,8)))
+        stats = pyslic.image.cache_stats()
+        assert stats['misses'] == 1
+        assert stats['hits'] == 2
+    finally:
+        pyslic.image.set_cache_size(0)
+        pyslic.image.clear_cache()
+        os.unlink(fname)
+        os.rmdir(directory)
@@ -0,0 +1,68 @@
+import os
+import glob
+import tempfile
+import shutil
+import pyslic
+from pyslic.image.io import dirindex
+from pyslic.image.io.dirindex import DirIndex
+
+def _touch(fname):
+    dirname = os.path.dirname(fname)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    file(fname, 'w').close()
+
+def _make_ic100(basedir):
+    os.makedirs(os.path.join(basedir, 'ProtocolArchive'))
+    for well in ('well__A___1', 'well__B___12'):
+        for ch in xrange(3):
+            for i in xrange(3):
+                _touch(os.path.join(basedir, 'tables', well, 'channel_%s' % ch, 'image%s.bmp' % i))
+    _touch(os.path.join(basedir, 'tables', '.hidden'))
+
+def test_dirindex_matches_os():
+    basedir = tempfile.mkdtemp()
+    try:
+        _make_ic100(basedir)
+        index = DirIndex(basedir)
+        for pat in ('%s/tables/well_*', '%s/tables/*/channel_1/*.bmp', '%s/tables/*', '%s/tables/.*', '%s/ProtocolArchive', '%s/tables/well__A___1/channel_0/image0.bmp', '%s/nothere/*'):
+            assert sorted(index.glob(pat % basedir)) == sorted(glob.glob(pat % basedir))
+        assert sorted(index.listdir(basedir)) == sorted(os.listdir(basedir))
+        assert index.isdir(os.path.join(basedir, 'tables'))
+        assert not index.isdir(os.path.join(basedir, 'tables', '.hidden'))
+        assert index.exists(os.path.join(basedir, 'tables', '.hidden'))
+        assert not index.exists(os.path.join(basedir, 'nothere', 'file'))
+        walked = sorted((r, sorted(d), sorted(f)) for r,d,f in index.walk(basedir))
+        expected = sorted((r, sorted(d), sorted(f)) for r,d,f in os.walk(basedir))
+        assert walked == expected
+    finally:
+        shutil.rmtree(basedir)
+
+def test_auto_detect_load_manifest():
+    basedir = tempfile.mkdtemp()
+    manifest = os.path.join(tempfile.mkdtemp(), 'manifest')
+    _scan = dirindex._scan
+    scanned = []
+    def counting_scan(path):
+        scanned.append(path)
+        return _scan(path)
+    try:
+        _make_ic100(basedir)
+        expected = pyslic.image.io.read_ic100dir(basedir)
+        dirindex._scan = counting_scan
+        imgs = pyslic.image.io.auto_detect_load(basedir, manifest=manifest, threads=4)
+        assert [img.channels for img in imgs] == [img.channels for img in expected]
+        assert len(scanned) == len(set(scanned))
+
+        # Make the directories look old, so that they are saved in the manifest
+        for root,_,_ in os.walk(basedir):
+            os.utime(root, (1e9, 1e9))
+        pyslic.image.io.auto_detect_load(basedir, manifest=manifest)
+        del scanned[:]
+        imgs = pyslic.image.io.auto_detect_load(basedir, manifest=manifest)
+        assert not scanned
+        assert [img.channels for img in imgs] == [img.channels for img in expected]
+    finally:
+        dirindex._scan = _scan
+        shutil.rmtree(basedir)
+        shutil.rmtree(os.path.dirname(manifest))
@@ -0,0 +1,32 @@
+import numpy as np
+from scipy import ndimage
+from pyslic.features.edgefeatures import edgefeatures, _histogram
+
+def test_histogram():
+    r = np.random.RandomState(5)
+    for i in xrange(200):
+        v = r.randn(r.randint(1,40)) * 10.**r.randint(-3,3)
+        if i % 3 == 0:
+            v = np.round(v)
+        for bins in (4,8):
+            assert np.all(_histogram(v, bins) == np.histogram(v, bins)[0])
+
+def test_edgefeatures():
+    r = np.random.RandomState(6)
+    img = (r.rand(40,50) < .5) * r.randint(0, 255, size=(40,50))
+    img = img.astype(np.uint8)
+    values = edgefeatures(img)
+
+    N = np.array([[1,1,1],[0,0,0],[-1,-1,-1]], float)
+    iprocN = ndimage.convolve(img.astype(float), N)
+    iprocW = ndimage.convolve(img.astype(float), N.T)
+    mag = np.sqrt(iprocN**2 + iprocW**2)
+    theta = np.arctan2(iprocN, iprocW)[mag > 0]
+    mag = mag[mag > 0]
+    h,_ = np.histogram(theta, 8)
+    h_mag,_ = np.histogram(mag, 4)
+    assert np.allclose(values[1], h_mag[0]/float(h_mag.sum()))
+    assert np.allclose(values[2], h.max()/float(h.min()))
+
+def test_edgefeatures_empty():
+    assert np.all(edgefeatures(np.zeros((8,8), np.uint8), np.zeros((8,8), bool)) == 0)
@@ -0,0 +1,72 @@
+import numpy as np
+import shutil
+import tempfile
+import pyslic
+from pyslic.features.featurecache import FeatureCache
+
+def test_put_get():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = FeatureCache(directory)
+        assert cache.get('0123abcd', 'har') is None
+        cache.put('0123abcd', 'har', np.arange(13.))
+        assert np.all(cache.get('0123abcd', 'har') == np.arange(13.))
+        assert cache.get('0123abcd', 'skl') is None
+        cache.put('0123abcd', 'lbp(1, 8)', np.arange(3.))
+        assert np.all(cache.get('0123abcd', 'lbp(1, 8)') == np.arange(3.))
+    finally:
+        shutil.rmtree(directory)
+
+def test_eviction():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = FeatureCache(directory, max_bytes=4096)
+        for i in xrange(16):
+            cache.put('%08x' % i, 'har', np.zeros(64))
+        assert cache.size() <= 4096
+        assert cache.get('%08x' % 15, 'har') is not None
+        assert cache.get('%08x' % 0, 'har') is None
+        cache.clear()
+        assert cache.size() == 0
+    finally:
+        shutil.rmtree(directory)
+
+def test_imagekey():
+    cache = FeatureCache('/tmp/unused')
+    img = pyslic.Image()
+    img.channels['protein'] = '<special>'
+    assert cache.imagekey(img, {}) is None
+    img.channels['protein'] = __file__
+    k = cache.imagekey(img, {})
+    assert k is not None
+    assert k == cache.imagekey(img, {})
+    assert k != cache.imagekey(img, {'options' : {'bgsub.way' : 'mb'}})
+
+def test_imagekey_regions():
+    cache = FeatureCache('/tmp/unused')
+    img = pyslic.Image()
+    img.channels['protein'] = __file__
+    k = cache.imagekey(img, {})
+    regions = np.zeros((8,8), np.int32)
+    regions[:,4:] = 1
+    img.regions = regions
+    k1 = cache.imagekey(img, {})
+    assert k1 != k
+    img.regions = regions.T.copy()
+    assert cache.imagekey(img, {}) != k1
+    img.regions = regions.copy()
+    assert cache.imagekey(img, {}) == k1
+
+def test_size_overwrite():
+    directory = tempfile.mkdtemp()
+    try:
+        cache = FeatureCache(directory)
+        cache.put('0123abcd', 'har', np.arange(13.))
+        size = cache.size()
+        for i in xrange(3):
+            cache.put('0123abcd', 'har', np.arange(13.))
+        assert cache.size() == size
+        cache.put('0123abcd', 'har', np.arange(26.))
+        assert cache.size() == FeatureCache(directory).size()
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,43 @@
+import numpy as np
+from scipy import ndimage
+from pyslic.features.featureplan import FeaturePlan, Intermediates
+
+def test_intermediates():
+    f = np.zeros((32,32), np.uint8)
+    f[2:8,2:8] = 3
+    f[12:20,10:14] = 5
+    shared = Intermediates(f)
+    labeled = shared.get('labeled')
+    assert np.all(labeled == ndimage.label(f > 0)[0])
+    assert shared.get('labeled') is labeled
+    assert len(shared.get('objects')) == 2
+    shared.release(['labeled'])
+    assert 'labeled' not in shared.values
+
+def test_plan_release():
+    plan = FeaturePlan(['img','nof','skl','har'])
+    assert 'labeled' not in plan.done(0)
+    assert 'labeled' in plan.done(2)
+    assert 'skeleton' in plan.done(2)
+    assert plan.done(1) == []
+    assert plan.done(3) == []
+
+def test_block_sum_pyramid():
+    from pyslic.features.texture import block_sum_pyramid
+    r = np.random.RandomState(2)
+    for shape in [(1,1), (3,7), (31,40)]:
+        for top in (255, 60000):
+            img = r.randint(0, top, size=shape)
+            levels = block_sum_pyramid(img, (2,3,4,5,6))
+            for rate in (2,3,4,5,6):
+                C = np.ones((rate,rate))
+                expected = ndimage.convolve(np.array(img,np.uint16), C)[::rate,::rate]
+                assert np.all(levels[rate] == expected)
+    # Values which do not fit in 16 bits (e.g., floats) wrap around
+    img = r.randint(0, 60000, size=(20,30))
+    wrapped = block_sum_pyramid(img.astype(float) + 3*65536, (2,3,4,5,6))
+    levels = block_sum_pyramid(img, (2,3,4,5,6))
+    for rate in (2,3,4,5,6):
+        assert wrapped[rate].dtype == np.uint16
+        assert np.all(wrapped[rate] == levels[rate])
+        assert np.all(levels[rate] == ndimage.convolve(img.astype(np.int64), np.ones((rate,rate)).astype(np.int64))[::rate,::rate] % 65536)
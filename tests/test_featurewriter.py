@@ -0,0 +1,140 @@
+import numpy as np
+import shutil
+import tempfile
+import pyslic
+from pyslic.features import FeatureWriter, read_features
+
+def test_write_read():
+    directory = tempfile.mkdtemp()
+    try:
+        output = FeatureWriter(directory, featurenames=['a','b','c'], chunk_size=4)
+        for i in xrange(10):
+            output.append(np.arange(3.)+i, ('w', i), 'label%s' % (i%2))
+        output.close()
+        features,ids,labels,names = read_features(directory)
+        assert features.shape == (10,3)
+        assert np.all(features[:,0] == np.arange(10))
+        assert ids == [('w', i) for i in xrange(10)]
+        assert labels[:3] == ['label0', 'label1', 'label0']
+        assert names == ['a','b','c']
+
+        output = FeatureWriter(directory)
+        assert output.done(('w', 3))
+        assert not output.done(('w', 10))
+        output.append(np.zeros(3), ('w', 10))
+        try:
+            output.append(np.zeros(4), ('w', 11))
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError expected'
+        output.close()
+        features,ids,_,_ = read_features(directory)
+        assert features.shape == (11,3)
+        assert ids[-1] == ('w', 10)
+    finally:
+        shutil.rmtree(directory)
+
+def test_pending_rows_lost():
+    directory = tempfile.mkdtemp()
+    try:
+        output = FeatureWriter(directory, chunk_size=4)
+        for i in xrange(6):
+            output.append(np.arange(3.), i)
+        # simulate a crash: the last 2 rows were never flushed
+        output = FeatureWriter(directory)
+        assert len(output) == 4
+        assert output.done(3)
+        assert not output.done(4)
+    finally:
+        shutil.rmtree(directory)
+
+def _load(fname):
+    r = np.random.RandomState(int(fname))
+    img = np.zeros((64,64), np.uint8)
+    for y,x in r.randint(4, 60, size=(6,2)):
+        img[y-3:y+3,x-3:x+3] = r.randint(40, 200)
+    return img
+
+def _images(n):
+    imgs = []
+    for i in xrange(n):
+        img = pyslic.Image(protein=str(i))
+        img.set_load_function(_load)
+        img.id = i
+        img.label = i % 2
+        imgs.append(img)
+    return imgs
+
+def test_computefeatures_output():
+    directory = tempfile.mkdtemp()
+    try:
+        imgs = _images(5)
+        expected = pyslic.computefeatures(imgs, ['pftas'], preprocessing=False)
+        output = pyslic.computefeatures(imgs[:3], ['pftas'], preprocessing=False, output=FeatureWriter(directory))
+        assert len(output) == 3
+        # Resume: the first 3 images are not recomputed
+        for img in imgs[:3]:
+            img.set_load_function(None)
+        pyslic.computefeatures(imgs, ['pftas'], preprocessing=False, output=FeatureWriter(directory))
+        features,ids,labels,_ = read_features(directory)
+        assert ids == range(5)
+        assert labels == [0,1,0,1,0]
+        assert np.all(features == expected)
+    finally:
+        shutil.rmtree(directory)
+
+def test_computefeatures_output_names():
+    directory = tempfile.mkdtemp()
+    try:
+        pyslic.computefeatures(_images(2), ['edg'], preprocessing=False, output=FeatureWriter(directory))
+        features,_,_,names = read_features(directory)
+        assert names == pyslic.features.featurenames(['edg'])
+        assert features.shape == (2,len(names))
+    finally:
+        shutil.rmtree(directory)
+
+def test_computefeatures_output_no_id():
+    directory = tempfile.mkdtemp()
+    try:
+        imgs = _images(2)
+        imgs[1].id = None
+        try:
+            pyslic.computefeatures(imgs, ['pftas'], preprocessing=False, output=FeatureWriter(directory))
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError expected'
+    finally:
+        shutil.rmtree(directory)
+
+def test_header_size():
+    # ids are not rewritten to the header at every chunk
+    import os
+    directory = tempfile.mkdtemp()
+    try:
+        output = FeatureWriter(directory, chunk_size=2)
+        for i in xrange(40):
+            output.append(np.zeros(2), ('image-id', i))
+        assert 'image-id' not in file(os.path.join(directory, 'header.pickle'), 'rb').read()
+        assert read_features(directory)[1] == [('image-id', i) for i in xrange(40)]
+        output = FeatureWriter(directory)
+        assert len(output) == 40
+        assert output.done(('image-id', 39))
+    finally:
+        shutil.rmtree(directory)
+
+def test_featurenames_unavailable():
+    for featsets in (['pftas'], ['edg','har1'], 'SLF33'):
+        try:
+            pyslic.features.featurenames(featsets)
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError expected'
+    try:
+        pyslic.features.featurenames(['no-such-group'])
+    except ValueError:
+        assert False, 'unknown groups are not just missing names'
+    except Exception:
+        pass
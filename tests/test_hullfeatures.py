@@ -0,0 +1,53 @@
+import numpy as np
+from pyslic.features.hullfeatures import polygon_moments, hullfeatures, hullsizefeatures
+
+def test_polygon_moments_rectangle():
+    # The 5x3 rectangle, as a continuous polygon and as grid points
+    vertices = np.array([(0,0),(0,2),(4,2),(4,0)])
+    area, perimeter, cofy, cofx, mu20, mu11, mu02 = polygon_moments(vertices, raster=False)
+    assert np.allclose([area, perimeter, cofy, cofx], [8, 12, 2, 1])
+    assert np.allclose([mu20, mu11, mu02], [8*4/12., 0, 8*16/12.])
+
+    area, perimeter, cofy, cofx, mu20, mu11, mu02 = polygon_moments(vertices)
+    y,x = np.mgrid[:5,:3]
+    assert area == 15
+    assert perimeter == 12
+    assert np.allclose([cofy, cofx], [2, 1])
+    assert np.allclose([mu20, mu11, mu02], [((x-1)**2).sum(), 0, ((y-2)**2).sum()])
+
+def test_polygon_moments_degenerate():
+    assert polygon_moments(np.zeros((0,2)))[0] == 0
+    area, perimeter, cofy, cofx, mu20, mu11, mu02 = polygon_moments([(3,4)])
+    assert (area, perimeter, cofy, cofx) == (1, 1, 3, 4)
+    assert np.allclose([mu20, mu11, mu02], 0)
+    area, perimeter, cofy, cofx, mu20, mu11, mu02 = polygon_moments([(0,0),(0,6)])
+    assert area == 7
+    assert np.allclose([cofy, cofx, mu02, mu11, mu20], [0, 3, 0, 0, 28])
+
+def test_hullfeatures_polygon():
+    r = np.random.RandomState(2)
+    img = np.zeros((64,64), np.uint8)
+    img[20:44,8:56] = (r.rand(24,48) < .2)
+    raster = hullfeatures(img)
+    polygon = hullfeatures(img, method='polygon')
+    assert np.allclose(raster, polygon, rtol=.05)
+    raster = hullsizefeatures(img)
+    polygon = hullsizefeatures(img, method='polygon')
+    assert np.allclose(raster[[0,1,3,4]], polygon[[0,1,3,4]], rtol=.05)
+
+def test_convexhull_sizes():
+    from scipy import ndimage
+    from mahotas.polygon import fill_convexhull
+    from pyslic.features.hullfeatures import convexhull_sizes, convexhull_areas
+    r = np.random.RandomState(3)
+    for i in xrange(8):
+        img = ndimage.gaussian_filter(r.rand(30+4*i,40), 1+(i%3)) > .52
+        labeled,N = ndimage.label(img, np.ones((3,3)))
+        objects = ndimage.find_objects(labeled)
+        sizes = np.array(convexhull_sizes(labeled, objects)).T
+        binimg = (r.rand(*img.shape) < .6)
+        areas = convexhull_areas(binimg, labeled, objects)
+        for obji,slice in enumerate(objects):
+            binobj = (labeled[slice] == (obji+1))
+            assert np.allclose(sizes[obji], hullsizefeatures(binobj, fill_convexhull(binobj))[[0,2,3,4]])
+            assert areas[obji] == fill_convexhull(binobj & binimg[slice]).sum()
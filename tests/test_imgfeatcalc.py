@@ -72,3 +72,16 @@ def test_featinfolen():
     img.loaded = True
     img.channels['protein']='<special>'
     assert len(pyslic.computefeatures(img,'SLF33')) == len(pyslic.features.featinfo.get_names('SLF33'))
+
+def test_haralick_rates():
+    from scipy import ndimage
+    from pyslic.features.texture import haralickfeatures
+    img=pyslic.Image()
+    img.channeldata['protein'] = numpy.random.RandomState(3).randint(0, 255, size=(64,64)).astype(numpy.uint8)
+    img.loaded=True
+    img.channels['protein']='<special>'
+    for rate in (3,7,9):
+        F=pyslic.computefeatures(img,['har%s' % rate],preprocessing=False)
+        expected = ndimage.convolve(numpy.array(img.channeldata['protein'],numpy.uint16), numpy.ones((rate,rate)))[::rate,::rate]
+        expected = numpy.array((expected-expected.min()).astype(float) * 32/expected.ptp(), numpy.uint8)
+        assert numpy.allclose(F, haralickfeatures(expected).mean(0))
@@ -0,0 +1,28 @@
+import numpy as np
+from pyslic.features.imgmoments import MomentSet, imgcentmoments, imgmonents
+
+def _central(img, x, y, cofy, cofx):
+    Y,X = np.mgrid[:img.shape[0],:img.shape[1]]
+    return (img * (X-cofx)**x * (Y-cofy)**y).sum()
+
+def test_momentset():
+    r = np.random.RandomState(3)
+    img = r.randint(0, 255, size=(37,29)).astype(np.uint8)
+    moments = MomentSet(img, 3)
+    Y,X = np.mgrid[:37,:29]
+    cofy = (Y*img).sum()/float(img.sum())
+    cofx = (X*img).sum()/float(img.sum())
+    assert moments.m00 == img.sum()
+    assert np.allclose(moments.centroid, (cofy, cofx))
+    for x in xrange(4):
+        for y in xrange(4):
+            assert np.allclose(moments.central(x,y), _central(img, x, y, cofy, cofx), atol=1e-6)
+            assert np.allclose(moments.raw(x,y), _central(img, x, y, 0, 0))
+    assert np.allclose(moments.normalized(2,0), moments.central(2,0)/moments.m00**2)
+
+def test_imgcentmoments():
+    r = np.random.RandomState(4)
+    img = r.rand(20,24)
+    assert np.allclose(imgcentmoments(img, 1, 2, 3., 4.), _central(img, 1, 2, 3., 4.))
+    assert np.allclose(imgmonents(img, 2, 1), _central(img, 2, 1, 0, 0))
+    assert np.allclose(imgcentmoments(img, 1, 0), 0)
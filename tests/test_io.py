@@ -1,5 +1,184 @@
 import pyslic
+import numpy as np
+import struct
+import tempfile
+import os
+import sys
+import zipfile
+from StringIO import StringIO
+from pyslic.image.io.ic100 import read_ic100_BMP, read_ic100_BMP_mmap, read_ic100_BMPs, read_ic100_well
+from pyslic.image.io.read_cellomics_dib import read_cellomics_dib, read_cellomics_dib_mmap, read_cellomics_dibs
+
 def tests_emptydir():
     assert not pyslic.image.io.detect_ksr_dir('tests/data/emptydir')
     assert not pyslic.image.io.detect_ic100dir('tests/data/emptydir')
 
+def _write_bmp16(fname, img):
+    h,w = img.shape
+    data = img[::-1].astype('<H').tostring()
+    output = file(fname, 'wb')
+    output.write('BM')
+    output.write(struct.pack('<IHHI', 54+len(data), 0, 0, 54))
+    output.write(struct.pack('<IiiHHIIiiII', 40, w, h, 1, 16, 0, len(data), 0, 0, 0, 0))
+    output.write(data)
+    output.close()
+
+def _write_dib16(fname, img):
+    h,w = img.shape
+    data = img[::-1].astype('<H').tostring()
+    output = file(fname, 'wb')
+    output.write(struct.pack('<IiiHHIIiiII', 40, w, h, 1, 16, 0, len(data), 0, 0, 0, 0))
+    output.write('\0' * 12)
+    output.write(data)
+    output.close()
+
+def test_ic100_bmp_mmap():
+    img = np.arange(12*12, dtype=np.uint16).reshape((12,12))
+    fd,fname = tempfile.mkstemp(suffix='.bmp')
+    os.close(fd)
+    try:
+        _write_bmp16(fname, img)
+        assert np.all(read_ic100_BMP(fname) == img)
+        mapped = read_ic100_BMP_mmap(fname)
+        assert isinstance(mapped, np.memmap)
+        assert not mapped.flags.writeable
+        assert np.all(mapped == img)
+    finally:
+        os.unlink(fname)
+
+def test_cellomics_dib_mmap():
+    img = np.arange(16*16, dtype=np.uint16).reshape((16,16))
+    fd,fname = tempfile.mkstemp(suffix='.dib')
+    os.close(fd)
+    try:
+        _write_dib16(fname, img)
+        assert np.all(read_cellomics_dib(fname) == img)
+        mapped = read_cellomics_dib_mmap(fname)
+        assert not mapped.flags.writeable
+        assert np.all(mapped == img)
+    finally:
+        os.unlink(fname)
+
+def test_npy_sidecars():
+    img = np.arange(64, dtype=np.uint8).reshape((8,8))
+    directory = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(directory, 'protein.npy')
+        np.save(fname, img)
+        image = pyslic.Image(protein=[fname, fname])
+        image.load()
+        assert image.channeldata['protein'].shape == (2,8,8)
+        image = pyslic.Image(protein=fname)
+        pyslic.image.io.use_npy_sidecars(image)
+        assert image.channels['protein'] == fname + '.npy'
+        assert not image.get('protein').flags.writeable
+        assert np.all(image.get('protein') == img)
+    finally:
+        for f in os.listdir(directory):
+            os.unlink(os.path.join(directory, f))
+        os.rmdir(directory)
+
+def test_ic100_bmp_batch():
+    imgs = np.arange(3*10*14, dtype=np.uint16).reshape((3,10,14))
+    directory = tempfile.mkdtemp()
+    try:
+        well = os.path.join(directory, 'well__A___1')
+        for ch in xrange(3):
+            os.makedirs(os.path.join(well, 'channel_%s' % ch))
+            for i,img in enumerate(imgs):
+                _write_bmp16(os.path.join(well, 'channel_%s' % ch, 'image%s.bmp' % i), img + ch)
+        fnames = [os.path.join(well, 'channel_1', 'image%s.bmp' % i) for i in xrange(3)]
+        batch = read_ic100_BMPs(fnames)
+        assert batch.shape == imgs.shape
+        assert np.all(batch == imgs + 1)
+        for f,img in zip(fnames, batch):
+            assert np.all(read_ic100_BMP(f) == img)
+            assert np.all(read_ic100_BMP(file(f, 'rb')) == img)
+        channels = read_ic100_well(well)
+        assert np.all(channels['dna'] == imgs)
+        assert np.all(channels['autofluorescence'] == imgs + 2)
+    finally:
+        for root,dirs,files in os.walk(directory, topdown=False):
+            for f in files:
+                os.unlink(os.path.join(root, f))
+            for d in dirs:
+                os.rmdir(os.path.join(root, d))
+        os.rmdir(directory)
+
+def test_cellomics_dib_batch():
+    imgs = np.arange(2*16*16, dtype=np.uint16).reshape((2,16,16))
+    fnames = []
+    try:
+        for img in imgs:
+            fd,fname = tempfile.mkstemp(suffix='.dib')
+            os.close(fd)
+            fnames.append(fname)
+            _write_dib16(fname, img)
+        batch = read_cellomics_dibs(fnames)
+        assert np.all(batch == imgs)
+    finally:
+        for f in fnames:
+            os.unlink(f)
+
+def test_bmp_truncated():
+    fd,fname = tempfile.mkstemp(suffix='.bmp')
+    os.close(fd)
+    try:
+        _write_bmp16(fname, np.zeros((8,8), np.uint16))
+        data = file(fname, 'rb').read()
+        for size in (20, len(data)-1):
+            output = file(fname, 'wb')
+            output.write(data[:size])
+            output.close()
+            try:
+                read_ic100_BMP(fname)
+            except IOError:
+                pass
+            else:
+                assert False, 'IOError expected'
+    finally:
+        os.unlink(fname)
+
+def test_tjz_zip_pool():
+    readtjz = sys.modules['pyslic.image.io.readtjz']
+    directory = tempfile.mkdtemp()
+    fname = os.path.join(directory, '001002000.flex.tjz')
+    try:
+        Z = zipfile.ZipFile(fname, 'w')
+        for i in xrange(4):
+            Z.writestr('Stack-%05d' % i, 'slice %s' % i)
+        Z.close()
+        for i in xrange(4):
+            assert readtjz.getfileinsidezip(fname, 'Stack-%05d' % i) == 'slice %s' % i
+        assert len(readtjz.readtjz(fname)) == 2
+        pooled = readtjz._pool[os.path.abspath(fname)][0]
+        assert readtjz.getfileinsidezip(fname, 'Stack-00000') == 'slice 0'
+        assert readtjz._pool[os.path.abspath(fname)][0] is pooled
+        readtjz.close_zipfiles()
+        assert not readtjz._pool
+        assert readtjz.getfileinsidezip(fname, 'Stack-00003') == 'slice 3'
+        readtjz.close_zipfiles()
+    finally:
+        os.unlink(fname)
+        os.rmdir(directory)
+
+def test_read_from_stream_offset():
+    img = np.arange(8*8, dtype=np.uint16).reshape((8,8))
+    fd,fname = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        for write,read in [(_write_bmp16, read_ic100_BMP), (_write_dib16, read_cellomics_dib)]:
+            write(fname, img)
+            data = file(fname, 'rb').read()
+            stream = StringIO('prefix' + data)
+            stream.seek(len('prefix'))
+            assert np.all(read(stream) == img)
+            output = file(fname, 'wb')
+            output.write('prefix' + data)
+            output.close()
+            input = file(fname, 'rb')
+            input.seek(len('prefix'))
+            assert np.all(read(input) == img)
+            input.close()
+    finally:
+        os.unlink(fname)
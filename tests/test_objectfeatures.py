@@ -0,0 +1,108 @@
+import numpy as np
+from scipy import ndimage
+import mahotas
+import pyslic
+from pyslic.features.objectfeatures import objectfeatures, _euler_labels
+from pyslic.features.hullfeatures import hullfeatures
+from pyslic.features.imgskelfeats import find_branch_points
+from mahotas.polygon import fill_convexhull
+
+def _image(seed):
+    r = np.random.RandomState(seed)
+    binimg = r.rand(48,64) < .4
+    return (binimg * r.randint(1, 255, size=binimg.shape)).astype(np.uint8)
+
+def test_euler_labels():
+    for seed in xrange(4):
+        labeled,N = ndimage.label(_image(seed), np.ones((3,3)))
+        locations = ndimage.find_objects(labeled)
+        eulers = _euler_labels(labeled, locations)
+        assert len(eulers) == N
+        for i,slice in enumerate(locations):
+            assert eulers[i] == mahotas.euler(labeled[slice] == (i+1))
+
+def test_objectfeatures():
+    protein = _image(0)
+    img = pyslic.Image()
+    img.channeldata['procprotein'] = protein
+    img.loaded = True
+    feats = objectfeatures(img)
+    labeled,N = ndimage.label(protein, np.ones((3,3)))
+    assert feats.shape == (N,11)
+    assert np.all(feats[:,0] == ndimage.sum(np.ones_like(labeled), labeled, np.arange(1,N+1)))
+    assert np.all(feats[:,6] >= 1)
+
+def _objectfeatures(img):
+    # Previous implementation: every feature computed object by object
+    protimg = img.get('procprotein')
+    dnaimg = img.channeldata.get('procdna',None)
+    labeled,N = ndimage.label(protimg, np.ones((3,3)))
+    sofs = np.zeros((N,11))
+    indices = np.arange(1,N+1)
+    if dnaimg is not None:
+        centers = np.asarray(ndimage.center_of_mass(protimg, labeled, indices))
+        sofs[:,1] = np.sqrt(((centers - ndimage.center_of_mass(dnaimg))**2).sum(1))
+    sofs[:,9] = ndimage.sum(protimg, labeled, indices)
+    for obji,slice in enumerate(ndimage.find_objects(labeled, N)):
+        binobj = (labeled[slice] == (obji+1))
+        binskel = mahotas.thin(binobj)
+        hfeats = hullfeatures(binobj, fill_convexhull(binobj))
+        sofs[obji,0] = binobj.sum()
+        if dnaimg is not None:
+            sofs[obji,2] = (binobj & (dnaimg[slice] > 0)).sum()
+        sofs[obji,3] = hfeats[2]
+        sofs[obji,4] = mahotas.euler(binobj)
+        sofs[obji,5] = hfeats[1]
+        sofs[obji,6] = binskel.sum()
+        sofs[obji,7] = hfeats[0]
+        sofs[obji,9] /= (binskel*protimg[slice]).sum()
+        sofs[obji,10] = find_branch_points(binskel).sum()
+    sofs[:,2] /= sofs[:,0]
+    sofs[:,8] = sofs[:,6]/sofs[:,0]
+    sofs[:,10] /= sofs[:,6]
+    return sofs
+
+def test_objectfeatures_per_object():
+    for seed in xrange(6):
+        r = np.random.RandomState(seed)
+        h,w = r.randint(20, 90, size=2)
+        protein = r.rand(h,w)
+        if seed % 2:
+            protein = ndimage.gaussian_filter(protein, 1.5)
+        protein = (protein > np.percentile(protein, 100-r.randint(10, 60))) * r.randint(1, 255, size=(h,w))
+        img = pyslic.Image()
+        img.channeldata['procprotein'] = protein.astype(np.uint8)
+        if seed % 3:
+            img.channeldata['procdna'] = (r.rand(h,w) < .5) * r.randint(1, 255, size=(h,w)).astype(np.uint8)
+        img.loaded = True
+        feats = objectfeatures(img)
+        expected = _objectfeatures(img)
+        assert feats.shape == expected.shape
+        assert np.allclose(feats, expected, equal_nan=True)
+
+def test_objectfeatures_holes():
+    protein = np.zeros((40,60), np.uint8)
+    protein[2:12,2:12] = 100
+    protein[5:7,5:7] = 0
+    protein[8:10,4:6] = 0
+    protein[15:30,20:40] = 50
+    protein[18:22,24:28] = 0
+    protein[25,30] = 0
+    protein[32:38,45:58] = 70
+    protein[34,47:56] = 0
+    protein[3,40] = 10
+    img = pyslic.Image()
+    img.channeldata['procprotein'] = protein
+    img.loaded = True
+    feats = objectfeatures(img)
+    labeled,N = ndimage.label(protein, np.ones((3,3)))
+    # Previous implementation: mahotas.euler on each object
+    eulers = [mahotas.euler(labeled[slice] == (i+1)) for i,slice in enumerate(ndimage.find_objects(labeled))]
+    assert np.all(feats[:,4] == eulers)
+    assert sorted(eulers) == [-1.75,-1.75,-.75,.25]
+
+def test_objectfeatures_empty():
+    img = pyslic.Image()
+    img.channeldata['procprotein'] = np.zeros((8,8), np.uint8)
+    img.loaded = True
+    assert objectfeatures(img).shape == (0,11)
@@ -0,0 +1,38 @@
+import numpy as np
+import pyslic
+from pyslic.image import prefetch
+
+def _load(fname):
+    return np.zeros((8,8)) + int(fname)
+
+def _images(n):
+    imgs = []
+    for i in xrange(n):
+        img = pyslic.Image(protein=str(i))
+        img.set_load_function(_load)
+        imgs.append(img)
+    return imgs
+
+def test_prefetch():
+    imgs = _images(7)
+    for depth in (0, 1, 3, 10):
+        seen = []
+        for img in prefetch(imgs, depth):
+            assert img.loaded
+            seen.append(img.channeldata['protein'][0,0])
+        assert seen == range(7)
+        assert not any(img.loaded for img in imgs)
+
+def test_prefetch_keeps_loaded():
+    imgs = _images(3)
+    imgs[1].load()
+    for img in prefetch(imgs, 2):
+        pass
+    assert imgs[1].loaded
+    assert not imgs[0].loaded
+
+def test_prefetch_break():
+    imgs = _images(6)
+    for img in prefetch(imgs, 2):
+        break
+    assert not any(img.loaded for img in imgs[1:])
@@ -17,3 +17,21 @@ def test_plsidbin():
     assert slf == s2
     assert names == n2
     os.unlink('test.bin')
+
+def test_plsidbin_matrix():
+    f = np.arange(5*7, dtype=np.float32).reshape((5,7)) / 3.
+    names = ['feat_%i' % i for i in xrange(7)]
+    pyslic.features.pslidbinformat.writepslidbin('test.bin',f,names,names,names,['image'],['mask'],2,[1,2])
+    try:
+        f2, r2, s2, n2, i2, m2 = pyslic.features.pslidbinformat.readpslidbin('test.bin')
+        assert f2.shape == (5,7)
+        assert np.all(f == f2)
+        assert n2 == names
+        assert i2 == ['image']
+        assert m2 == ['mask']
+        f3, _, _, n3, _, _ = pyslic.features.pslidbinformat.readpslidbin('test.bin', mmap=True)
+        assert np.all(f3 == f)
+        assert n3 == names
+        del f3
+    finally:
+        os.unlink('test.bin')
@@ -0,0 +1,68 @@
+import numpy as np
+import pyslic
+from pyslic.preprocess import precomputestats
+
+def _image():
+    r = np.random.RandomState(3)
+    H,W = 120,180
+    protein = r.randint(0, 10, size=(H,W)).astype(np.uint8)
+    dna = r.randint(0, 10, size=(H,W)).astype(np.uint8)
+    for k in xrange(20):
+        y,x = r.randint(8,H-8), r.randint(8,W-8)
+        protein[y-4:y+4,x-5:x+5] += r.randint(40,150)
+        dna[y-2:y+2,x-2:x+2] += r.randint(40,150)
+    regions = np.zeros((H,W), np.int32)
+    regions[:,:60] = 1
+    regions[:,60:120] = 2
+    regions[:,120:] = 3
+    regions[80:,40:80] = 3
+    img = pyslic.Image()
+    img.channeldata['protein'] = protein
+    img.channeldata['dna'] = dna
+    img.regions = regions
+    img.loaded = True
+    return img
+
+def test_regions():
+    img = _image()
+    protein = img.channeldata['protein'].copy()
+    dna = img.channeldata['dna'].copy()
+    features = pyslic.computefeatures(img, 'SLF34')
+    assert features.shape == (3, 173)
+    assert np.all(img.channeldata['protein'] == protein)
+    assert np.all(img.channeldata['dna'] == dna)
+    img = _image()
+    precomputestats(img)
+    for r in xrange(3):
+        single = pyslic.computefeatures(img, 'SLF34', region=(r+1))
+        assert np.all((single == features[r]) | (np.isnan(single) & np.isnan(features[r])))
+
+def test_regions_baseline():
+    # Values computed by the previous version (which called computefeatures
+    # recursively on each region), with each region relabeled as region 1,
+    # so that it was not affected by the preprocessing of the other regions.
+    # The raw protein/DNA correlation (overlap feature 7, column 170) was
+    # changed on purpose and is not included.
+    columns = range(0,170,12)
+    expected = np.array([
+        [0.8721906179154927, 0.33640518559295024, -0.603916260652935, 0.4691534839327466, 0.02549472274241273, 1.0387380083350397, 0.9327850931864778, 33.417796822099106, 0.19696969696969696, 0.1903276594480587, 0.004901960784313725, 0.00014092446448703494, 0.0, 0.019230769230769232, 0.4371817042133115],
+        [0.5961281547484207, 0.5964846385400024, -0.546410475787533, 1.3133302560199804, 0.017278124597264084, 3.109531623058943, 2.7939813485501275, 97.99406003129167, 0.153028692879915, 0.05417722044595773, 0.017521902377972465, 0.0, 0.006379585326953748, 0.0, 0.3625474681558618],
+        [0.7207226403462905, 0.5480542567773721, -0.5885367489805584, 0.8235631711723834, 0.02181681669822797, 2.014374569380762, 1.9768190339482568, 69.21691846355152, 0.17226277372262774, 0.02523186699092043, 0.008830869648684968, 0.0004963087040138967, 0.0019230769230769232, 0.007342143906020558, 0.3950419543969433],
+        ])
+    features = pyslic.computefeatures(_image(), 'SLF34')
+    assert np.allclose(features[:,columns], expected, rtol=1e-10, atol=0)
+
+def test_regions_threads():
+    serial = pyslic.computefeatures(_image(), 'SLF34')
+    threaded = pyslic.computefeatures(_image(), 'SLF34', threads=3)
+    assert np.all((serial == threaded) | (np.isnan(serial) & np.isnan(threaded)))
+
+def test_regions_batched_haralick():
+    features = pyslic.computefeatures(_image(), 'SLF34')
+    batched = pyslic.computefeatures(_image(), 'SLF34', **{'haralick.regions':True})
+    # SLF34 starts with har, har1,...,har6 (13 features each)
+    har = np.zeros(features.shape[1], bool)
+    har[:7*13] = True
+    same = (features == batched) | (np.isnan(features) & np.isnan(batched))
+    assert np.all(same[:,~har])
+    assert np.allclose(features[:,har], batched[:,har])
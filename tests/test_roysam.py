@@ -0,0 +1,124 @@
+import numpy as np
+from scipy import ndimage
+import mahotas
+from pyslic.segmentation import roysam
+
+def _dna(r, h, w, n):
+    f = np.zeros((h,w))
+    Y,X = np.mgrid[:h,:w]
+    for i in xrange(n):
+        y,x = r.randint(12, h-12), r.randint(12, w-12)
+        a,b = r.randint(5, 10, size=2)
+        f += ((Y-y)**2/float(a*a) + (X-x)**2/float(b*b) < 1)
+    f = np.clip(f, 0, 1)*150 + ndimage.gaussian_filter(r.rand(h,w), 1.5)*480*(f > 0) + r.rand(h,w)*10
+    return np.clip(f, 0, 255).astype(np.uint8)
+
+def _greedy(M, beta=1.2):
+    # Straightforward version: recompute every value on whole-image masks
+    W = M.W.copy()
+    B = M.B.copy()
+    border_id = dict(M.border_id)
+    def logS(img):
+        F = roysam._compute_features(img)
+        return -.5*np.sqrt(np.dot(np.dot(F-M.mu, M.iSigma), F-M.mu))
+    def Rw(c0, c1):
+        logR = np.log(2) + logS((W == c0)|(W == c1)) - logS(W == c0) - logS(W == c1)
+        rs = np.exp(np.clip(logR, -100, 100))
+        b = border_id[c0,c1]
+        if np.all(B != b):
+            return rs * .01
+        return rs * (M.C[W == c0].mean() + M.C[W == c1].mean())/2./M.C[B == b].mean()
+    while border_id:
+        val,(c0,c1) = max((Rw(c0,c1),(c0,c1)) for c0,c1 in border_id)
+        if val < beta:
+            break
+        W[W == c1] = c0
+        B[B == border_id.pop((c0,c1))] = 0
+        for (r0,r1),b in border_id.items():
+            if c1 in (r0,r1):
+                del border_id[r0,r1]
+                r = (r0 if r1 == c1 else r1)
+                key = (min(r,c0),max(r,c0))
+                if key in border_id:
+                    B[B == b] = border_id[key]
+                else:
+                    border_id[key] = b
+    W[W == W.max()] = 0
+    return W, B, border_id
+
+def _border(W, Bc):
+    # Straightforward version: dilate each object
+    bg = W.max()
+    B = np.zeros_like(W)
+    neighbours = {}
+    border_id = {}
+    for obji in xrange(1, bg):
+        B_obji = mahotas.dilate(W == obji, Bc) & (W != obji)
+        for neighbour in np.unique(W[B_obji]):
+            if neighbour == 0 or neighbour == bg: continue
+            a1,a2 = min(obji,neighbour),max(obji,neighbour)
+            if (a1,a2) not in border_id:
+                border_id[a1,a2] = len(border_id)+1
+            B[B_obji & (W == neighbour)] = border_id[a1,a2]
+            neighbours.setdefault(a1, set()).add(a2)
+            neighbours.setdefault(a2, set()).add(a1)
+    return B, neighbours, border_id
+
+def test_border():
+    r = np.random.RandomState(5)
+    Bcs = [None, np.ones((3,3), bool), np.array([[1,1,0],[0,1,0],[0,0,1]], bool)]
+    for i in xrange(12):
+        W = r.randint(0, 2+i, size=(8+i, 12))
+        if i % 2:
+            W = ndimage.zoom(W, 3, order=0)
+        for Bc in Bcs:
+            B,neighbours,border_id = roysam.border(W, Bc)
+            B_,neighbours_,border_id_ = _border(W, Bc)
+            assert np.all(B == B_)
+            assert neighbours == neighbours_
+            assert border_id == border_id_
+    # More labels than fit in the low byte of a uint16 (pair) code
+    W = (r.permutation(300)+1).reshape(15,20).astype(np.uint16)
+    B,neighbours,border_id = roysam.border(W)
+    B_,neighbours_,border_id_ = _border(W, None)
+    assert B.dtype == np.uint16
+    assert np.all(B == B_)
+    assert neighbours == neighbours_
+    assert border_id == border_id_
+
+def test_group_pixels():
+    labeled = np.array([[2,0,2],[1,2,0]])
+    pixels = roysam._group_pixels(labeled)
+    assert sorted(pixels.keys()) == [0,1,2]
+    for c,p in pixels.iteritems():
+        assert np.all(p == np.flatnonzero(labeled == c))
+
+def test_greedy():
+    r = np.random.RandomState(2)
+    train = [ndimage.label(ndimage.gaussian_filter(_dna(r, 80, 80, 4).astype(float), 1) > 60)[0] for i in xrange(3)]
+    mu,iSigma = roysam.train_classifier(train)
+    dna = _dna(r, 120, 120, 60)
+    for scale in (1e-4, 1e-6):
+        W,B,border_id = _greedy(roysam.Merger(dna, mu, iSigma*scale))
+        M = roysam.Merger(dna, mu, iSigma*scale)
+        assert np.all(M.greedy() == W)
+        assert np.all(M.B == B)
+        assert M.border_id == border_id
+
+def test_compute_features_polygon():
+    Y,X = np.mgrid[:80,:80]
+    for a,b,angle in [(20,10,0), (15,15,0), (25,8,.5), (12,6,-.7)]:
+        y = (Y-40)*np.cos(angle) + (X-40)*np.sin(angle)
+        x = (X-40)*np.cos(angle) - (Y-40)*np.sin(angle)
+        mask = (y**2/a**2 + x**2/b**2 < 1)
+        raster = roysam._compute_features(mask)
+        polygon = roysam._compute_features(mask, 'polygon')
+        # (the eccentricity of a near circle is very sensitive)
+        others = [0,1,3,4,5,6]
+        assert np.allclose(raster[others], polygon[others], rtol=.06)
+        assert abs(raster[2] - polygon[2]) < .15
+    r = np.random.RandomState(2)
+    train = [ndimage.label(ndimage.gaussian_filter(_dna(r, 80, 80, 4).astype(float), 1) > 60)[0] for i in xrange(3)]
+    classifier = roysam.train_classifier(train, hull_method='polygon')
+    labeled = roysam.greedy_roysam_merge(_dna(r, 120, 120, 60), classifier, hull_method='polygon')
+    assert labeled.shape == (120,120)
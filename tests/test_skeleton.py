@@ -0,0 +1,29 @@
+import numpy as np
+from scipy import ndimage
+from mahotas import thin
+from pyslic.features.imgskelfeats import imgskelfeatures, object_skeletons, _objskelfeats
+
+def _image(seed):
+    r = np.random.RandomState(seed)
+    binimg = r.rand(48,64) < .6
+    return (binimg * r.randint(1, 255, size=binimg.shape)).astype(np.uint8)
+
+def test_object_skeletons():
+    for seed in xrange(4):
+        labeled,_ = ndimage.label(_image(seed))
+        objects = ndimage.find_objects(labeled)
+        skeleton = object_skeletons(labeled, objects)
+        for i,slice in enumerate(objects):
+            objmask = (labeled[slice] == (i+1))
+            assert np.all((skeleton[slice] & objmask) == thin(objmask))
+
+def test_imgskelfeatures():
+    for seed in xrange(4):
+        protproc = _image(seed)
+        labeled,_ = ndimage.label(protproc)
+        expected = []
+        for i,slice in enumerate(ndimage.find_objects(labeled)):
+            expected.append(_objskelfeats(protproc[slice] * (labeled[slice] == (i+1))))
+        expected = np.array(expected).mean(0)
+        assert np.allclose(imgskelfeatures(protproc), expected)
+    assert np.all(imgskelfeatures(np.zeros((8,8), np.uint8)) == 0)
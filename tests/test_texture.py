@@ -0,0 +1,52 @@
+import numpy as np
+from scipy import ndimage
+from mahotas.texture import haralick
+from pyslic.features.texture import haralick_regions, cooccurrence_regions, haralick_crops
+
+def test_cooccurrence_regions():
+    f = np.array([
+            [1,2,0,3],
+            [1,2,0,3],
+            [0,0,0,3]], np.uint8)
+    labeled = np.array([
+            [1,1,0,2],
+            [1,1,0,2],
+            [0,0,0,2]])
+    cmats = cooccurrence_regions(f, labeled)
+    assert cmats.shape == (2,4,4,4)
+    # horizontal pairs in region 1: (1,2) twice, symmetric
+    assert cmats[0,0,1,2] == 2
+    assert cmats[0,0,2,1] == 2
+    assert cmats[0,0].sum() == 4
+    # vertical pairs in region 2: (3,3) twice
+    assert cmats[1,2,3,3] == 4
+    assert cmats[1,0].sum() == 0
+
+def test_haralick_regions():
+    r = np.random.RandomState(1)
+    f = r.randint(1, 16, size=(60,80))
+    labeled,n = ndimage.label(r.rand(60,80) > .3)
+    features = haralick_regions(f, labeled, ignore_zeros=True)
+    assert features.shape == (n,4,13)
+    checked = 0
+    for L in xrange(1,n+1):
+        try:
+            expected = haralick(f * (labeled == L), ignore_zeros=True)
+        except ValueError:
+            assert np.isnan(features[L-1]).any()
+            continue
+        assert np.allclose(features[L-1], expected)
+        checked += 1
+    assert checked > 0
+    assert np.allclose(haralick_regions(f, np.ones_like(f), return_mean=True)[0], haralick(f).mean(0))
+
+def test_haralick_crops():
+    r = np.random.RandomState(4)
+    crops = [r.randint(0, r.randint(2,33), size=r.randint(3,30,size=2)).astype(np.uint8) for i in xrange(30)]
+    features = haralick_crops(crops)
+    means = haralick_crops(crops, return_mean=True)
+    assert features.shape == (30,4,13)
+    for c,f,m in zip(crops, features, means):
+        assert np.allclose(f, haralick(c))
+        assert np.allclose(m, haralick(c).mean(0))
+    assert haralick_crops([]).shape == (0,4,13)
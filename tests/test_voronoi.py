@@ -0,0 +1,71 @@
+import numpy as np
+from pyslic.segmentation.voronoi import voronoi, gvoronoi
+
+def _voronoi(shape, centers, distance):
+    labels = np.zeros(shape, int)
+    for y in xrange(shape[0]):
+        for x in xrange(shape[1]):
+            dists = []
+            for cy,cx in centers:
+                if distance == 'euclidean':
+                    dists.append((y-cy)**2 + (x-cx)**2)
+                else:
+                    dists.append(abs(y-cy) + abs(x-cx))
+            labels[y,x] = np.argmin(dists) + 1
+    return labels
+
+def test_voronoi():
+    r = np.random.RandomState(7)
+    img = np.zeros((23,31), np.uint8)
+    for n in (3, 20):
+        # integer centres (with repeats) have many ties
+        centers = [(r.randint(23), r.randint(31)) for i in xrange(n)]
+        centers += centers[:2]
+        for distance in ('euclidean', 'manhatan'):
+            labels = voronoi(img, centers, distance)
+            assert labels.dtype == img.dtype
+            assert np.all(labels == _voronoi(img.shape, centers, distance))
+        centers = [(r.rand()*23, r.rand()*31) for i in xrange(n)]
+        assert np.all(voronoi(img, centers) == _voronoi(img.shape, centers, 'euclidean'))
+
+def test_gvoronoi():
+    labeled = np.zeros((20,30), int)
+    labeled[3,4] = 1
+    labeled[15,25] = 2
+    for distance in ('euclidean', 'cityblock', 'chessboard'):
+        segmented = gvoronoi(labeled, distance)
+        assert segmented[0,0] == 1
+        assert segmented[19,29] == 2
+        assert set(segmented.ravel()) == set([1,2])
+
+def _gvoronoi_labels(labeled, distance):
+    # All the labels which are nearest to each pixel (more than one on ties)
+    ys,xs = np.nonzero(labeled)
+    nearest = {}
+    for y in xrange(labeled.shape[0]):
+        for x in xrange(labeled.shape[1]):
+            if distance == 'chessboard':
+                dists = np.maximum(abs(ys-y), abs(xs-x))
+            else:
+                dists = abs(ys-y) + abs(xs-x)
+            nearest[y,x] = set(labeled[ys,xs][dists == dists.min()])
+    return nearest
+
+def test_gvoronoi_brute_force():
+    r = np.random.RandomState(3)
+    for i in xrange(6):
+        labeled = np.zeros((13,17), int)
+        for label in xrange(1, 5+i):
+            y,x = r.randint(13), r.randint(17)
+            labeled[y:y+r.randint(1,3),x:x+r.randint(1,3)] = label
+        # symmetric seeds tie on a whole line
+        labeled[0,0] = 1
+        labeled[0,16] = 2
+        for distance in ('cityblock', 'chessboard'):
+            segmented = gvoronoi(labeled, distance)
+            nearest = _gvoronoi_labels(labeled, distance)
+            ties = 0
+            for (y,x),labels in nearest.iteritems():
+                assert segmented[y,x] in labels
+                ties += (len(labels) > 1)
+            assert ties > 0
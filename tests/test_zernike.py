@@ -0,0 +1,25 @@
+import numpy as np
+from mahotas.features.zernike import zernike_moments
+from pyslic.features.zernike import zernike, zernike_batch, znames
+
+def _image(seed, shape=(50,60)):
+    r = np.random.RandomState(seed)
+    return (r.rand(*shape) * (r.rand(*shape) < .5) * 255).astype(np.uint8)
+
+def test_zernike():
+    for seed in xrange(3):
+        img = _image(seed)
+        zvalues = zernike(img, 12, 34.5, 1.)
+        assert len(zvalues) == len(znames(12, 34.5))
+        assert np.allclose(zvalues, zernike_moments(img, 34.5, 12))
+        assert np.allclose(zernike(img, 8, 20., 2.), zernike_moments(img, 10., 8))
+
+def test_zernike_batch():
+    imgs = [_image(seed, (20+seed,30)) for seed in xrange(4)]
+    zvalues = zernike_batch(imgs, 12, 34.5, 1.)
+    assert zvalues.shape == (4, 49)
+    for img,z in zip(imgs, zvalues):
+        assert np.all(z == zernike(img, 12, 34.5, 1.))
+
+def test_zernike_empty():
+    assert np.all(zernike(np.zeros((8,8), np.uint8), 12, 34.5, 1.) == 0)